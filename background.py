@@ -0,0 +1,55 @@
+"""
+Event loop work the servers share between callers.
+
+BackgroundTask is a poller or refresher that runs for as long as its event
+loop does, started by whichever request needs it first. Inflight is work
+that concurrent callers would otherwise each repeat (a feed fetch, a cached
+tool answer): the first caller starts it and everyone else awaits the same
+future until it's done.
+"""
+import asyncio
+
+
+class BackgroundTask:
+    "one long running coroutine per event loop, started on first use"
+
+    def __init__(self, run):
+        self.run = run  # coroutine function, called with no arguments
+        self.task = None
+
+    def ensure(self):
+        "start it on the running event loop if it isn't running there yet, a no-op outside a loop"
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # not inside the event loop (worker thread or plain script)
+        if self.task is not None and not self.task.done() and self.task.get_loop() is loop:
+            return
+        self.task = loop.create_task(self.run())
+
+
+class Inflight:
+    "one future per key for the work in progress, dropped as soon as it finishes"
+
+    def __init__(self):
+        self.futures = {}
+
+    def running(self, key=None):
+        return self.futures.get(key)
+
+    def start(self, compute, key=None):
+        "the future of the work for `key`, starting compute() unless it's already running"
+        future = self.futures.get(key)
+        if future is None:
+            future = self.futures[key] = asyncio.ensure_future(self._run(key, compute))
+        return future
+
+    async def join(self, compute, key=None):
+        # shield so one cancelled caller doesn't abort the work for everyone else
+        return await asyncio.shield(self.start(compute, key))
+
+    async def _run(self, key, compute):
+        try:
+            return await compute()
+        finally:
+            del self.futures[key]
@@ -0,0 +1,85 @@
+"""
+Scaling benchmark for the ferry_data.json builder.
+
+Generates synthetic GTFS tables shaped like the NYC Ferry feed (routes sharing
+a few hub piers, two directions, weekday and weekend service) at several
+multiples of its size and times build_ferry_data on each. Linear scaling shows
+up as a flat time per stop_times row.
+
+run from the repo root: python -m benchmarks.ferry_build
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from download_ferry_data import build_ferry_data
+
+# roughly the size of the real NYC Ferry feed
+BASE_ROUTES = 7
+STOPS_PER_ROUTE = 8
+TRIPS_PER_DIRECTION = 33
+HUBS = 3
+SCALES = [1, 2, 4, 8, 16]
+
+
+def synthetic_gtfs(scale, seed=0):
+    rng = np.random.default_rng(seed)
+    n_routes = BASE_ROUTES * scale
+    n_stops = HUBS + n_routes * (STOPS_PER_ROUTE - 1)
+
+    stops = pd.DataFrame({
+        'stop_id': np.arange(1, n_stops + 1),
+        'stop_name': [f"Pier {i}" for i in range(1, n_stops + 1)],
+        'stop_lat': rng.uniform(40.55, 40.85, n_stops),
+        'stop_lon': rng.uniform(-74.10, -73.80, n_stops),
+    })
+    routes = pd.DataFrame({
+        'route_id': [f"R{i}" for i in range(n_routes)],
+        'route_long_name': [f"Route {i}" for i in range(n_routes)],
+    })
+    calendar = pd.DataFrame({
+        'service_id': ['WKD', 'WKE'],
+        'monday': [1, 0],
+    })
+
+    trips, stop_times = [], []
+    next_stop = HUBS + 1
+    for r in range(n_routes):
+        # every route starts at a hub pier and then serves its own stops
+        route_stops = [r % HUBS + 1] + list(range(next_stop, next_stop + STOPS_PER_ROUTE - 1))
+        next_stop += STOPS_PER_ROUTE - 1
+        for service_id in ('WKD', 'WKE'):
+            for direction, pattern in enumerate((route_stops, route_stops[::-1])):
+                for n in range(TRIPS_PER_DIRECTION):
+                    trip_id = f"{r}-{service_id}-{direction}-{n}"
+                    trips.append((trip_id, f"R{r}", service_id))
+                    start = 6 * 3600 + n * 1800 + direction * 600
+                    for seq, stop_id in enumerate(pattern, start=1):
+                        t = start + seq * 420
+                        stop_times.append((trip_id, stop_id, seq, f"{t // 3600:02d}:{t % 3600 // 60:02d}:00"))
+
+    trips = pd.DataFrame(trips, columns=['trip_id', 'route_id', 'service_id'])
+    stop_times = pd.DataFrame(stop_times, columns=['trip_id', 'stop_id', 'stop_sequence', 'departure_time'])
+    # real feeds aren't sorted by trip
+    stop_times = stop_times.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+    return {'stops': stops, 'routes': routes, 'trips': trips, 'stop_times': stop_times, 'calendar': calendar}
+
+
+def main():
+    print(f"{'scale':>5} {'stops':>7} {'stop_times':>11} {'build ms':>10} {'us/row':>8}")
+    for scale in SCALES:
+        gtfs_data = synthetic_gtfs(scale)
+        rows = len(gtfs_data['stop_times'])
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            build_ferry_data(gtfs_data)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        print(f"{scale:>5} {len(gtfs_data['stops']):>7} {rows:>11} {best * 1000:>10.1f} {best / rows * 1e6:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Allocation benchmark for the ferry GTFS-realtime view layer.
+
+Compares the old approach (build the dict tree for every entity, then look at
+one stop / route) with the lazy views in gtfs_rt_views.py on the same feed.
+Memory is what tracemalloc sees, i.e. Python-level allocations; the protobuf
+parse itself happens in the C extension and costs the same in both.
+
+run from the repo root:
+    python -m benchmarks.ferry_rt_views                       # synthetic feed
+    python -m benchmarks.ferry_rt_views tripupdate.pb alert.pb  # recorded feeds
+
+Recorded feeds are the raw bodies of the gtfsrealtime.aspx/tripupdate and
+/alert endpoints, e.g. saved with curl -o.
+"""
+import sys
+import timeit
+import tracemalloc
+
+from gtfs_realtime import gtfs_realtime_pb2
+from gtfs_rt_views import FeedView
+
+# about what the NYC Ferry feeds carry mid-day
+TRIPS = 60
+STOPS_PER_TRIP = 8
+ALERTS = 12
+LANGUAGES = ["en", "es", "zh"]
+
+
+def synthetic_trip_updates():
+    message = gtfs_realtime_pb2().FeedMessage()
+    message.header.gtfs_realtime_version = "2.0"
+    message.header.timestamp = 1760000000
+    for i in range(TRIPS):
+        entity = message.entity.add()
+        entity.id = f"trip-{i}"
+        trip_update = entity.trip_update
+        trip_update.trip.trip_id = f"{i}"
+        trip_update.trip.route_id = f"R{i % 6}"
+        trip_update.trip.start_date = "20251018"
+        trip_update.vehicle.id = f"V{i % 20}"
+        trip_update.timestamp = 1760000000
+        for n in range(STOPS_PER_TRIP):
+            update = trip_update.stop_time_update.add()
+            update.stop_id = str(80 + (i % 6) * 4 + n)
+            update.stop_sequence = n + 1
+            update.arrival.time = 1760000000 + i * 300 + n * 420
+            update.arrival.delay = 60 * (n % 3)
+            update.departure.time = update.arrival.time + 30
+    return message.SerializeToString()
+
+
+def synthetic_alerts():
+    message = gtfs_realtime_pb2().FeedMessage()
+    message.header.gtfs_realtime_version = "2.0"
+    message.header.timestamp = 1760000000
+    for i in range(ALERTS):
+        entity = message.entity.add()
+        entity.id = f"alert-{i}"
+        alert = entity.alert
+        alert.cause = 1
+        alert.effect = 3
+        for language in LANGUAGES:
+            header = alert.header_text.translation.add()
+            header.text, header.language = f"Delays on route R{i % 6} ({language})", language
+            description = alert.description_text.translation.add()
+            description.text, description.language = "Service is running with delays. " * 8, language
+        for n in range(4):
+            informed = alert.informed_entity.add()
+            informed.route_id = f"R{i % 6}"
+            informed.stop_id = str(80 + n)
+    return message.SerializeToString()
+
+
+def departures_eager(content, stop_id):
+    # what get_ferry_departures did before: every trip as a dict, then scan
+    trips = [trip.to_dict() for trip in FeedView(content).trip_updates()]
+    return [(trip, update) for trip in trips for update in trip["stop_time_updates"] if update["stop_id"] == stop_id]
+
+
+def departures_lazy(content, stop_id):
+    return [trip.to_dict(stop_id) for trip in FeedView(content).trip_updates(stop_id=stop_id)]
+
+
+def alerts_eager(content, route_id):
+    alerts = [alert.to_dict() for alert in FeedView(content).alerts()]
+    return [alert for alert in alerts if route_id in alert["affected_routes"]]
+
+
+def alerts_lazy(content, route_id):
+    return [alert.to_dict() for alert in FeedView(content).alerts(route_id)]
+
+
+def measure(fn, *args):
+    "(peak KiB, retained KiB of the result, microseconds per call)"
+    fn(*args)  # warm up descriptor pools and caches
+    tracemalloc.start()
+    result = fn(*args)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    number = 200
+    us = min(timeit.repeat(lambda: fn(*args), number=number, repeat=5)) / number * 1e6
+    return peak / 1024, retained / 1024, us
+
+
+def report(label, cases):
+    print(f"\n{label}")
+    baseline = None
+    for name, (fn, args) in cases.items():
+        peak, retained, us = measure(fn, *args)
+        baseline = baseline or (peak, us)
+        print(f"  {name:<22} peak {peak:>8.1f} KiB  result {retained:>7.1f} KiB  {us:>8.1f} us"
+              f"  ({baseline[0] / peak:.1f}x less memory, {baseline[1] / us:.1f}x faster)")
+
+
+def main():
+    if len(sys.argv) == 3:
+        with open(sys.argv[1], 'rb') as f:
+            trip_updates = f.read()
+        with open(sys.argv[2], 'rb') as f:
+            alerts = f.read()
+    else:
+        trip_updates, alerts = synthetic_trip_updates(), synthetic_alerts()
+
+    view = FeedView(trip_updates)
+    stop_counts = {}
+    for trip in view.trip_updates():
+        for update in trip.stop_updates():
+            stop_counts[update.stop_id] = stop_counts.get(update.stop_id, 0) + 1
+    stop_id = max(stop_counts, key=stop_counts.get) if stop_counts else ""
+    routes = [alert.route_ids[0] for alert in FeedView(alerts).alerts() if alert.route_ids]
+    route_id = routes[0] if routes else ""
+
+    print(f"trip updates: {len(trip_updates)} bytes, alerts: {len(alerts)} bytes")
+    report(f"departures at stop {stop_id}", {
+        "eager dicts (old)": (departures_eager, (trip_updates, stop_id)),
+        "views, filtered": (departures_lazy, (trip_updates, stop_id)),
+    })
+    report(f"alerts for route {route_id}", {
+        "eager dicts (old)": (alerts_eager, (alerts, route_id)),
+        "views, filtered": (alerts_lazy, (alerts, route_id)),
+    })
+
+
+if __name__ == "__main__":
+    main()
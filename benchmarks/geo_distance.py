@@ -0,0 +1,59 @@
+"""
+Microbenchmark for the nearby-station distance computation.
+
+Compares the old row-wise `DataFrame.apply(haversine, axis=1)` approach used by
+mta.find_nearest_stations against the vectorized kernels in geo.py, on the MTA
+station table and on a Citi Bike sized synthetic set.
+
+run from the repo root: python -m benchmarks.geo_distance
+"""
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from geo import equirectangular_many, haversine, haversine_many, points_within
+
+data_path = "data/MTA_Subway_Stations_and_Complexes_20250916.csv"
+QUERY = (40.7417, -73.9847)  # Madison Square Park
+RADIUS_KM = 0.5
+
+
+def per_call_us(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def bench(label, lats, lons, number):
+    df = pd.DataFrame({"Latitude": lats, "Longitude": lons})
+    lat, lon = QUERY
+
+    def row_apply():
+        df.apply(lambda row: haversine(lat, lon, row["Latitude"], row["Longitude"]), axis=1)
+
+    def scalar_loop():
+        [haversine(lat, lon, a, b) for a, b in zip(lats, lons)]
+
+    timings = {
+        "DataFrame.apply (old)": per_call_us(row_apply, max(number // 20, 1)),
+        "scalar haversine loop": per_call_us(scalar_loop, number),
+        "haversine_many": per_call_us(lambda: haversine_many(lat, lon, lats, lons), number),
+        "equirectangular_many": per_call_us(lambda: equirectangular_many(lat, lon, lats, lons), number),
+        "points_within": per_call_us(lambda: points_within(lat, lon, lats, lons, RADIUS_KM), number),
+    }
+
+    baseline = timings["DataFrame.apply (old)"]
+    print(f"\n{label} ({len(lats)} points)")
+    for name, us in timings.items():
+        print(f"  {name:<24} {us:>10.1f} us/call  {baseline / us:>8.1f}x")
+
+
+def main():
+    stations = pd.read_csv(data_path)
+    bench("MTA subway complexes", stations["Latitude"].to_numpy(), stations["Longitude"].to_numpy(), 2000)
+
+    rng = np.random.default_rng(0)
+    bench("Citi Bike sized set", rng.uniform(40.58, 40.88, 2200), rng.uniform(-74.05, -73.85, 2200), 1000)
+
+
+if __name__ == "__main__":
+    main()
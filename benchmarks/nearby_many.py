@@ -0,0 +1,52 @@
+"""
+Microbenchmark for the batch nearby tools' distance computation.
+
+Answers N query points against the subway complexes and a Citi Bike sized
+synthetic set, either one points_within / GridIndex.within call per point (what
+N separate tool calls do) or one points_within_many / GridIndex.within_many
+call for the whole batch.
+
+run from the repo root: python -m benchmarks.nearby_many
+"""
+import timeit
+
+import numpy as np
+
+from geo import GridIndex, points_within, points_within_many
+from subway_stations import load_stations
+
+RADIUS_KM = 0.5
+BATCH_SIZES = (1, 5, 20, 50)
+
+
+def per_call_us(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def bench(label, lats, lons, rng):
+    grid = GridIndex(lats, lons)
+    print(f"\n{label} ({len(lats)} points)")
+    for size in BATCH_SIZES:
+        query_lats, query_lons = rng.uniform(40.65, 40.80, size), rng.uniform(-74.02, -73.90, size)
+        queries = list(zip(query_lats.tolist(), query_lons.tolist()))
+        number = max(2000 // size, 10)
+        timings = {
+            "points_within loop": per_call_us(lambda: [points_within(a, b, lats, lons, RADIUS_KM) for a, b in queries], number),
+            "GridIndex.within loop": per_call_us(lambda: [grid.within(a, b, RADIUS_KM) for a, b in queries], number),
+            "points_within_many": per_call_us(lambda: points_within_many(query_lats, query_lons, lats, lons, RADIUS_KM), number),
+            "GridIndex.within_many": per_call_us(lambda: grid.within_many(query_lats.tolist(), query_lons.tolist(), RADIUS_KM), number),
+        }
+        baseline = timings["points_within loop"]
+        for name, us in timings.items():
+            print(f"  {size:>3} points  {name:<22} {us:>10.1f} us/batch  {baseline / us:>6.1f}x")
+
+
+def main():
+    rng = np.random.default_rng(0)
+    stations = load_stations()
+    bench("MTA subway complexes", np.array([s.lat for s in stations]), np.array([s.lon for s in stations]), rng)
+    bench("Citi Bike sized set", rng.uniform(40.58, 40.88, 2200), rng.uniform(-74.05, -73.85, 2200), rng)
+
+
+if __name__ == "__main__":
+    main()
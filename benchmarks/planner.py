@@ -0,0 +1,77 @@
+"""
+Latency benchmark for the multi-modal planner (target: p95 under 50 ms).
+
+Plans trips between random points near subway stations in different boroughs,
+with ferries on and a synthetic Citi Bike snapshot (docks scattered around the
+stations) so the bike first/last mile is exercised without network access.
+
+run from the repo root: python -m benchmarks.planner
+"""
+import time
+from datetime import datetime
+
+import numpy as np
+
+from planner import NETWORK, NYC_TZ, BikeLayer
+
+QUERIES = 300
+DOCKS = 2200
+
+
+def synthetic_bike_layer(rng):
+    anchors = rng.integers(0, NETWORK.subway_count, DOCKS)
+    stations, status = [], {}
+    for i, anchor in enumerate(anchors.tolist()):
+        station_id = f"dock-{i}"
+        stations.append({
+            'station_id': station_id,
+            'name': f"Dock {i}",
+            'lat': float(NETWORK.lats[anchor] + rng.normal(0, 0.004)),
+            'lon': float(NETWORK.lons[anchor] + rng.normal(0, 0.005)),
+        })
+        status[station_id] = {
+            'num_bikes_available': int(rng.integers(0, 15)),
+            'num_docks_available': int(rng.integers(0, 15)),
+        }
+    return BikeLayer(stations, status, NETWORK.lats, NETWORK.lons)
+
+
+def random_trip(rng, boroughs):
+    while True:
+        a, b = rng.integers(0, NETWORK.subway_count, 2).tolist()
+        if boroughs[a] != boroughs[b]:
+            jitter = rng.normal(0, 0.003, 4)
+            return (
+                (NETWORK.lats[a] + jitter[0], NETWORK.lons[a] + jitter[1]),
+                (NETWORK.lats[b] + jitter[2], NETWORK.lons[b] + jitter[3]),
+            )
+
+
+def main():
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    bikes = synthetic_bike_layer(rng)
+    print(f"bike layer built in {(time.perf_counter() - start) * 1000:.1f} ms for {DOCKS} docks")
+
+    from subway_stations import load_stations
+    boroughs = [station.borough for station in load_stations()]
+    when = datetime.now(NYC_TZ).replace(hour=8, minute=30)
+    trips = [random_trip(rng, boroughs) for _ in range(QUERIES)]
+
+    for label, layer in (("subway + ferry", None), ("subway + ferry + bike", bikes)):
+        timings, modes = [], {}
+        for origin, destination in trips:
+            start = time.perf_counter()
+            options = NETWORK.plan(origin, destination, when, layer)
+            timings.append((time.perf_counter() - start) * 1000)
+            for mode in (options[0]['modes'] if options else ['none']):
+                modes[mode] = modes.get(mode, 0) + 1
+        timings.sort()
+        p50, p95 = timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+        print(f"\n{label}: {QUERIES} cross-borough trips")
+        print(f"  p50 {p50:.1f} ms  p95 {p95:.1f} ms  max {timings[-1]:.1f} ms")
+        print(f"  modes used by the best option: {modes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Cold start of the servers one process each vs the combined server in main.py.
+
+Each case runs in a fresh interpreter that imports the server module(s) and
+registers the tools, then reports wall time and peak RSS. Nothing is fetched,
+so this is the fixed cost of a session before the first tool call.
+
+run from the repo root: python -m benchmarks.startup
+"""
+import json
+import subprocess
+import sys
+
+from main import SERVERS
+
+REPEAT = 3
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+{body}
+print(json.dumps({{
+    "ms": (time.perf_counter() - start) * 1000,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+}}))
+"""
+
+
+def probe(body):
+    "best of REPEAT fresh interpreters"
+    runs = []
+    for _ in range(REPEAT):
+        out = subprocess.run([sys.executable, "-W", "ignore", "-c", PROBE.format(body=body)],
+                             capture_output=True, text=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return min(runs, key=lambda run: run["ms"])
+
+
+def main():
+    separate = {}
+    for name in SERVERS:
+        separate[name] = probe(f"import {name}")
+        print(f"{name:<12} {separate[name]['ms']:>7.0f} ms  {separate[name]['rss_mb']:>6.1f} MB  {separate[name]['modules']} modules")
+    total_ms = sum(run["ms"] for run in separate.values())
+    total_mb = sum(run["rss_mb"] for run in separate.values())
+    print(f"{'separately':<12} {total_ms:>7.0f} ms  {total_mb:>6.1f} MB  ({len(SERVERS)} processes)")
+
+    combined = probe("import main; main.mount_servers()")
+    print(f"{'main.py':<12} {combined['ms']:>7.0f} ms  {combined['rss_mb']:>6.1f} MB  {combined['modules']} modules")
+    print(f"\none process: {total_mb / combined['rss_mb']:.1f}x less memory, {total_ms / combined['ms']:.1f}x less startup time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Cold start with the prebuilt data/stations.bin vs parsing the stations CSV with pandas.
+
+Each case runs in fresh interpreters (see benchmarks/startup.py), so the
+times include the imports: pandas for the CSV, only binary_tables for the
+prebuilt file. "import mta, CSV" points load_stations at a missing file so
+mta.py takes the CSV fallback, which is what every import paid before.
+
+build the file first (python -m subway_stations), then from the repo root:
+python -m benchmarks.station_load
+"""
+from benchmarks.startup import probe
+from subway_stations import STATIONS_PATH, load_stations, read_stations_csv
+
+FORCE_CSV = "import subway_stations; subway_stations.load_stations.__defaults__ = ('data/no-such-file.bin',)"
+
+# (what, from the CSV, from stations.bin)
+CASES = [
+    ("stations", "from subway_stations import read_stations_csv; read_stations_csv()",
+     "from subway_stations import load_stations; load_stations()"),
+    ("import mta", f"{FORCE_CSV}; import mta", "import mta"),
+]
+
+
+def check():
+    "the prebuilt file has to give back exactly the stations the CSV does"
+    from_csv, from_bin = read_stations_csv(), load_stations()
+    assert len(from_csv) == len(from_bin)
+    for a, b in zip(from_csv, from_bin):
+        assert all(getattr(a, name) == getattr(b, name) for name in a.__slots__), a.name
+    return len(from_bin)
+
+
+def main():
+    # probes first: a child's peak RSS starts from the parent's, and check() loads pandas
+    for what, csv_body, bin_body in CASES:
+        csv, binary = probe(csv_body), probe(bin_body)
+        for source, run in (("CSV", csv), ("bin", binary)):
+            print(f"{what + ', ' + source:<16} {run['ms']:>7.0f} ms  {run['rss_mb']:>6.1f} MB  {run['modules']} modules")
+        print(f"{'':<16} {csv['ms'] / binary['ms']:.1f}x faster, {csv['rss_mb'] - binary['rss_mb']:.0f} MB less\n")
+    print(f"{check()} stations, {STATIONS_PATH} matches the CSV")
+
+
+if __name__ == "__main__":
+    main()
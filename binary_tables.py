@@ -0,0 +1,81 @@
+"""
+Files of named typed arrays, used for the precomputed data the servers mmap at startup
+(ferry_timetable.py, footpaths.py).
+
+File layout, little-endian:
+    4 byte magic, u32 section count, then per section a 24 byte name, a one
+    letter `array` typecode, 7 pad bytes, u64 offset and u64 item count;
+    the section data follows, each one 8-byte aligned.
+Loading mmaps the file and casts memoryviews over the sections, so nothing
+is parsed or copied at startup.
+"""
+import array
+import mmap
+import struct
+import sys
+
+HEADER = struct.Struct("<4sI")
+SECTION = struct.Struct("<24sc7xQQ")
+
+
+def save_sections(path, magic, sections):
+    "sections: [(name, array.array)] written in that order"
+    offset = HEADER.size + SECTION.size * len(sections)
+    entries, chunks = [], []
+    for name, values in sections:
+        offset += -offset % 8
+        entries.append(SECTION.pack(name.encode(), values.typecode.encode(), offset, len(values)))
+        if sys.byteorder != 'little':
+            values = array.array(values.typecode, values)
+            values.byteswap()
+        chunks.append((offset, values.tobytes()))
+        offset += len(values) * values.itemsize
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(magic, len(sections)))
+        for entry in entries:
+            f.write(entry)
+        for chunk_offset, data in chunks:
+            f.write(b"\0" * (chunk_offset - f.tell()))
+            f.write(data)
+
+
+def load_sections(path, magic):
+    """
+    ({name: memoryview or array}, mmap) for a file written by save_sections.
+    Keep the mmap referenced for as long as the views are used.
+    Raises ValueError when the file doesn't start with `magic`.
+    """
+    with open(path, 'rb') as f:
+        source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(source)
+    found, count = HEADER.unpack_from(view)
+    if found != magic:
+        raise ValueError(f"{path} is not a {magic.decode(errors='replace')} file")
+
+    sections = {}
+    for n in range(count):
+        name, typecode, offset, length = SECTION.unpack_from(view, HEADER.size + n * SECTION.size)
+        name, typecode = name.rstrip(b"\0").decode(), typecode.decode()
+        itemsize = array.array(typecode).itemsize
+        data = view[offset:offset + length * itemsize]
+        if sys.byteorder != 'little':
+            data = array.array(typecode, data.tobytes())
+            data.byteswap()
+            sections[name] = data
+        else:
+            sections[name] = data.cast(typecode)
+    return sections, source
+
+
+def pack_strings(values):
+    "('B' array of utf-8 bytes, 'I' array of offsets) for a list of strings"
+    strings, offsets = array.array('B'), array.array('I', [0])
+    for value in values:
+        strings.frombytes(str(value).encode('utf-8'))
+        offsets.append(len(strings))
+    return strings, offsets
+
+
+def unpack_string(strings, offsets, index):
+    return bytes(strings[offsets[index]:offsets[index + 1]]).decode('utf-8')
@@ -1,8 +1,18 @@
 import asyncio
-import math 
+import os
+import time
+from datetime import datetime
 from typing import Any 
-import httpx
+from zoneinfo import ZoneInfo
+import numpy as np
+import http_client
 from mcp.server.fastmcp import FastMCP
+from background import BackgroundTask, Inflight
+from geo import WALK_MINS_PER_KM, GridIndex, haversine_many
+from query_cache import QueryCache, quantize
+from serving import read_points, serve
+from station_forecast import AvailabilityForecast
+from station_history import HISTORY_MINUTES, HISTORY_RESOLUTION, StatusHistory
 
 #initialize FastMCP server
 mcp = FastMCP("citibikes")
@@ -11,6 +21,21 @@ USER_AGENT = "citibikes-app/1.0"
 gbfs_lyft_base = f"https://gbfs.lyft.com/gbfs/2.3/bkn/en"
 gbfs_citi_base = f"https://gbfs.citibikenyc.com/gbfs/2.3/"
 
+# how long a snapshot may be served before refetching, in seconds.
+# station_information barely changes so it is held for hours regardless of
+# its advertised ttl, station_status follows the feed's ttl within a tight window
+STATION_INFO_MIN_TTL = 3 * 60 * 60
+STATION_INFO_MAX_TTL = 6 * 60 * 60
+STATION_STATUS_MIN_TTL = 5
+STATION_STATUS_MAX_TTL = 60
+CLOSEST_STATIONS_MAX_KM = 3.0  # past this "the closest station" isn't worth suggesting
+BIKE_MINS_PER_KM = 4.0      # ~15 km/h
+BIKE_DOCK_MINS = 2.0        # unlocking plus docking
+BIKE_DETOUR = 1.3           # street distance vs straight line
+# the history poller checks twice per history slot so it never skips one
+HISTORY_POLL_INTERVAL = float(os.environ.get("CITIBIKE_HISTORY_POLL_SECS", HISTORY_RESOLUTION / 2))
+NYC_TZ = ZoneInfo("America/New_York")
+
 
 async def make_gbfs_request(url: str ) -> dict[str, Any]: 
     "make a request to different gbfs servers"
@@ -20,39 +45,131 @@ async def make_gbfs_request(url: str ) -> dict[str, Any]:
     }
 
     try: 
-        async with httpx.AsyncClient() as client: 
-            response = await client.get(url, headers = headers, timeout=10.0)
-            response.raise_for_status()
-            return response.json()
-    except httpx.TimeoutException:
-        return {"error": "Request timed out"}
-    except httpx.HTTPError as e:
-        return {"error": f"HTTP error: {e.response.status_code}"}
+        return await http_client.get_json(url, headers=headers)
     except Exception as e:
-        return {"error": str(e)}
+        return http_client.error_result(e)
 
 def is_error(data): 
     return isinstance(data, dict) and "error" in data 
 
-def haversine(lat1, lon1, lat2, lon2):
+class GbfsFeedCache:
     """
-    Calculate the great circle distance between two points 
-    on the earth (specified in decimal degrees)
-    Returns distance in kilometers
+    In-process cache for the latest snapshot of a single GBFS feed.
+
+    A snapshot stays fresh until the feed's own `last_updated + ttl`, clamped
+    to [min_ttl, max_ttl]. Concurrent callers share one in-flight fetch, and if
+    a refetch fails the previous snapshot keeps being served.
+
+    After a failed fetch the feed isn't tried again for min_ttl seconds,
+    doubling with each failure in a row up to max_ttl, and the failure is
+    served meanwhile when there's no snapshot yet. Once the feed has been
+    failing, callers holding a stale snapshot get it straight away while the
+    next attempt runs in the background, instead of each waiting out the
+    upstream timeouts.
+    `build_index`, if given, runs once per new snapshot and its result is kept
+    in `self.index` so callers don't rebuild lookups on every request.
     """
-    # Convert decimal degrees to radians
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    
-    # Radius of earth in kilometers
-    r = 6371
-    
-    return c * r
+
+    def __init__(self, url, min_ttl, max_ttl, build_index=None):
+        self.url = url
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.build_index = build_index
+        self.data = None
+        self.index = None
+        self.version = 0  # bumped every time a new snapshot is stored
+        self.expires_at = 0.0  # also when to try again after a failure
+        self.failures = 0  # fetches failed in a row
+        self.error = None  # the last failure, served while backing off without a snapshot
+        self._inflight = Inflight()
+
+    def is_fresh(self):
+        return self.data is not None and time.monotonic() < self.expires_at
+
+    def lifetime(self, data):
+        "seconds a snapshot stays fresh based on its ttl/last_updated fields"
+        ttl = data.get("ttl") or 0
+        last_updated = data.get("last_updated")
+        remaining = ttl
+        if last_updated:
+            remaining = last_updated + ttl - time.time()
+        return min(max(remaining, self.min_ttl), self.max_ttl)
+
+    def backoff(self):
+        "seconds to wait after the latest failure"
+        return min(self.min_ttl * 2 ** (self.failures - 1), self.max_ttl)
+
+    async def get(self):
+        if self.is_fresh():
+            return self.data
+        if self.failures and time.monotonic() < self.expires_at:
+            return self.error
+
+        if self.failures and self.data is not None:
+            self._inflight.start(self._refresh)
+            return self.data
+        return await self._inflight.join(self._refresh)
+
+    async def _refresh(self):
+        data = await make_gbfs_request(self.url)
+        if is_error(data):
+            self.failures += 1
+            self.error = data
+            self.expires_at = time.monotonic() + self.backoff()
+            return self.data if self.data is not None else data
+        self.failures, self.error = 0, None
+
+        # a 304 hands back the snapshot we already hold, its index is still good
+        if data is not self.data:
+            index = self.build_index(data) if self.build_index else None
+            self.data, self.index = data, index
+            self.version += 1
+        self.expires_at = time.monotonic() + self.lifetime(data)
+        return data
+
+
+def build_station_grid(stations):
+    "spatial index over one station_information snapshot, positions match data.stations"
+    station_list = stations['data']['stations']
+    return GridIndex([s['lat'] for s in station_list], [s['lon'] for s in station_list])
+
+def build_status_lookup(status):
+    return {s['station_id']: s for s in status['data']['stations']}
+
+station_info_cache = GbfsFeedCache(
+    f"{gbfs_lyft_base}/station_information.json", STATION_INFO_MIN_TTL, STATION_INFO_MAX_TTL,
+    build_index=build_station_grid
+)
+station_status_cache = GbfsFeedCache(
+    f"{gbfs_lyft_base}/station_status.json", STATION_STATUS_MIN_TTL, STATION_STATUS_MAX_TTL,
+    build_index=build_status_lookup
+)
+
+# per-station counts of the last few hours, fed by the poller below
+status_history = StatusHistory()
+# bike and dock flows per station, to say what a dock will look like on arrival
+availability_forecast = AvailabilityForecast(status_history)
+
+async def record_status(): 
+    "put the current station_status snapshot into the history and the forecast"
+    status = await station_status_cache.get()
+    if not is_error(status): 
+        status_history.record(status['data']['stations'], time.time())
+        availability_forecast.update()
+
+async def poll_status_forever(interval=HISTORY_POLL_INTERVAL): 
+    """
+    Record station_status every `interval` seconds. The feed cache decides when
+    to actually refetch, so this costs nothing extra while the snapshot is fresh.
+    """
+    while True: 
+        try: 
+            await record_status()
+        except Exception: 
+            pass  # try again next round, the history just has a gap
+        await asyncio.sleep(interval)
+
+history_poller = BackgroundTask(poll_status_forever)
 
 async def get_gbfs_feeds(): 
     "get discovery document showing all available feeds"
@@ -68,9 +185,7 @@ async def get_gbfs_feeds():
 
 async def get_station_info():
     "get static station information (locations, names, etc.)"
-    url = f"{gbfs_lyft_base}/station_information.json"
-
-    data = await make_gbfs_request(url)
+    data = await station_info_cache.get()
 
     if isinstance(data, dict) and "error" in data: 
         return data
@@ -81,64 +196,77 @@ async def get_station_info():
 
 async def get_station_status():
     "get real-time status information (availability, etc.)"
-    url = f"{gbfs_lyft_base}/station_status.json"
-
-    data = await make_gbfs_request(url)
+    history_poller.ensure()
+    data = await station_status_cache.get()
 
     if isinstance(data, dict) and "error" in data: 
         return data
     
     return data 
 
+def station_details(station, distance, status_lookup):
+    station_status = status_lookup.get(station['station_id'], {})
+    return {
+        'name': station['name'],
+        'lat': station.get("lat"),
+        'lon': station.get("lon"),
+        'distance_km': distance,
+        'available_bikes': station_status.get("num_bikes_available", 0),
+        'available_ebikes': station_status.get("num_ebikes_available", 0), 
+        'available_docks': station_status.get("num_docks_available", 0),
+        'station_id': station['station_id']
+    }
+
 async def find_nearby_stations(lat, lon, radius_km=0.5):
     "find stations within a certain radius of a latitude/longitude point" 
 
 
-    stations = await get_station_info()
-    status = await get_station_status()
+    stations, status = await asyncio.gather(get_station_info(), get_station_status())
 
     if is_error(stations) or is_error(status): 
         return []
     
-    status_lookup = {s['station_id']: s for s in status['data']['stations']}
+    station_list = stations['data']['stations']
+    station_grid = station_info_cache.index
+    status_lookup = station_status_cache.index
 
-    nearby = [ ]
+    # grid hits come back sorted by distance
+    return [
+        station_details(station_list[i], distance, status_lookup)
+        for i, distance in station_grid.within(lat, lon, radius_km)
+    ]
 
-    for station in stations['data']['stations']:
-        
-        station_lat = station.get("lat")
-        station_lon = station.get("lon")
+async def find_closest_stations(lat, lon, k=3):
+    "find the k stations closest to a latitude/longitude point regardless of distance"
+    stations, status = await asyncio.gather(get_station_info(), get_station_status())
 
-        distance = haversine(lat, lon, station_lat, station_lon)
-        if distance <= radius_km:
-            station_status = status_lookup.get(station['station_id'], {})
-            nearby.append({
-                'name': station['name'],
-                'lat': station_lat,
-                'lon': station_lon,
-                'distance_km': distance,
-                'available_bikes': station_status.get("num_bikes_available", 0),
-                'available_ebikes': station_status.get("num_ebikes_available", 0), 
-                'available_docks': station_status.get("num_docks_available", 0),
-                'station_id': station['station_id']
-            })
+    if is_error(stations) or is_error(status): 
+        return []
 
-    nearby.sort(key=lambda x: x['distance_km'])
-    return nearby
+    station_list = stations['data']['stations']
+    return [
+        station_details(station_list[i], distance, station_status_cache.index)
+        for i, distance in station_info_cache.index.nearest(lat, lon, k, max_km=CLOSEST_STATIONS_MAX_KM)
+    ]
     
-@mcp.tool()
-async def find_bikes_nearby(latitude: float, longitude: float, radius_km: float=0.5): 
-    """
-    Find available citi bike stations near a location 
-    args: 
-        latitude: latitude of location
-        longitude: longitude of location
-        radius_km: search radius in kilometers, default is 0.5km 
-    """
+# find_bikes_nearby answers, good until either feed snapshot changes
+nearby_bikes_cache = QueryCache()
+
+async def describe_bikes_nearby(latitude, longitude, radius_km): 
     stations = await find_nearby_stations(latitude, longitude, radius_km)
+    closest = [] if stations else await find_closest_stations(latitude, longitude, k=3)
+    return bikes_nearby_text(stations, closest, radius_km)
 
+def bikes_nearby_text(stations, closest, radius_km): 
+    "find_bikes_nearby's answer from the stations in the radius, or the closest ones if there are none"
     if not stations: 
-        return "No citi bike stations found nearby or data unavailable. "
+        if not closest: 
+            return "No citi bike stations found nearby or data unavailable. "
+        result = f"No citi bike stations within {radius_km}km. Closest stations: \n\n"
+        for station in closest: 
+            result += f"• {station['name']} ({round(station['distance_km'], 2)}km away)\n"
+            result += f"  Bikes available: {station['available_bikes']} | Docks available: {station['available_docks']}\n\n"
+        return result
     
     stations_with_bikes = [s for s in stations if s['available_bikes'] > 0]
 
@@ -157,10 +285,80 @@ async def find_bikes_nearby(latitude: float, longitude: float, radius_km: float=
 
     return result 
 
+@mcp.tool()
+async def find_bikes_nearby(latitude: float, longitude: float, radius_km: float=0.5): 
+    """
+    Find available citi bike stations near a location 
+    args: 
+        latitude: latitude of location
+        longitude: longitude of location
+        radius_km: search radius in kilometers, default is 0.5km 
+    """
+    key = quantize(latitude, longitude, radius_km)
+    # both snapshots are fetched first (shared with every other caller) so the
+    # cached answer can be checked against their versions
+    stations, status = await asyncio.gather(get_station_info(), get_station_status())
+    if is_error(stations) or is_error(status): 
+        return await describe_bikes_nearby(*key)
+    version = (station_info_cache.version, station_status_cache.version)
+    return await nearby_bikes_cache.get(key, version, lambda: describe_bikes_nearby(*key))
+
+@mcp.tool()
+async def find_bikes_nearby_many(points: list, radius_km: float=0.5): 
+    """
+    Find available citi bike stations near each of several locations in one call,
+    all answered from the same station status snapshot
+    args: 
+        points: list of [latitude, longitude] pairs, at most 50
+        radius_km: search radius in kilometers, default is 0.5km 
+    """
+    points = read_points(points)
+    radius_km = float(str(radius_km).strip('"'))
+    stations, status = await asyncio.gather(get_station_info(), get_station_status())
+    if is_error(stations) or is_error(status): 
+        return "Citi bike data unavailable. "
+
+    station_list = stations['data']['stations']
+    station_grid = station_info_cache.index
+    status_lookup = station_status_cache.index
+    hits = station_grid.within_many([lat for lat, _ in points], [lon for _, lon in points], radius_km)
+    results = []
+    for (lat, lon), (positions, distances) in zip(points, hits): 
+        nearby = [
+            station_details(station_list[i], distance, status_lookup)
+            for i, distance in zip(positions.tolist(), distances.tolist())
+        ]
+        closest = [] if nearby else [
+            station_details(station_list[i], distance, status_lookup)
+            for i, distance in station_grid.nearest(lat, lon, 3, max_km=CLOSEST_STATIONS_MAX_KM)
+        ]
+        results.append({'latitude': lat, 'longitude': lon, 'result': bikes_nearby_text(nearby, closest, radius_km)})
+    return results
+
+def add_forecast(stations, arrive_mins): 
+    "expected_bikes / expected_docks at each station when we'd get there, arrive_mins ahead"
+    bikes, docks = availability_forecast.predict(
+        [station['station_id'] for station in stations],
+        [station['available_bikes'] for station in stations],
+        [station['available_docks'] for station in stations],
+        arrive_mins
+    )
+    for station, mins, expected_bikes, expected_docks in zip(stations, np.broadcast_to(arrive_mins, len(stations)).tolist(), bikes.tolist(), docks.tolist()): 
+        station['arrive_mins'] = round(mins)
+        station['expected_bikes'] = round(expected_bikes)
+        station['expected_docks'] = round(expected_docks)
+    return stations
+
+def expected(now, then): 
+    return f"{now}" if now == then else f"{now} now, ~{then} expected"
+
 @mcp.tool()
 async def get_citibike_route_options(origin_lat: float, origin_lon: float, dest_lat: float, dest_lon: float, radius_km: float = 0.5) -> str:
     """Find Citi Bike pickup and dropoff options for a route.
 
+    Bikes and docks are forecast for when you'd reach each station, from how
+    they've been changing over the last few minutes.
+
     Args:
         origin_lat: Starting latitude
         origin_lon: Starting longitude
@@ -175,13 +373,23 @@ async def get_citibike_route_options(origin_lat: float, origin_lon: float, dest_
     if not pickup_stations or not dropoff_stations:
         return "No Citi Bike stations found for this route or data unavailable."
     
-    pickup_with_bikes = [s for s in pickup_stations if s['available_bikes'] > 0]
-    dropoff_with_docks = [s for s in dropoff_stations if s['available_docks'] > 0]
+    # walk to each pickup, then ride from the closest one expected to have a bike to each dropoff
+    add_forecast(pickup_stations, [s['distance_km'] * WALK_MINS_PER_KM for s in pickup_stations])
+    pickup_with_bikes = [s for s in pickup_stations if s['expected_bikes'] > 0]
     
     if not pickup_with_bikes:
+        if any(s['available_bikes'] > 0 for s in pickup_stations): 
+            return "Bikes at the pickup locations are going fast, none are expected to be left by the time you get there."
         return "No bikes available at pickup locations."
+
+    start = pickup_with_bikes[0]
+    ride_km = haversine_many(start['lat'], start['lon'], [s['lat'] for s in dropoff_stations], [s['lon'] for s in dropoff_stations]) * BIKE_DETOUR
+    add_forecast(dropoff_stations, start['arrive_mins'] + BIKE_DOCK_MINS + ride_km * BIKE_MINS_PER_KM)
+    dropoff_with_docks = [s for s in dropoff_stations if s['expected_docks'] > 0]
     
     if not dropoff_with_docks:
+        if any(s['available_docks'] > 0 for s in dropoff_stations): 
+            return "Docks at the destination are filling up, none are expected to be free by the time you get there."
         return "No dock space available at destination."
     
     result = " **PICKUP OPTIONS:**\n\n"
@@ -189,16 +397,83 @@ async def get_citibike_route_options(origin_lat: float, origin_lon: float, dest_
     for station in pickup_with_bikes[:2]:
         classic_bikes = station['available_bikes'] - station['available_ebikes']
         result += f"• {station['name']} ({station['distance_km']}km away)\n"
-        result += f"  Classic: {classic_bikes} | E-bikes: {station['available_ebikes']}\n\n"
+        result += f"  Classic: {classic_bikes} | E-bikes: {station['available_ebikes']}\n"
+        result += f"  Bikes when you get there (~{station['arrive_mins']} min): {expected(station['available_bikes'], station['expected_bikes'])}\n\n"
     
     result += " **DROPOFF OPTIONS:**\n\n"
     
     for station in dropoff_with_docks[:2]:
         result += f"• {station['name']} ({station['distance_km']}km away)\n"
-        result += f"  Docks available: {station['available_docks']}\n\n"
+        result += f"  Docks when you get there (~{station['arrive_mins']} min): {expected(station['available_docks'], station['expected_docks'])}\n\n"
     
     return result
 
+def find_station(stations, station_name_or_id): 
+    "station_information entry by station id, exact name or part of the name"
+    query = station_name_or_id.strip().lower()
+    station_list = stations['data']['stations']
+    for station in station_list: 
+        if station['station_id'] == station_name_or_id.strip() or station['name'].lower() == query: 
+            return station
+    return next((station for station in station_list if query in station['name'].lower()), None)
+
+def minutes_until(count, per_hour): 
+    "minutes until `count` reaches zero going at `per_hour`, None if it isn't going down"
+    return round(count / -per_hour * 60) if per_hour < 0 else None
+
+@mcp.tool()
+async def get_station_trend(station_name_or_id: str, minutes: int = 60): 
+    """
+    How bike and dock availability at a Citi Bike station has been changing,
+    from the readings kept in memory (up to the last 6 hours, one per minute)
+    args: 
+        station_name_or_id: station id, or its name or part of it
+        minutes: how far back to look, default 60
+    """
+    minutes = max(1, min(int(str(minutes).strip('"')), HISTORY_MINUTES))
+    stations, status = await asyncio.gather(get_station_info(), get_station_status())
+    if is_error(stations) or is_error(status): 
+        return "Citi bike data unavailable. "
+    station = find_station(stations, station_name_or_id)
+    if station is None: 
+        return f"No citi bike station matching '{station_name_or_id}'. "
+    if status_history.latest is None: 
+        await record_status()
+
+    series = status_history.series(station['station_id'], minutes)
+    if series is None or not len(series[0]): 
+        return f"No readings kept for {station['name']} yet. "
+    times, (bikes, ebikes, docks) = series
+    span_mins = (times[-1] - times[0]) / 60
+    result = {
+        'name': station['name'],
+        'station_id': station['station_id'],
+        'readings': len(times),
+        'covers_mins': round(span_mins),
+        'now': {'bikes': int(bikes[-1]), 'ebikes': int(ebikes[-1]), 'docks': int(docks[-1])},
+        'then': {'bikes': int(bikes[0]), 'ebikes': int(ebikes[0]), 'docks': int(docks[0])},
+    }
+    if span_mins < 5: 
+        result['note'] = "history only starts when the server first checks Citi Bike, ask again in a few minutes for a trend"
+        return result
+
+    # least squares slope, robust to one odd reading unlike last minus first
+    hours = (times - times[-1]) / 3600
+    bikes_per_hour = float(np.polyfit(hours, bikes, 1)[0])
+    docks_per_hour = float(np.polyfit(hours, docks, 1)[0])
+    result['bikes_per_hour'] = round(bikes_per_hour, 1)
+    result['docks_per_hour'] = round(docks_per_hour, 1)
+    result['trend'] = 'emptying out' if bikes_per_hour <= -1 else 'filling up' if bikes_per_hour >= 1 else 'steady'
+    result['mins_until_no_bikes'] = minutes_until(int(bikes[-1]), bikes_per_hour)
+    result['mins_until_no_docks'] = minutes_until(int(docks[-1]), docks_per_hour)
+    # about a dozen points to show the shape
+    step = -(-len(times) // 12)
+    result['history'] = [
+        {'time': datetime.fromtimestamp(int(t), tz=NYC_TZ).strftime('%H:%M'), 'bikes': int(b), 'ebikes': int(e), 'docks': int(d)}
+        for t, b, e, d in list(zip(times, bikes, ebikes, docks))[::-step][::-1]
+    ]
+    return result
+
 # async def main(): 
 #     # Test with Union Square coordinates
 #     stations = await find_nearby_stations(40.739694, -73.980941, radius_km=0.3)
@@ -208,6 +483,6 @@ async def get_citibike_route_options(origin_lat: float, origin_lon: float, dest_
 #         print(f"  Bikes: {station['available_bikes']}, E-Bikes: {station['available_ebikes']}, Docks: {station['available_docks']}")
 
 if __name__ == "__main__":
-    mcp.run(transport='stdio')
+    serve(mcp)
     
 ##
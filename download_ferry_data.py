@@ -1,135 +1,143 @@
 import asyncio
-import httpx
+import http_client
 import zipfile
 import io
 import pandas as pd
 import json
 from pathlib import Path
+from ferry_timetable import build_timetable, save_timetable
 
-async def download_and_process_ferry_data():
-    """Download GTFS data and process into our nested JSON structure"""
+GTFS_URL = "http://nycferry.connexionz.net/rtt/public/utility/gtfs.aspx"
+GTFS_FILES = ['stops.txt', 'routes.txt', 'trips.txt', 'stop_times.txt', 'calendar.txt', 'calendar_dates.txt']
 
-    # Download the GTFS zip
-    url = "http://nycferry.connexionz.net/rtt/public/utility/gtfs.aspx"
-    print("Downloading ferry GTFS data...")
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, timeout=30.0, follow_redirects=True)
-        response.raise_for_status()
-
-    # Extract the files we need
-    zip_data = io.BytesIO(response.content)
+def read_gtfs_tables(zip_bytes):
+    "load the GTFS files we need from the zip into DataFrames keyed by file name without .txt"
     gtfs_data = {}
-
-    with zipfile.ZipFile(zip_data, 'r') as zip_ref:
-        # Load the key files into pandas DataFrames
-        files_to_load = ['stops.txt', 'routes.txt', 'trips.txt', 'stop_times.txt', 'calendar.txt']
-
-        for filename in files_to_load:
+    with zipfile.ZipFile(io.BytesIO(zip_bytes), 'r') as zip_ref:
+        for filename in GTFS_FILES:
             if filename in zip_ref.namelist():
                 file_data = zip_ref.read(filename)
-                # TODO: Fill in - create a DataFrame from the CSV data
                 gtfs_data[filename.replace('.txt', '')] = pd.read_csv(io.StringIO(file_data.decode('utf-8')))
+    return gtfs_data
 
-    # Step 1: Start with stops as our base structure
+
+def build_ferry_data(gtfs_data):
+    """
+    Build the nested stops -> routes -> schedules/destinations structure.
+
+    `patterns` lists every distinct stop sequence a route runs, with its
+    direction_id, and each stop's departures are also split by the pattern
+    of their trip (`pattern_schedules`, keyed by the pattern's position), so
+    a departure without its trip still says which way the boat goes.
+
+    Everything is done with joins and one pass over each distinct stop pattern,
+    so the work grows linearly with the number of stop_times rows.
+    """
     stops_df = gtfs_data['stops']
     routes_df = gtfs_data['routes']
     trips_df = gtfs_data['trips']
     stop_times_df = gtfs_data['stop_times']
     calendar_df = gtfs_data['calendar']
 
-    print(f"Loaded {len(stops_df)} stops, {len(routes_df)} routes")
+    # Step 1: Start with stops as our base structure
+    ferry_data = {"stops": {}, "patterns": []}
+    for stop_id, name, lat, lon in zip(stops_df['stop_id'], stops_df['stop_name'], stops_df['stop_lat'], stops_df['stop_lon']):
+        ferry_data["stops"][str(stop_id)] = {
+            "name": name,
+            "lat": float(lat),
+            "lon": float(lon),
+            "routes": {}
+        }
 
-    # Step 2: Create our nested structure
-    ferry_data = {"stops": {}}
+    # If it runs Mon-Fri, it's weekdays. Otherwise it's weekends
+    service_patterns = dict(zip(
+        calendar_df['service_id'],
+        calendar_df['monday'].map(lambda monday: "weekdays" if monday == 1 else "weekends")
+    ))
+    route_names = dict(zip(routes_df['route_id'], routes_df['route_long_name']))
+
+    # Step 2: one row per stop visit with its route and day type, in stop_times order
+    trip_columns = ['trip_id', 'route_id', 'service_id'] + (['direction_id'] if 'direction_id' in trips_df else [])
+    visits = stop_times_df[['trip_id', 'stop_id', 'stop_sequence', 'departure_time']].merge(
+        trips_df[trip_columns], on='trip_id', how='inner'
+    )
+    visits = visits[visits['route_id'].isin(route_names.keys())]
+    visits['stop_key'] = visits['stop_id'].astype(str)
+    visits = visits[visits['stop_key'].isin(ferry_data["stops"].keys())]
+    visits['day_type'] = visits['service_id'].map(service_patterns)
+
+    # Step 3: departure times per stop, route and day type
+    schedules = visits.groupby(['stop_key', 'route_id', 'day_type'], sort=False)['departure_time'].agg(list)
+    for (stop_key, route_id, day_type), departures in schedules.items():
+        stop_routes = ferry_data["stops"][stop_key]["routes"]
+        route_key = str(route_id)
+        if route_key not in stop_routes:
+            stop_routes[route_key] = {
+                "route_name": route_names[route_id],
+                "destinations": [],
+                "schedule_patterns": {"weekdays": [], "weekends": []}
+            }
+        stop_routes[route_key]["schedule_patterns"][day_type] = departures
+
+    # Step 4: destinations from each distinct stop pattern, walked once per pattern
+    ordered = visits.sort_values(['trip_id', 'stop_sequence'], kind='stable')
+    columns = {'route_id': ('route_id', 'first'), 'pattern': ('stop_key', tuple)}
+    if 'direction_id' in visits:
+        columns['direction_id'] = ('direction_id', 'first')
+    trip_patterns = ordered.groupby('trip_id', sort=False).agg(**columns)
+    destinations = {}
+    for route_id, pattern in set(zip(trip_patterns['route_id'], trip_patterns['pattern'])):
+        seen = set()
+        for i, stop_key in enumerate(pattern):
+            # a stop visited twice keeps the destinations after its first visit
+            if stop_key in seen:
+                continue
+            seen.add(stop_key)
+            destinations.setdefault((stop_key, str(route_id)), {}).update(dict.fromkeys(pattern[i + 1:]))
+
+    for (stop_key, route_key), future_stops in destinations.items():
+        ferry_data["stops"][stop_key]["routes"][route_key]["destinations"] = list(future_stops)
+
+    # Step 5: the patterns themselves, and departures per stop split by the pattern of their trip
+    directions = trip_patterns['direction_id'] if 'direction_id' in trip_patterns else [None] * len(trip_patterns)
+    pattern_positions = {}
+    trip_pattern = []
+    for route_id, direction_id, stops in zip(trip_patterns['route_id'], directions, trip_patterns['pattern']):
+        key = (str(route_id), None if pd.isna(direction_id) else int(direction_id), stops)
+        if key not in pattern_positions:
+            pattern_positions[key] = len(ferry_data["patterns"])
+            ferry_data["patterns"].append({"route_id": key[0], "direction_id": key[1], "stops": list(stops)})
+        trip_pattern.append(pattern_positions[key])
+    trip_pattern = pd.Series(trip_pattern, index=trip_patterns.index)
+    visits['pattern'] = visits['trip_id'].map(trip_pattern)
+    by_pattern = visits.groupby(['stop_key', 'route_id', 'pattern', 'day_type'], sort=False)['departure_time'].agg(list)
+    for (stop_key, route_id, pattern, day_type), departures in by_pattern.items():
+        schedules = ferry_data["stops"][stop_key]["routes"][str(route_id)].setdefault("pattern_schedules", {})
+        schedules.setdefault(str(pattern), {"weekdays": [], "weekends": []})[day_type] = departures
+
+    return ferry_data
 
-    # TODO: Fill in - loop through each stop and build the nested structure
-    for _, stop in stops_df.iterrows():
-        stop_id = str(stop['stop_id'])
 
-        ferry_data["stops"][stop_id] = {
-            "name": stop['stop_name'], 
-            "lat": stop['stop_lat'], 
-            "lon": stop['stop_lon'],
-            "routes": {}
-        }
+async def download_and_process_ferry_data():
+    """Download GTFS data and process into our nested JSON structure"""
 
-      # Step 3: Add routes and schedules to each stop
-    print("Processing routes and schedules...")
+    # Download the GTFS zip
+    print("Downloading ferry GTFS data...")
+
+    try:
+        # the zip is only read once per run, no point keeping validators for it
+        content = await http_client.get_bytes(GTFS_URL, timeout=30.0, conditional=False)
+    finally:
+        await http_client.aclose()
 
-    # First, let's understand the service patterns
-     
-    service_patterns = {}
-    for _, service in calendar_df.iterrows():
-        service_id = service['service_id']
-        # If it runs Mon-Fri, it's weekdays. If Sat-Sun, it's weekends
-        if service['monday'] == 1:  # runs on weekdays
-            service_patterns[service_id] = "weekdays"
-        else:  # runs on weekends
-            service_patterns[service_id] = "weekends"
-
-    print(f"Service patterns: {service_patterns}")
-
-    # Now for each stop, find what routes serve it
-    for stop_id in ferry_data["stops"].keys():
-         
-        stop_visits = stop_times_df[stop_times_df['stop_id'] == int(stop_id)]
-        
-        # Group by route
-        for _, visit in stop_visits.iterrows():
-            trip_id = visit['trip_id']
-            departure_time = visit['departure_time']
-
-            # TODO: Fill in - find which route this trip belongs to
-            trip_info = trips_df[trips_df['trip_id'] == trip_id].iloc[0]
-            route_id = trip_info['route_id']
-            service_id = trip_info['service_id']
-
-            # Get route details
-            route_info = routes_df[routes_df['route_id'] == route_id].iloc[0]
-
-            # Add route to stop if not already there
-            if route_id not in ferry_data["stops"][stop_id]["routes"]:
-                ferry_data["stops"][stop_id]["routes"][route_id] = {
-                    "route_name": route_info['route_long_name'],
-                    "destinations": [],  # We'll fill this later
-                    "schedule_patterns": {"weekdays": [], "weekends": []}
-                }
-
-            # Add departure time to appropriate pattern
-            day_type = service_patterns[service_id]
-            ferry_data["stops"][stop_id]["routes"][route_id]["schedule_patterns"][day_type].append(departure_time)
-
-            
-
-     
-
-  # Calculate destinations once per route
-    for stop_id in ferry_data["stops"].keys():
-        for route_id in ferry_data["stops"][stop_id]["routes"].keys():
-
-            # Find all trips for this route
-            route_trips = trips_df[trips_df['route_id'] == route_id]
-            destinations = set()
-
-            for _, route_trip in route_trips.iterrows():
-                trip_id = route_trip['trip_id']
-                # Get all stops for this trip, ordered by sequence
-                trip_stops = stop_times_df[stop_times_df['trip_id'] == trip_id].sort_values('stop_sequence')
-
-                # Find current stop's position in this trip
-                current_stop_rows = trip_stops[trip_stops['stop_id'] == int(stop_id)]
-                if len(current_stop_rows) > 0:
-                    current_sequence = current_stop_rows.iloc[0]['stop_sequence']
-                    # Get stops that come after this one
-                    future_stops = trip_stops[trip_stops['stop_sequence'] > current_sequence]
-                    for _, future_stop in future_stops.iterrows():
-                        destinations.add(str(future_stop['stop_id']))
-
-            # Update destinations in our data structure
-            ferry_data["stops"][stop_id]["routes"][route_id]["destinations"] = list(destinations)
-        # Save to JSON file
+    gtfs_data = read_gtfs_tables(content)
+    print(f"Loaded {len(gtfs_data['stops'])} stops, {len(gtfs_data['routes'])} routes")
 
+    print("Processing routes and schedules...")
+    ferry_data = build_ferry_data(gtfs_data)
+
+    # Save to JSON file
     output_path = Path("data/ferry_data.json")
     output_path.parent.mkdir(exist_ok=True)
 
@@ -138,6 +146,11 @@ async def download_and_process_ferry_data():
 
     print(f"Ferry data saved to {output_path}")
 
+    # the same schedules as sorted integer arrays for bisect lookups, see ferry_timetable.py
+    timetable_path = Path("data/ferry_timetable.bin")
+    save_timetable(timetable_path, build_timetable(ferry_data, gtfs_data))
+    print(f"Ferry timetable saved to {timetable_path}")
+
 if __name__ == "__main__":
     asyncio.run(download_and_process_ferry_data())
 # import asyncio 
@@ -1,12 +1,22 @@
-import math
+import asyncio
+import os
+import time
 from typing import Any
-import httpx
-import io
-import pandas as pd
-import zipfile
+import http_client
 import json
 from mcp.server.fastmcp import FastMCP
-from google.transit import gtfs_realtime_pb2
+from ferry_index import FerryIndex
+from ferry_router import MAX_FERRY_TRANSFERS, FerryGraph
+from background import BackgroundTask, Inflight
+from footpaths import FOOTPATHS
+from geo import WALK_MINS_PER_KM
+from gtfs_realtime import gtfs_realtime_pb2
+from gtfs_rt_views import FeedView
+from query_cache import QueryCache, quantize
+from ferry_timetable import NO_TRIP, format_seconds, load_or_build
+from serving import read_points, serve
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 
 mcp = FastMCP("nyc_ferry_data")
 
@@ -19,9 +29,54 @@ gtfs_alerts = "http://nycferry.connexionz.net/rtt/public/utility/gtfsrealtime.as
 # REAL TIME TRIP UPDATES
 gtfs_real_time_updates= "http://nycferry.connexionz.net/rtt/public/utility/gtfsrealtime.aspx/tripupdate"
 
+# how often the trip-update poller refetches, and how long it keeps going after the last request
+TRIP_UPDATES_REFRESH_INTERVAL = float(os.environ.get("FERRY_RT_REFRESH_SECS", 30))
+TRIP_UPDATES_IDLE_TIMEOUT = float(os.environ.get("FERRY_RT_IDLE_SECS", 10 * 60))
+# after failed fetches the feed is left alone for the interval, doubling per failure up to this
+TRIP_UPDATES_MAX_BACKOFF = float(os.environ.get("FERRY_RT_MAX_BACKOFF_SECS", 5 * 60))
+# how far apart a real-time update's scheduled time and a timetable departure can be and still be the same boat
+REAL_TIME_MATCH_SECS = 3 * 60
+
 with open('data/ferry_data.json', 'r') as f: 
     ferry_data = json.load(f)
 
+# name, prefix and spatial lookups over the stops
+FERRY_INDEX = FerryIndex(ferry_data)
+# departure times as sorted seconds, mmapped from the file download_ferry_data.py writes
+FERRY_TIMETABLE = load_or_build('data/ferry_timetable.bin', ferry_data)
+# which stops each route goes on to, for trips with transfers
+FERRY_GRAPH = FerryGraph(FERRY_INDEX, FERRY_TIMETABLE, FOOTPATHS)
+NYC_TZ = ZoneInfo("America/New_York")
+# find_ferry_stops_nearby answers, the stops never change while the server runs
+nearby_stops_cache = QueryCache()
+
+def next_ferry_departures(stop_id, when=None, limit=10):
+    """
+    The next scheduled departures from a stop after `when` (default now, NYC time),
+    over the services running each day. Yesterday's trips that run past midnight
+    count, and tomorrow's first boats fill in late at night.
+    """
+    when = when or datetime.now(NYC_TZ)
+    seconds = when.hour * 3600 + when.minute * 60 + when.second
+    upcoming = []
+    # service day offsets: yesterday, today, tomorrow
+    for day_offset in (-1, 0, 1):
+        service_date = when.date() + timedelta(days=day_offset)
+        services = FERRY_TIMETABLE.active_services(service_date)
+        after = max(seconds - day_offset * 24 * 3600, 0)
+        for departure_seconds, route, trip in FERRY_TIMETABLE.next_departures(stop_id, after, services, limit):
+            # relative to midnight of when's date from here on
+            upcoming.append((departure_seconds + day_offset * 24 * 3600, route, trip))
+    upcoming.sort()
+
+    return [{
+        "date": (when.date() + timedelta(days=departure_seconds // (24 * 3600))).isoformat(),
+        "time": format_seconds(departure_seconds),
+        "route_id": FERRY_TIMETABLE.route_id(route),
+        "route_name": FERRY_TIMETABLE.route_name(route),
+        "trip_id": FERRY_TIMETABLE.trip_id(trip),
+    } for departure_seconds, route, trip in upcoming[:limit]]
+
 async def make_gtfs_requests(url: str) -> dict[str, Any]: 
     """ make a request to different gtfs servers"""
     headers = {
@@ -30,177 +85,171 @@ async def make_gtfs_requests(url: str) -> dict[str, Any]:
     }
 
     try: 
-        async with httpx.AsyncClient() as client: 
-            response = await client.get(url, headers=headers, timeout=10.0, follow_redirects=True)
-            response.raise_for_status()
-
-            #for gtfs static daga (zip file)
-            if url== gtfs_routes_trips:
-                return {"content": response.content, "content_type":"zip"}
-            else: 
-                return {"content": response.content, "content_type": "protobuf"}
-    except httpx.TimeoutException:
-        return {"error": "Request timed out"}
-    except httpx.HTTPError as e:
-        return {"error": f"HTTP error: {e.response.status_code}"}
+        content = await http_client.get_bytes(url, headers=headers)
+
+        #for gtfs static daga (zip file)
+        if url== gtfs_routes_trips:
+            return {"content": content, "content_type":"zip"}
+        else: 
+            return {"content": content, "content_type": "protobuf"}
     except Exception as e:
-        return {"error": str(e)}
+        return http_client.error_result(e)
     
 def is_error(data): 
     return isinstance(data, dict) and "error" in data
 
-def haversine(lat1, lon1, lat2, lon2):
-    """
-    Calculate the great circle distance between two points 
-    on the earth (specified in decimal degrees)
-    Returns distance in kilometers
-    """
-    # Convert decimal degrees to radians
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    
-    # Radius of earth in kilometers
-    r = 6371
-    
-    return c * r
-
-async def get_ferry_alerts():
-    """Get real-time ferry service alerts"""
+async def get_ferry_alerts(route_id=None, stop_id=None):
+    """Get real-time ferry service alerts, optionally only those affecting a route or stop"""
     data = await make_gtfs_requests(gtfs_alerts)
 
     if is_error(data):
         return data
 
     try:
-        # Parse protobuf real-time data
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(data["content"])
-
-        alerts = []
-        for entity in feed.entity:
-            if entity.HasField('alert'):
-                alert = entity.alert
-
-                # Extract alert information
-                alert_info = {
-                    "id": entity.id,
-                    "cause": alert.cause if alert.HasField('cause') else None,
-                    "effect": alert.effect if alert.HasField('effect') else None,
-                    "header_text": "",
-                    "description_text": "",
-                    "affected_routes": [],
-                    "affected_stops": []
-                }
-
-                # Get header text (multiple languages possible)
-                if alert.header_text and alert.header_text.translation:
-                    for translation in alert.header_text.translation:
-                        if translation.language == "en" or not alert_info["header_text"]:
-                            alert_info["header_text"] = translation.text
-
-                # Get description text
-                if alert.description_text and alert.description_text.translation:
-                    for translation in alert.description_text.translation:
-                        if translation.language == "en" or not alert_info["description_text"]:
-                            alert_info["description_text"] = translation.text
-
-                # Get affected routes and stops
-                for informed_entity in alert.informed_entity:
-                    if informed_entity.HasField('route_id'):
-                        alert_info["affected_routes"].append(informed_entity.route_id)
-                    if informed_entity.HasField('stop_id'):
-                        alert_info["affected_stops"].append(informed_entity.stop_id)
-
-                alerts.append(alert_info)
-
+        # Parse protobuf real-time data, fields are only read for the alerts we keep
+        feed = FeedView(data["content"])
+        alerts = [alert.to_dict() for alert in feed.alerts(route_id, stop_id)]
         return {"alerts": alerts, "count": len(alerts)}
 
     except Exception as e:
         return {"error": f"Failed to parse protobuf data: {str(e)}"}
 
-async def get_ferry_trip_updates():
-    """Get real-time ferry trip updates"""
-    data = await make_gtfs_requests(gtfs_real_time_updates)
-
-    if is_error(data):
-        return data
+def header_timestamp(content):
+    """
+    header.timestamp of a serialized FeedMessage without parsing the entities.
+    The header is field 1 and comes first on the wire, so only its bytes are decoded.
+    """
+    if not content or content[0] != 0x0A:  # field 1, length delimited
+        return None
+    length, shift, pos = 0, 0, 1
+    while pos < len(content):
+        byte = content[pos]
+        length |= (byte & 0x7F) << shift
+        pos += 1
+        if not byte & 0x80:
+            break
+        shift += 7
+    header = gtfs_realtime_pb2().FeedHeader()
+    header.ParseFromString(content[pos:pos + length])
+    return header.timestamp if header.HasField('timestamp') else None
+
+def index_by_stop(feed):
+    "stop_id -> [(TripUpdateView, StopTimeUpdateView)] over every stop time update in the feed"
+    by_stop = {}
+    for trip in feed.trip_updates():
+        for stop_update in trip.stop_updates():
+            by_stop.setdefault(stop_update.stop_id, []).append((trip, stop_update))
+    return by_stop
+
+class TripUpdatesFeed:
+    """
+    Latest ferry trip updates, parsed once per new feed and indexed by stop.
+
+    A background poller refetches every `interval` seconds while the feed has
+    been asked for within `idle_timeout`. A fetch whose header.timestamp matches
+    the one already parsed is dropped without decoding the entities, and a
+    failed fetch keeps the previous updates in place.
+
+    After a failure nobody fetches again for `interval` seconds, doubling with
+    each failure in a row up to `max_backoff`; callers get the previous updates
+    (or the error) meanwhile instead of each waiting on a dead upstream. Once
+    that wait is over, a caller holding earlier updates gets them straight away
+    while the next attempt runs in the background.
+    """
 
-    try:
-        # Parse protobuf real-time data
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(data["content"])
-
-        trip_updates = []
-        for entity in feed.entity:
-            if entity.HasField('trip_update'):
-                trip_update = entity.trip_update
-
-                # Extract trip information
-                trip_info = {
-                    "id": entity.id,
-                    "trip_id": trip_update.trip.trip_id if trip_update.trip.HasField('trip_id') else None,
-                    "route_id": trip_update.trip.route_id if trip_update.trip.HasField('route_id') else None,
-                    "start_date": trip_update.trip.start_date if trip_update.trip.HasField('start_date') else None,
-                    "schedule_relationship": trip_update.trip.schedule_relationship if trip_update.trip.HasField('schedule_relationship') else None,
-                    "vehicle_id": trip_update.vehicle.id if trip_update.HasField('vehicle') and trip_update.vehicle.HasField('id') else None,
-                    "timestamp": trip_update.timestamp if trip_update.HasField('timestamp') else None,
-                    "stop_time_updates": []
-                }
-
-                # Extract stop time updates (real-time arrival/departure info)
-                for stop_time_update in trip_update.stop_time_update:
-                    stop_update_info = {
-                        "stop_id": stop_time_update.stop_id if stop_time_update.HasField('stop_id') else None,
-                        "stop_sequence": stop_time_update.stop_sequence if stop_time_update.HasField('stop_sequence') else None,
-                        "schedule_relationship": stop_time_update.schedule_relationship if stop_time_update.HasField('schedule_relationship') else None
-                    }
-
-                    # Get arrival info if available
-                    if stop_time_update.HasField('arrival'):
-                        arrival = stop_time_update.arrival
-                        stop_update_info["arrival"] = {
-                            "delay": arrival.delay if arrival.HasField('delay') else None,
-                            "time": arrival.time if arrival.HasField('time') else None,
-                            "uncertainty": arrival.uncertainty if arrival.HasField('uncertainty') else None
-                        }
-
-                    # Get departure info if available
-                    if stop_time_update.HasField('departure'):
-                        departure = stop_time_update.departure
-                        stop_update_info["departure"] = {
-                            "delay": departure.delay if departure.HasField('delay') else None,
-                            "time": departure.time if departure.HasField('time') else None,
-                            "uncertainty": departure.uncertainty if departure.HasField('uncertainty') else None
-                        }
-
-                    trip_info["stop_time_updates"].append(stop_update_info)
-
-                trip_updates.append(trip_info)
-
-        return {"trip_updates": trip_updates, "count": len(trip_updates)}
+    def __init__(self, url, interval, idle_timeout, max_backoff=TRIP_UPDATES_MAX_BACKOFF):
+        self.url = url
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self.max_backoff = max_backoff
+        self.timestamp = None
+        self.view = None  # FeedView of the latest feed
+        self.by_stop = {}
+        self.loaded_at = None  # monotonic time of the last successful fetch
+        self.error = None
+        self.failed_at = None  # monotonic time of the last failed fetch
+        self.failures = 0  # fetches failed in a row
+        self.last_requested = float('-inf')
+        self._inflight = Inflight()
+        self.poller = BackgroundTask(self.poll_forever)
+
+    def is_stale(self):
+        # the poller keeps this well under two intervals old while it runs
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.interval * 2
+
+    def backing_off(self):
+        "whether the last fetch failed too recently to try again"
+        if not self.failures:
+            return False
+        backoff = min(self.interval * 2 ** (self.failures - 1), self.max_backoff)
+        return time.monotonic() - self.failed_at < backoff
+
+    async def get(self):
+        self.last_requested = time.monotonic()
+        self.poller.ensure()
+        if self.is_stale() and not self.backing_off():
+            if self.failures and self.view is not None:
+                self._inflight.start(self._refresh)
+            else:
+                await self.refresh()
+        return self
+
+    async def refresh(self):
+        await self._inflight.join(self._refresh)
+
+    async def _refresh(self):
+        try:
+            data = await make_gtfs_requests(self.url)
+            if is_error(data):
+                self.failed(data["error"])
+                return
+            timestamp = header_timestamp(data["content"])
+            if timestamp is None or timestamp != self.timestamp:
+                view = FeedView(data["content"])
+                self.view, self.by_stop = view, index_by_stop(view)
+                self.timestamp = timestamp
+            self.loaded_at = time.monotonic()
+            self.error, self.failures = None, 0
+        except Exception as e:
+            self.failed(f"Failed to parse protobuf data: {str(e)}")
+
+    def failed(self, error):
+        self.error = error
+        self.failures += 1
+        self.failed_at = time.monotonic()
+
+    async def poll_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if time.monotonic() - self.last_requested <= self.idle_timeout and not self.backing_off():
+                await self.refresh()
+
+trip_updates_feed = TripUpdatesFeed(gtfs_real_time_updates, TRIP_UPDATES_REFRESH_INTERVAL, TRIP_UPDATES_IDLE_TIMEOUT)
+
+async def get_ferry_trip_updates(route_id=None, stop_id=None):
+    """Get real-time ferry trip updates, optionally only for one route or stop"""
+    feed = await trip_updates_feed.get()
+    if feed.view is None:
+        return {"error": feed.error}
+    if stop_id is not None:
+        # the index already knows which trips stop there
+        trips = [trip for trip, _ in feed.by_stop.get(stop_id, ())]
+        trips = [trip for trip in dict.fromkeys(trips) if route_id is None or trip.route_id == route_id]
+    else:
+        trips = feed.view.trip_updates(route_id)
+    trip_updates = [trip.to_dict(stop_id) for trip in trips]
+    return {"trip_updates": trip_updates, "count": len(trip_updates)}
 
-    except Exception as e:
-        return {"error": f"Failed to parse protobuf data: {str(e)}"} 
+def nearby_stop(stop, distance):
+    return {
+        "stop_id": stop.stop_id, 
+        "name": stop.name,
+        "distance_km": round(distance, 2),
+        "routes": list(stop.routes.keys()) 
+    }
 
 async def get_nearby_ferry_stops(lat, lon, radius_km = 3):
-    nearby_stops = []
-    for stop_id, stop_info, in ferry_data["stops"].items(): 
-        distance = haversine(lat, lon, stop_info["lat"], stop_info["lon"])
-
-        if distance <= radius_km: 
-            nearby_stops.append({
-                "stop_id": stop_id, 
-                "name": stop_info["name"],
-                "distance_km": round(distance, 2),
-                "routes": list(stop_info["routes"].keys()) 
-            })
-    nearby_stops.sort(key=lambda x: x["distance_km"])
-    return nearby_stops
+    return [nearby_stop(stop, distance) for stop, distance in FERRY_INDEX.within(lat, lon, radius_km)]
 
 @mcp.tool()
 async def find_ferry_stops_nearby(latitude: float, longitude: float, radius_km: float = 1.0):
@@ -218,107 +267,219 @@ async def find_ferry_stops_nearby(latitude: float, longitude: float, radius_km:
     radius_km = float(str(radius_km).strip('"'))
 
     # Use the existing function we already wrote
-    return await get_nearby_ferry_stops(latitude, longitude, radius_km)
+    key = quantize(latitude, longitude, radius_km)
+    return await nearby_stops_cache.get(key, 0, lambda: get_nearby_ferry_stops(*key))
 
 @mcp.tool()
-async def get_ferry_departures(stop_name_or_id: str):
+async def find_ferry_stops_nearby_many(points: list, radius_km: float = 1.0):
     """
-    Get departure times for a specific ferry stop with real-time updates
+    Find ferry stops near each of several locations in one call
 
     Args:
-        stop_name_or_id: Either the stop ID (like "87") or stop name (like "Wall St/Pier 11")
+        points: list of [latitude, longitude] pairs, at most 50
+        radius_km: search radius in kilometers, default 1.0km
     """
-    from datetime import datetime, timezone
+    points = read_points(points)
+    radius_km = float(str(radius_km).strip('"'))
+    hits = FERRY_INDEX.grid.within_many([lat for lat, _ in points], [lon for _, lon in points], radius_km)
+    return [{
+        "latitude": lat,
+        "longitude": lon,
+        "stops": [
+            nearby_stop(FERRY_INDEX.stops[FERRY_INDEX.stop_ids[i]], distance)
+            for i, distance in zip(positions.tolist(), distances.tolist())
+        ]
+    } for (lat, lon), (positions, distances) in zip(points, hits)]
+
+def query_time(date="", after=""):
+    """
+    datetime in NYC for a 'YYYY-MM-DD' date and 'HH:MM' time. No date is today,
+    no time is now for today and midnight for any other day.
+    """
+    when = datetime.now(NYC_TZ)
+    if date:
+        day = datetime.strptime(date.strip(), "%Y-%m-%d").date()
+        if day != when.date():
+            when = datetime(day.year, day.month, day.day, tzinfo=NYC_TZ)
+    if after:
+        clock = datetime.strptime(after.strip(), "%H:%M")
+        when = when.replace(hour=clock.hour, minute=clock.minute, second=0)
+    return when
+
+def local_clock(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=NYC_TZ).strftime("%H:%M")
+
+def scheduled_timestamp(departure):
+    "unix time of a next_ferry_departures entry"
+    clock = datetime.strptime(f"{departure['date']} {departure['time']}", "%Y-%m-%d %H:%M")
+    return clock.replace(tzinfo=NYC_TZ).timestamp()
+
+def update_scheduled_time(stop_update):
+    "the scheduled unix time a stop time update refers to, its predicted time minus the delay"
+    for kind in ('departure', 'arrival'):
+        event_time = stop_update.event_time(kind)
+        if event_time:
+            return event_time - (stop_update.event_delay(kind) or 0)
+    return None
+
+def match_real_time(departures, updates):
+    """
+    Pair scheduled departures with (trip, stop_update)s from the trip-update feed:
+    by trip_id when the timetable has trip ids, otherwise by route and a
+    scheduled time within REAL_TIME_MATCH_SECS (the timetable built from
+    ferry_data.json has no trips). Returns [update index or None] per departure.
+    """
+    by_trip = {trip.trip_id: i for i, (trip, _) in enumerate(updates) if trip.trip_id}
+    scheduled = [update_scheduled_time(stop_update) for _, stop_update in updates]
+    used = set()
+    matches = []
+    for departure in departures:
+        match = by_trip.get(departure["trip_id"]) if departure["trip_id"] else None
+        if match is None or match in used:
+            at = scheduled_timestamp(departure)
+            candidates = [
+                (abs(scheduled[i] - at), i) for i, (trip, _) in enumerate(updates)
+                if i not in used and scheduled[i] is not None and trip.route_id == departure["route_id"]
+                and abs(scheduled[i] - at) <= REAL_TIME_MATCH_SECS
+            ]
+            match = min(candidates)[1] if candidates else None
+        if match is not None:
+            used.add(match)
+        matches.append(match)
+    return matches
+
+def real_time_info(trip, stop_update):
+    "what the trip-update feed says about one trip at one stop"
+    arrival_time = stop_update.event_time('arrival')
+    departure_time = stop_update.event_time('departure')
+    arrival_delay = stop_update.event_delay('arrival') or stop_update.event_delay('departure')
+    return {
+        "route_id": trip.route_id,
+        "vehicle_id": trip.vehicle_id,
+        "arrival_time": local_clock(arrival_time) if arrival_time else None,
+        "departure_time": local_clock(departure_time) if departure_time else None,
+        "delay_minutes": arrival_delay // 60 if arrival_delay else None  # Convert seconds to minutes
+    }
 
-    # First, find the stop - either by ID or by name
-    target_stop_id = None
-    target_stop_info = None
+@mcp.tool()
+async def get_ferry_departures(stop_name_or_id: str, date: str = "", after: str = "", limit: int = 10):
+    """
+    Get the next departures from a ferry stop, with real-time delays where available
 
-    # Check if it's a direct stop ID match
-    if stop_name_or_id in ferry_data["stops"]:
-        target_stop_id = stop_name_or_id
-        target_stop_info = ferry_data["stops"][stop_name_or_id]
-    else:
-        # Search by name (case insensitive)
-        for stop_id, stop_info in ferry_data["stops"].items():
-            if stop_name_or_id.lower() in stop_info["name"].lower():
-                target_stop_id = stop_id
-                target_stop_info = stop_info
-                break
+    Args:
+        stop_name_or_id: Either the stop ID (like "87") or stop name (like "Wall St/Pier 11")
+        date: service date as YYYY-MM-DD, default today
+        after: earliest departure time as HH:MM (24 hour, NYC time), default now
+        limit: how many departures to return, default 10
+    """
+    # First, find the stop - either by ID or by (partial) name
+    target_stop = FERRY_INDEX.find(stop_name_or_id)
 
     # If we didn't find the stop, return an error
-    if not target_stop_id:
+    if target_stop is None:
         return f"Stop '{stop_name_or_id}' not found. Try a stop ID or partial name."
+    target_stop_id = target_stop.stop_id
 
-    # Get real-time trip updates
-    trip_updates_response = await get_ferry_trip_updates()
-    real_time_data = {}
-
-    # Extract real-time data for this stop
-    if not is_error(trip_updates_response) and "trip_updates" in trip_updates_response:
-        for trip in trip_updates_response["trip_updates"]:
-            for stop_update in trip["stop_time_updates"]:
-                if stop_update["stop_id"] == target_stop_id:
-                    # Convert Unix timestamp to readable time if available
-                    arrival_time = None
-                    departure_time = None
-                    delay_minutes = None
-
-                    if stop_update.get("arrival") and stop_update["arrival"].get("time"):
-                        arrival_timestamp = stop_update["arrival"]["time"]
-                        arrival_time = datetime.fromtimestamp(arrival_timestamp, tz=timezone.utc).strftime("%H:%M")
-
-                    if stop_update.get("departure") and stop_update["departure"].get("time"):
-                        departure_timestamp = stop_update["departure"]["time"]
-                        departure_time = datetime.fromtimestamp(departure_timestamp, tz=timezone.utc).strftime("%H:%M")
-
-                    if stop_update.get("arrival") and stop_update["arrival"].get("delay"):
-                        delay_minutes = stop_update["arrival"]["delay"] // 60  # Convert seconds to minutes
-
-                    real_time_data[trip["trip_id"]] = {
-                        "route_id": trip["route_id"],
-                        "vehicle_id": trip["vehicle_id"],
-                        "arrival_time": arrival_time,
-                        "departure_time": departure_time,
-                        "delay_minutes": delay_minutes
-                    }
-
-    # Build the departure information
-    result = {
-        "stop_name": target_stop_info["name"],
+    try:
+        when = query_time(date, after)
+    except ValueError:
+        return f"Couldn't read date '{date}' / time '{after}'. Use YYYY-MM-DD and HH:MM."
+    limit = max(1, min(int(str(limit).strip('"')), 50))
+
+    # scheduled departures from the calendar of that day, by bisect on the timetable
+    departures = next_ferry_departures(target_stop_id, when, limit)
+
+    # real-time updates only describe today's boats
+    real_time_departures = []
+    if when.date() == datetime.now(NYC_TZ).date():
+        feed = await trip_updates_feed.get()
+        updates = feed.by_stop.get(target_stop_id, [])
+        matches = match_real_time(departures, updates)
+        for departure, match in zip(departures, matches):
+            if match is not None:
+                real_time = real_time_info(*updates[match])
+                departure["real_time_departure"] = real_time["departure_time"] or real_time["arrival_time"]
+                departure["delay_minutes"] = real_time["delay_minutes"]
+                departure["vehicle_id"] = real_time["vehicle_id"]
+        # updates we couldn't tie to a scheduled trip are still worth showing
+        matched = set(matches)
+        real_time_departures = [real_time_info(*update) for i, update in enumerate(updates) if i not in matched]
+
+    return {
+        "stop_name": target_stop.name,
         "stop_id": target_stop_id,
-        "real_time_departures": list(real_time_data.values()) if real_time_data else [],
-        "routes": []
+        "as_of": when.strftime("%Y-%m-%d %H:%M"),
+        "departures": departures,
+        "real_time_departures": real_time_departures,
+        "routes": [{
+            "route_id": route_id,
+            "route_name": stop_route.route.name,
+            "destinations": [
+                FERRY_INDEX.stops[dest_stop_id].name
+                for dest_stop_id in stop_route.destinations if dest_stop_id in FERRY_INDEX.stops
+            ]
+        } for route_id, stop_route in target_stop.routes.items()]
     }
 
-    # For each route serving this stop, get the schedule patterns
-    for route_id, route_info in target_stop_info["routes"].items():
-        route_result = {
+def describe_ferry_journey(journey, origin_stops, dest_stops, depart):
+    "tool output for one FerryGraph.route result"
+    total, start, end, legs = journey
+    described, steps = [], []
+    for leg in legs:
+        if leg[0] == 'walk':
+            _, src, dst, mins = leg
+            described.append({
+                "mode": "walk",
+                "from": FERRY_INDEX.stops[src].name,
+                "to": FERRY_INDEX.stops[dst].name,
+                "mins": round(mins)
+            })
+            continue
+        _, route_id, src, dst, departure, arrival, trip = leg
+        route_name = FERRY_INDEX.routes[route_id].name
+        described.append({
+            "mode": "ferry",
             "route_id": route_id,
-            "route_name": route_info["route_name"],
-            "destinations": [],
-            "static_schedules": {
-                "weekdays": route_info["schedule_patterns"]["weekdays"][:10],  # Show first 10 times
-                "weekends": route_info["schedule_patterns"]["weekends"][:10]
-            }
-        }
-
-        # Add destination stop names (not just IDs)
-        for dest_stop_id in route_info["destinations"]:
-            if dest_stop_id in ferry_data["stops"]:
-                route_result["destinations"].append({
-                    "stop_id": dest_stop_id,
-                    "name": ferry_data["stops"][dest_stop_id]["name"]
-                })
-
-        result["routes"].append(route_result)
-
-    return result
+            "route_name": route_name,
+            "from": FERRY_INDEX.stops[src].name,
+            "from_stop_id": src,
+            "to": FERRY_INDEX.stops[dst].name,
+            "to_stop_id": dst,
+            "departs": format_seconds(int(departure * 60)),
+            "arrives": format_seconds(int(arrival * 60)),
+            # without GTFS trips the arrival is estimated from the distance
+            "estimated_arrival": trip == NO_TRIP,
+            "trip_id": FERRY_TIMETABLE.trip_id(trip)
+        })
+        steps.append(f"{route_name} at {described[-1]['departs']} from {described[-1]['from']} to {described[-1]['to']}")
+
+    rides = len(steps)
+    return {
+        "type": "direct" if rides == 1 else f"{rides - 1} transfer{'s' if rides > 2 else ''}",
+        "summary": ", then ".join(steps),
+        "transfers": rides - 1,
+        "depart": format_seconds(int(depart * 60)),
+        "arrive": format_seconds(int(total * 60)),
+        "total_mins": round(total - depart),
+        "origin_stop": {
+            "name": FERRY_INDEX.stops[start].name,
+            "stop_id": start,
+            "distance_km": origin_stops[start]["distance_km"]
+        },
+        "dest_stop": {
+            "name": FERRY_INDEX.stops[end].name,
+            "stop_id": end,
+            "distance_km": dest_stops[end]["distance_km"]
+        },
+        "total_walk_distance_km": round(origin_stops[start]["distance_km"] + dest_stops[end]["distance_km"], 2),
+        "legs": described
+    }
 
 @mcp.tool()
-async def get_ferry_route_options(origin_lat: float, origin_lon: float, dest_lat: float, dest_lon: float, radius_km: float = 1.0):
+async def get_ferry_route_options(origin_lat: float, origin_lon: float, dest_lat: float, dest_lon: float, radius_km: float = 1.0,
+                                  date: str = "", after: str = "", max_transfers: int = MAX_FERRY_TRANSFERS):
     """
-    Find ferry route options between two locations
+    Find ferry trips between two locations, changing boats if needed, with scheduled departure times
 
     Args:
         origin_lat: Starting latitude
@@ -326,6 +487,9 @@ async def get_ferry_route_options(origin_lat: float, origin_lon: float, dest_lat
         dest_lat: Destination latitude
         dest_lon: Destination longitude
         radius_km: Search radius around each location in km
+        date: service date as YYYY-MM-DD, default today
+        after: leave at or after this time, HH:MM (24 hour, NYC time), default now
+        max_transfers: most changes between boats, 0 to 2, default 2
     """
     # Convert string inputs to floats (handles quoted strings from LLMs)
     origin_lat = float(str(origin_lat).strip('"'))
@@ -333,6 +497,12 @@ async def get_ferry_route_options(origin_lat: float, origin_lon: float, dest_lat
     dest_lat = float(str(dest_lat).strip('"'))
     dest_lon = float(str(dest_lon).strip('"'))
     radius_km = float(str(radius_km).strip('"'))
+    max_transfers = max(0, min(int(str(max_transfers).strip('"')), MAX_FERRY_TRANSFERS))
+
+    try:
+        when = query_time(date, after)
+    except ValueError:
+        return {"error": "date must be YYYY-MM-DD and after HH:MM"}
 
     # Find ferry stops near both origin and destination
     origin_stops = await get_nearby_ferry_stops(origin_lat, origin_lon, radius_km)
@@ -344,59 +514,38 @@ async def get_ferry_route_options(origin_lat: float, origin_lon: float, dest_lat
     if not dest_stops:
         return f"No ferry stops found within {radius_km}km of destination location."
 
-    # Find route options
-    route_options = []
-
-    # Check for direct routes (same route serves both origin and destination stops)
-    for origin_stop in origin_stops:
-        for dest_stop in dest_stops:
-            # Get routes that serve the origin stop
-            origin_routes = set(origin_stop["routes"])
-            # Get routes that serve the destination stop
-            dest_routes = set(dest_stop["routes"])
-
-            # Find shared routes (direct connection possible)
-            shared_routes = origin_routes & dest_routes
-
-            for route_id in shared_routes:
-                # Check if destination stop is actually reachable from origin stop on this route
-                origin_stop_info = ferry_data["stops"][origin_stop["stop_id"]]
-                route_info = origin_stop_info["routes"][route_id]
-
-                # If destination stop is in the destinations list, it's reachable
-                if dest_stop["stop_id"] in route_info["destinations"]:
-                    route_options.append({
-                        "type": "direct",
-                        "route_id": route_id,
-                        "route_name": route_info["route_name"],
-                        "origin_stop": {
-                            "name": origin_stop["name"],
-                            "distance_km": origin_stop["distance_km"]
-                        },
-                        "dest_stop": {
-                            "name": dest_stop["name"],
-                            "distance_km": dest_stop["distance_km"]
-                        },
-                        "total_walk_distance_km": round(origin_stop["distance_km"] + dest_stop["distance_km"], 2)
-                    })
-
-    # Sort by total walking distance (closest stops first)
-    route_options.sort(key=lambda x: x["total_walk_distance_km"])
-
-    # If no direct routes found, suggest closest stops
-    if not route_options:
-        return {
-            "message": "No direct ferry routes found between these locations.",
+    if not FERRY_GRAPH.reach:
+        return {"error": "Ferry trips can't be planned: the timetable doesn't say which way its boats go. "
+                         "Rebuild it with download_ferry_data.py."}
+
+    # walk to the nearby stops, ride with up to max_transfers changes, walk from the last stop
+    depart = when.hour * 60 + when.minute
+    journeys = FERRY_GRAPH.route(
+        {stop["stop_id"]: stop["distance_km"] * WALK_MINS_PER_KM for stop in origin_stops},
+        {stop["stop_id"]: stop["distance_km"] * WALK_MINS_PER_KM for stop in dest_stops},
+        depart, FERRY_GRAPH.service_days(when.date()), max_transfers
+    )
+
+    if not journeys:
+        no_trips = {
+            "message": f"No ferry trips found between these locations with up to {max_transfers} transfers.",
             "suggestions": {
                 "closest_origin_stops": origin_stops[:3],  # Show 3 closest
                 "closest_dest_stops": dest_stops[:3]
             }
         }
+        if FERRY_GRAPH.unknown_direction:
+            # their boats could go either way, so they aren't routed
+            no_trips["routes_without_directions"] = sorted(FERRY_GRAPH.unknown_direction)
+        return no_trips
 
+    by_id = lambda stops: {stop["stop_id"]: stop for stop in stops}
+    route_options = [describe_ferry_journey(journey, by_id(origin_stops), by_id(dest_stops), depart) for journey in journeys]
     return {
-        "route_options": route_options[:5],  # Show up to 5 best options
+        "date": when.date().isoformat(),
+        "route_options": route_options,  # fastest first for each number of transfers
         "total_options_found": len(route_options)
     }
 
 if __name__ == "__main__":
-    mcp.run(transport='stdio')
\ No newline at end of file
+    serve(mcp)
\ No newline at end of file
@@ -0,0 +1,141 @@
+import bisect
+import difflib
+import re
+
+from geo import GridIndex
+
+# spellings that mean the same thing in stop names
+TOKEN_ALIASES = {
+    "street": "st",
+    "avenue": "ave",
+    "av": "ave",
+    "boulevard": "blvd",
+    "drive": "dr",
+    "gov": "governors",
+    "east": "e",
+    "west": "w",
+}
+
+
+def normalize_name(name):
+    "lowercase, strip punctuation and fold common abbreviations so names compare loosely"
+    tokens = re.split(r"[^0-9a-z]+", name.lower())
+    return " ".join(TOKEN_ALIASES.get(token, token) for token in tokens if token)
+
+
+class FerryRoute:
+    "a ferry route, one shared instance per route_id"
+    __slots__ = ('route_id', 'name')
+
+    def __init__(self, route_id, name):
+        self.route_id = route_id
+        self.name = name
+
+
+class StopRoute:
+    "how one route serves one stop"
+    __slots__ = ('route', 'destinations', 'schedule_patterns')
+
+    def __init__(self, route, destinations, schedule_patterns):
+        self.route = route
+        self.destinations = destinations
+        self.schedule_patterns = schedule_patterns
+
+
+class FerryStop:
+    __slots__ = ('stop_id', 'name', 'lat', 'lon', 'routes')
+
+    def __init__(self, stop_id, name, lat, lon, routes):
+        self.stop_id = stop_id
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+        self.routes = routes  # route_id -> StopRoute
+
+
+class FerryIndex:
+    """
+    Lookup structures over ferry_data.json, built once at import.
+
+    - stops by ID, with interned FerryRoute objects shared between stops
+    - normalized stop names in sorted order for exact and prefix matches
+    - a sorted token list so multi-word partial names match on word prefixes
+    - a spatial grid for radius queries
+    """
+
+    def __init__(self, ferry_data):
+        self.routes = {}
+        self.stops = {}
+        for stop_id, stop_info in ferry_data["stops"].items():
+            stop_routes = {}
+            for route_id, route_info in stop_info["routes"].items():
+                route = self.routes.get(route_id)
+                if route is None:
+                    route = self.routes[route_id] = FerryRoute(route_id, route_info["route_name"])
+                stop_routes[route_id] = StopRoute(
+                    route, tuple(route_info["destinations"]), route_info["schedule_patterns"]
+                )
+            self.stops[stop_id] = FerryStop(stop_id, stop_info["name"], stop_info["lat"], stop_info["lon"], stop_routes)
+
+        self.stop_ids = list(self.stops)
+        self.grid = GridIndex([stop.lat for stop in self.stops.values()], [stop.lon for stop in self.stops.values()])
+
+        # normalized name -> stop ids (opposite-direction stops can share a name)
+        self.by_name = {}
+        self.by_token = {}
+        for stop_id, stop in self.stops.items():
+            normalized = normalize_name(stop.name)
+            self.by_name.setdefault(normalized, []).append(stop_id)
+            for token in normalized.split():
+                self.by_token.setdefault(token, set()).add(stop_id)
+        self.sorted_names = sorted(self.by_name)
+        self.sorted_tokens = sorted(self.by_token)
+
+    def _with_prefix(self, sorted_keys, prefix):
+        start = bisect.bisect_left(sorted_keys, prefix)
+        end = bisect.bisect_left(sorted_keys, prefix + "\uffff")
+        return sorted_keys[start:end]
+
+    def search(self, query, limit=5):
+        """
+        Stop ids matching a stop ID or (partial, misspelled) stop name, best first.
+        Tries exact ID, exact name, name prefix, word prefixes, then fuzzy matching.
+        """
+        query = query.strip()
+        if query in self.stops:
+            return [query]
+
+        normalized = normalize_name(query)
+        if not normalized:
+            return []
+        if normalized in self.by_name:
+            return self.by_name[normalized][:limit]
+
+        matches = []
+        for name in self._with_prefix(self.sorted_names, normalized):
+            matches.extend(self.by_name[name])
+
+        # every query word has to start some word of the stop name
+        candidates = None
+        for token in normalized.split():
+            hits = set()
+            for name_token in self._with_prefix(self.sorted_tokens, token):
+                hits |= self.by_token[name_token]
+            candidates = hits if candidates is None else candidates & hits
+        for stop_id in sorted(candidates or (), key=lambda stop_id: len(self.stops[stop_id].name)):
+            if stop_id not in matches:
+                matches.append(stop_id)
+
+        if not matches:
+            for name in difflib.get_close_matches(normalized, self.sorted_names, n=limit, cutoff=0.6):
+                matches.extend(self.by_name[name])
+        return matches[:limit]
+
+    def find(self, query):
+        "best matching FerryStop for a stop ID or name, None if nothing matches"
+        matches = self.search(query, limit=1)
+        return self.stops[matches[0]] if matches else None
+
+    def within(self, lat, lon, radius_km):
+        "[(FerryStop, distance_km)] within radius_km, closest first"
+        return [(self.stops[self.stop_ids[i]], distance) for i, distance in self.grid.within(lat, lon, radius_km)]
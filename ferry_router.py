@@ -0,0 +1,182 @@
+"""
+Ferry journeys with transfers, boarding on real timetable departures.
+
+A line is one route running one stop pattern (one direction, one sequence of
+stops) from the timetable, so a boat only reaches the stops after the one it
+was boarded at, on its own pattern. When the timetable has trips (built from
+GTFS) the arrival times are the trip's stop times, otherwise they're
+estimated from the distance sailed along the pattern. Departures whose
+pattern isn't known (a timetable built from a ferry_data.json without
+patterns) aren't ridden at all: which way those boats go would be a guess.
+Nearby stops, like the two sides of a landing, are joined by walks from the
+footpath table.
+
+The search is the round based RAPTOR in raptor.py, shared with
+subway_router.py and the planner: round k holds the earliest arrival at every stop using k boats, so the
+results are the fastest trips for each number of transfers.
+"""
+from datetime import timedelta
+
+import numpy as np
+
+from footpaths import node_key, transfer_lists
+from geo import WALK_MINS_PER_KM, haversine_many
+from ferry_timetable import NO_PATTERN, NO_TRIP
+from raptor import relax_stops, search, unwind
+
+FERRY_RIDE_MINS_PER_KM = 2.2  # ~27 km/h, only used when the timetable has no trip times
+FERRY_BOARD_MINS = 2.0
+FERRY_TRANSFER_MINS = 5.0     # getting off one boat and in line for the next
+FERRY_TRANSFER_WALK_KM = 0.5
+MAX_FERRY_TRANSFERS = 2
+
+
+class FerryGraph:
+    "the timetable's stop patterns over the ferry stops, plus the lookups to ride them"
+
+    def __init__(self, ferry_index, timetable, footpaths=None):
+        self.index = ferry_index
+        self.timetable = timetable
+        self.stop_ids = list(ferry_index.stops)
+
+        # line (route_id, pattern) -> stop -> [(downstream stop, estimated ride minutes)]
+        self.reach = {}
+        self.lines_at = {stop_id: [] for stop_id in self.stop_ids}
+        # routes with departures of unknown direction, left out of the lines
+        self.unknown_direction = set()
+        for stop_id in self.stop_ids:
+            stop = timetable.stop_positions.get(stop_id)
+            if stop is None:
+                continue
+            for _, route, _, pattern in timetable.groups_at(stop):
+                route_id = timetable.route_id(route)
+                if pattern == NO_PATTERN:
+                    self.unknown_direction.add(route_id)
+                    continue
+                line = (route_id, pattern)
+                if line not in self.reach:
+                    self.reach[line] = self.downstream(pattern)
+                if stop_id in self.reach[line] and line not in self.lines_at[stop_id]:
+                    self.lines_at[stop_id].append(line)
+
+        # stop -> [(stop, walk minutes)] to the other stops within FERRY_TRANSFER_WALK_KM
+        walks = transfer_lists(footpaths, [node_key('ferry', stop_id) for stop_id in self.stop_ids], FERRY_TRANSFER_WALK_KM)
+        if walks is None:
+            grid = ferry_index.grid
+            walks = [
+                [(j, km, km * WALK_MINS_PER_KM) for j, km in grid.within(stop.lat, stop.lon, FERRY_TRANSFER_WALK_KM) if j != i]
+                for i, stop in enumerate(ferry_index.stops.values())
+            ]
+        self.walks = {
+            stop_id: [(self.stop_ids[j], mins) for j, _, mins in row] for stop_id, row in zip(self.stop_ids, walks)
+        }
+        self.position = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+        self.footpaths = [[(j, mins) for j, _, mins in row] for row in walks]
+
+    def downstream(self, pattern):
+        "stop -> [(later stop, estimated minutes)] along a pattern, sailing from stop to stop"
+        stops = [self.timetable.stop_id(stop) for stop in self.timetable.pattern_stops_of(pattern)]
+        stops = [self.index.stops[stop_id] for stop_id in stops if stop_id in self.index.stops]
+        sailed = [0.0]
+        for previous, stop in zip(stops, stops[1:]):
+            sailed.append(sailed[-1] + float(haversine_many(previous.lat, previous.lon, [stop.lat], [stop.lon])[0]))
+        reach = {}
+        for i, stop in enumerate(stops[:-1]):
+            # a stop called at twice keeps the stops after its first call
+            reach.setdefault(stop.stop_id, [
+                (later.stop_id, FERRY_BOARD_MINS + (km - sailed[i]) * FERRY_RIDE_MINS_PER_KM)
+                for later, km in zip(stops[i + 1:], sailed[i + 1:])
+            ])
+        return reach
+
+    def service_days(self, date):
+        "(minute offset, active services) for yesterday, today and tomorrow relative to `date`"
+        return [
+            (offset * 24 * 60, self.timetable.active_services(date + timedelta(days=offset)))
+            for offset in (-1, 0, 1)
+        ]
+
+    def next_boat(self, stop_id, line, ready, service_days):
+        "(departure minute, trip, minute offset of its service day) of the line's first boat at or after `ready`"
+        route_id, pattern = line
+        best = None
+        for offset, services in service_days:
+            after = max(int((ready - offset) * 60 + 59) // 60 * 60, 0)
+            for seconds, _, trip in self.timetable.next_departures(stop_id, after, services, 1, route_id, pattern):
+                departure = seconds / 60 + offset
+                if best is None or departure < best[0]:
+                    best = (departure, trip, offset)
+        return best
+
+    def arrivals(self, stop_id, line, departure, trip, offset):
+        "[(stop, arrival minute)] downstream of a boarding on `trip`, estimated along the line when trip times are unknown"
+        if trip == NO_TRIP:
+            return [(target, departure + mins) for target, mins in self.reach[line][stop_id]]
+        stop_times = self.timetable.trip_stop_times(trip)
+        stop_ids = [self.timetable.stop_id(stop) for stop, _ in stop_times]
+        boarded = stop_ids.index(stop_id)
+        return [
+            (target, seconds / 60 + offset)
+            for target, (_, seconds) in zip(stop_ids[boarded + 1:], stop_times[boarded + 1:])
+            if target in self.index.stops
+        ]
+
+    def route(self, origins, destinations, depart, service_days, max_transfers=MAX_FERRY_TRANSFERS):
+        """
+        Fastest trips from origin stops to destination stops, one per transfer count
+        that beats every trip with fewer transfers.
+
+        origins / destinations: {stop_id: walk minutes to / from that stop}
+        depart: minutes after midnight of the service date `service_days` was made for
+        Returns [(arrival minute at the destination point, first stop, last stop, legs)],
+        legs being ('ferry', route_id, from, to, departure, arrival, trip) or
+        ('walk', from, to, minutes) tuples.
+        """
+        rounds = max_transfers + 1
+        access = np.full(len(self.stop_ids), np.inf)
+        for stop_id, mins in origins.items():
+            access[self.position[stop_id]] = depart + mins
+
+        def scan(k, marked, previous, best, arrivals, parents):
+            transfer = FERRY_TRANSFER_MINS if k > 1 else 0.0
+            for i in marked:
+                stop_id = self.stop_ids[i]
+                for line in self.lines_at[stop_id]:
+                    boat = self.next_boat(stop_id, line, previous[i] + transfer, service_days)
+                    if boat is None:
+                        continue
+                    departure, trip, offset = boat
+                    stop_arrivals = [(self.position[target], arrival)
+                                     for target, arrival in self.arrivals(stop_id, line, departure, trip, offset)]
+                    for target, arrival in relax_stops(stop_arrivals, arrivals, best):
+                        parents[target] = (i, (line[0], departure, arrival, trip))
+
+        tau, ride_parent, walk_parent = search(access, rounds, scan, self.footpaths)
+
+        ends = [self.position[stop_id] for stop_id in destinations]
+        egress = np.array([destinations[stop_id] for stop_id in destinations])
+        journeys = []
+        fastest = float('inf')
+        for k in range(1, rounds + 1):
+            totals = tau[k, ends] + egress
+            j = int(totals.argmin()) if len(ends) else None
+            if j is None or not np.isfinite(totals[j]):
+                continue
+            if totals[j] < fastest - 0.5:
+                fastest = float(totals[j])
+                start, legs = self.unwind(k, ends[j], ride_parent, walk_parent)
+                journeys.append((fastest, start, self.stop_ids[ends[j]], legs))
+        return journeys
+
+    def unwind(self, k, position, ride_parent, walk_parent):
+        "(first stop, legs) for the label of a stop in round k"
+        start, steps = unwind(k, position, ride_parent, walk_parent)
+        legs = []
+        for kind, src, dst, ride in steps:
+            src, dst = self.stop_ids[src], self.stop_ids[dst]
+            if kind == 'ride':
+                route_id, departure, arrival, trip = ride
+                legs.append(('ferry', route_id, src, dst, departure, arrival, trip))
+            else:
+                legs.append(('walk', src, dst, next(mins for other, mins in self.walks[src] if other == dst)))
+        return self.stop_ids[start], legs
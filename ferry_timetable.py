@@ -0,0 +1,364 @@
+"""
+Compact binary ferry timetable, written by download_ferry_data.py next to ferry_data.json.
+
+Times are integer seconds after midnight of the service day (GTFS times past
+24:00 stay above 86400) in arrays sorted per (stop, route, service), so "next
+departures after t" is a bisect instead of parsing and scanning "HH:MM:SS"
+strings. Stop, route, service and trip IDs live in a shared string table.
+
+The file is a binary_tables.py section file with magic "FTT1"; loading
+mmaps it and casts memoryviews over the sections, so nothing is parsed or
+copied at startup.
+
+Departure groups are sorted by stop, `group_stop_offsets[s]:group_stop_offsets[s+1]`
+are the groups of stop s and `group_offsets[g]:group_offsets[g+1]` the
+departures of group g. Trips are only present when built from GTFS, a
+departure without one has trip index NO_TRIP.
+
+Each group also has the stop pattern its boats run (one route, one
+direction, one sequence of stops, `pattern_offsets[p]:pattern_offsets[p+1]`
+of pattern_stops), so a departure without a trip still says where it goes.
+Groups built from a ferry_data.json that predates patterns have NO_PATTERN:
+those departures are known, their direction isn't.
+
+python -m ferry_timetable rebuilds data/ferry_timetable.bin from data/ferry_data.json.
+"""
+import array
+import bisect
+import json
+
+from binary_tables import load_sections, save_sections
+
+MAGIC = b"FTT2"
+NO_TRIP = 0xFFFFFFFF
+NO_PATTERN = 0xFFFFFFFF
+NO_DIRECTION = 0xFF  # pattern_directions value when the feed has no direction_id
+
+# service_days bit per date.weekday(), monday is bit 0
+WEEKDAYS = 0b0011111
+WEEKENDS = 0b1100000
+DAY_COLUMNS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+ALWAYS = (0, 99991231)  # service date range when the source has none
+
+SECTIONS = {
+    'strings': 'B', 'string_offsets': 'I',
+    'stop_ids': 'I', 'stop_names': 'I', 'stop_lats': 'd', 'stop_lons': 'd',
+    'route_ids': 'I', 'route_names': 'I',
+    'service_ids': 'I', 'service_days': 'B', 'service_start': 'I', 'service_end': 'I',
+    'exception_services': 'I', 'exception_dates': 'I', 'exception_types': 'B',
+    'pattern_routes': 'I', 'pattern_directions': 'B', 'pattern_offsets': 'I', 'pattern_stops': 'I',
+    'trip_ids': 'I', 'trip_routes': 'I', 'trip_services': 'I', 'trip_patterns': 'I', 'trip_offsets': 'I',
+    'trip_stops': 'I', 'trip_times': 'I',
+    'group_stop_offsets': 'I', 'group_routes': 'I', 'group_services': 'I', 'group_patterns': 'I', 'group_offsets': 'I',
+    'departure_times': 'I', 'departure_trips': 'I',
+}
+
+
+def parse_gtfs_time(value):
+    "'HH:MM:SS' -> seconds after midnight, hours may run past 24"
+    hours, minutes, seconds = value.strip().split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def format_seconds(seconds):
+    "seconds after midnight -> 'HH:MM', wrapping times past midnight"
+    seconds %= 24 * 3600
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}"
+
+
+def yyyymmdd(date):
+    return date.year * 10000 + date.month * 100 + date.day
+
+
+class TimetableBuilder:
+    "collects rows into typed arrays and a string table"
+
+    def __init__(self):
+        self.arrays = {name: array.array(typecode) for name, typecode in SECTIONS.items()}
+        self.arrays['pattern_offsets'].append(0)
+        self._strings = {}
+        self._patterns = {}
+
+    def string(self, value):
+        value = str(value)
+        index = self._strings.get(value)
+        if index is None:
+            index = self._strings[value] = len(self._strings)
+            encoded = value.encode('utf-8')
+            if not self.arrays['string_offsets']:
+                self.arrays['string_offsets'].append(0)
+            self.arrays['strings'].frombytes(encoded)
+            self.arrays['string_offsets'].append(len(self.arrays['strings']))
+        return index
+
+    def pattern(self, route, direction, stops):
+        "position of the pattern of `route` running through stop positions `stops`, added on first use"
+        key = (route, direction, tuple(stops))
+        pattern = self._patterns.get(key)
+        if pattern is None:
+            pattern = self._patterns[key] = len(self._patterns)
+            self.arrays['pattern_routes'].append(route)
+            self.arrays['pattern_directions'].append(direction)
+            self.arrays['pattern_stops'].extend(stops)
+            self.arrays['pattern_offsets'].append(len(self.arrays['pattern_stops']))
+        return pattern
+
+    def add_departure_groups(self, stop_count, groups):
+        "groups: {(stop, route, service, pattern): [(seconds, trip)]}, in any order"
+        stop_offsets = self.arrays['group_stop_offsets']
+        group_offsets = self.arrays['group_offsets']
+        group_offsets.append(0)
+        ordered = sorted(groups)
+        position = 0
+        for stop in range(stop_count):
+            stop_offsets.append(position)
+            while position < len(ordered) and ordered[position][0] == stop:
+                _, route, service, pattern = ordered[position]
+                departures = sorted(groups[ordered[position]])
+                self.arrays['group_routes'].append(route)
+                self.arrays['group_services'].append(service)
+                self.arrays['group_patterns'].append(pattern)
+                self.arrays['departure_times'].extend(seconds for seconds, _ in departures)
+                self.arrays['departure_trips'].extend(trip for _, trip in departures)
+                group_offsets.append(len(self.arrays['departure_times']))
+                position += 1
+        stop_offsets.append(position)
+
+
+def build_timetable(ferry_data, gtfs_data=None):
+    """
+    Sections for the binary timetable. Stops and routes follow ferry_data; with
+    the GTFS tables, services, exceptions and trips come from the feed, and
+    each trip's pattern from its stops and direction_id. Otherwise the
+    weekdays/weekends schedule lists become two open-ended services, split by
+    ferry_data's patterns when it has them.
+    """
+    builder = TimetableBuilder()
+    arrays = builder.arrays
+
+    stop_positions = {}
+    route_positions = {}
+    for stop_id, stop in ferry_data["stops"].items():
+        stop_positions[stop_id] = len(stop_positions)
+        arrays['stop_ids'].append(builder.string(stop_id))
+        arrays['stop_names'].append(builder.string(stop["name"]))
+        arrays['stop_lats'].append(float(stop["lat"]))
+        arrays['stop_lons'].append(float(stop["lon"]))
+        for route_id, route in stop["routes"].items():
+            if route_id not in route_positions:
+                route_positions[route_id] = len(route_positions)
+                arrays['route_ids'].append(builder.string(route_id))
+                arrays['route_names'].append(builder.string(route["route_name"]))
+
+    groups = {}
+    if gtfs_data is None:
+        for service_id, days in (("weekdays", WEEKDAYS), ("weekends", WEEKENDS)):
+            arrays['service_ids'].append(builder.string(service_id))
+            arrays['service_days'].append(days)
+            arrays['service_start'].append(ALWAYS[0])
+            arrays['service_end'].append(ALWAYS[1])
+        patterns = [
+            builder.pattern(route_positions[pattern["route_id"]],
+                            NO_DIRECTION if pattern["direction_id"] is None else pattern["direction_id"],
+                            [stop_positions[stop_id] for stop_id in pattern["stops"] if stop_id in stop_positions])
+            for pattern in ferry_data.get("patterns", ())
+        ]
+        for stop_id, stop in ferry_data["stops"].items():
+            for route_id, route in stop["routes"].items():
+                if "pattern_schedules" in route:
+                    schedules = [(patterns[int(key)], by_day) for key, by_day in route["pattern_schedules"].items()]
+                else:
+                    schedules = [(NO_PATTERN, route["schedule_patterns"])]
+                for pattern, by_day in schedules:
+                    for service, service_id in enumerate(("weekdays", "weekends")):
+                        times = by_day[service_id]
+                        if times:
+                            groups[(stop_positions[stop_id], route_positions[route_id], service, pattern)] = [
+                                (parse_gtfs_time(value), NO_TRIP) for value in times
+                            ]
+    else:
+        calendar_df = gtfs_data['calendar']
+        service_positions = {}
+        for row in calendar_df.itertuples(index=False):
+            service_positions[row.service_id] = len(service_positions)
+            days = sum(1 << bit for bit, column in enumerate(DAY_COLUMNS) if getattr(row, column, 0) == 1)
+            arrays['service_ids'].append(builder.string(row.service_id))
+            arrays['service_days'].append(days)
+            arrays['service_start'].append(int(getattr(row, 'start_date', ALWAYS[0])))
+            arrays['service_end'].append(int(getattr(row, 'end_date', ALWAYS[1])))
+
+        calendar_dates_df = gtfs_data.get('calendar_dates')
+        if calendar_dates_df is not None:
+            for row in calendar_dates_df.itertuples(index=False):
+                if row.service_id not in service_positions:
+                    service_positions[row.service_id] = len(service_positions)
+                    arrays['service_ids'].append(builder.string(row.service_id))
+                    arrays['service_days'].append(0)
+                    arrays['service_start'].append(ALWAYS[0])
+                    arrays['service_end'].append(ALWAYS[1])
+                arrays['exception_services'].append(service_positions[row.service_id])
+                arrays['exception_dates'].append(int(row.date))
+                arrays['exception_types'].append(int(row.exception_type))
+
+        trips_df = gtfs_data['trips']
+        trip_columns = ['trip_id', 'route_id', 'service_id'] + (['direction_id'] if 'direction_id' in trips_df else [])
+        stop_times = gtfs_data['stop_times'].merge(trips_df[trip_columns], on='trip_id', how='inner')
+        stop_times['direction_id'] = stop_times['direction_id'].fillna(NO_DIRECTION) if 'direction_id' in stop_times else NO_DIRECTION
+        stop_times['stop_key'] = stop_times['stop_id'].astype(str)
+        stop_times['route_key'] = stop_times['route_id'].astype(str)
+        stop_times = stop_times[
+            stop_times['stop_key'].isin(stop_positions.keys())
+            & stop_times['route_key'].isin(route_positions.keys())
+            & stop_times['service_id'].isin(service_positions.keys())
+        ]
+        times = stop_times['departure_time']
+        if 'arrival_time' in stop_times:
+            times = times.fillna(stop_times['arrival_time'])
+        stop_times = stop_times.assign(seconds=times.map(parse_gtfs_time))
+        stop_times = stop_times.sort_values(['trip_id', 'stop_sequence'], kind='stable')
+
+        arrays['trip_offsets'].append(0)
+        for trip_id, trip_rows in stop_times.groupby('trip_id', sort=False):
+            trip = len(arrays['trip_ids'])
+            route = route_positions[trip_rows['route_key'].iloc[0]]
+            service = service_positions[trip_rows['service_id'].iloc[0]]
+            stops = [stop_positions[stop_key] for stop_key in trip_rows['stop_key']]
+            pattern = builder.pattern(route, int(trip_rows['direction_id'].iloc[0]), stops)
+            arrays['trip_ids'].append(builder.string(trip_id))
+            arrays['trip_routes'].append(route)
+            arrays['trip_services'].append(service)
+            arrays['trip_patterns'].append(pattern)
+            for stop, seconds in zip(stops, trip_rows['seconds']):
+                arrays['trip_stops'].append(stop)
+                arrays['trip_times'].append(int(seconds))
+                groups.setdefault((stop, route, service, pattern), []).append((int(seconds), trip))
+            arrays['trip_offsets'].append(len(arrays['trip_stops']))
+
+    builder.add_departure_groups(len(stop_positions), groups)
+    return arrays
+
+
+def save_timetable(path, arrays):
+    save_sections(path, MAGIC, [(name, arrays[name]) for name in SECTIONS])
+
+
+class FerryTimetable:
+    "read-only view over a timetable file, or over freshly built arrays"
+
+    def __init__(self, sections, source=None):
+        self.source = source  # mmap kept alive for the memoryviews
+        for name in SECTIONS:
+            setattr(self, name, sections[name])
+
+        self._string_cache = {}
+        self.stop_positions = {self.string(index): stop for stop, index in enumerate(self.stop_ids)}
+        self.route_positions = {self.string(index): route for route, index in enumerate(self.route_ids)}
+        self.service_positions = {self.string(index): service for service, index in enumerate(self.service_ids)}
+        self._trip_positions = None
+
+    @classmethod
+    def load(cls, path):
+        sections, source = load_sections(path, MAGIC)
+        return cls(sections, source)
+
+    @classmethod
+    def from_ferry_data(cls, ferry_data):
+        return cls(build_timetable(ferry_data))
+
+    def string(self, index):
+        value = self._string_cache.get(index)
+        if value is None:
+            start, end = self.string_offsets[index], self.string_offsets[index + 1]
+            value = self._string_cache[index] = bytes(self.strings[start:end]).decode('utf-8')
+        return value
+
+    def stop_id(self, stop):
+        return self.string(self.stop_ids[stop])
+
+    def route_id(self, route):
+        return self.string(self.route_ids[route])
+
+    def route_name(self, route):
+        return self.string(self.route_names[route])
+
+    def trip_id(self, trip):
+        return None if trip == NO_TRIP else self.string(self.trip_ids[trip])
+
+    def trip_position(self, trip_id):
+        if self._trip_positions is None:
+            self._trip_positions = {self.string(index): trip for trip, index in enumerate(self.trip_ids)}
+        return self._trip_positions.get(trip_id)
+
+    def service_runs(self, service, date):
+        "whether a service runs on a datetime.date, calendar_dates exceptions included"
+        day = yyyymmdd(date)
+        for n in range(len(self.exception_services)):
+            if self.exception_services[n] == service and self.exception_dates[n] == day:
+                return self.exception_types[n] == 1
+        return (
+            self.service_start[service] <= day <= self.service_end[service]
+            and bool(self.service_days[service] & (1 << date.weekday()))
+        )
+
+    def active_services(self, date):
+        return {service for service in range(len(self.service_ids)) if self.service_runs(service, date)}
+
+    def groups_at(self, stop):
+        "(group, route, service, pattern) for every departure group at a stop position"
+        for group in range(self.group_stop_offsets[stop], self.group_stop_offsets[stop + 1]):
+            yield group, self.group_routes[group], self.group_services[group], self.group_patterns[group]
+
+    def pattern_stops_of(self, pattern):
+        "stop positions of a pattern in the order its boats call at them"
+        return self.pattern_stops[self.pattern_offsets[pattern]:self.pattern_offsets[pattern + 1]].tolist()
+
+    def direction_id(self, pattern):
+        direction = self.pattern_directions[pattern]
+        return None if direction == NO_DIRECTION else direction
+
+    def departures_after(self, group, seconds, limit):
+        "[(seconds, trip)] of the next `limit` departures of a group at or after `seconds`"
+        start, end = self.group_offsets[group], self.group_offsets[group + 1]
+        first = bisect.bisect_left(self.departure_times, seconds, start, end)
+        last = min(first + limit, end)
+        return list(zip(self.departure_times[first:last].tolist(), self.departure_trips[first:last].tolist()))
+
+    def trip_stop_times(self, trip):
+        "[(stop, seconds)] along a trip in stop order"
+        start, end = self.trip_offsets[trip], self.trip_offsets[trip + 1]
+        return list(zip(self.trip_stops[start:end].tolist(), self.trip_times[start:end].tolist()))
+
+    def next_departures(self, stop_id, after, services, limit=5, route_id=None, pattern=None):
+        """
+        The next `limit` departures from a stop at or after `after` seconds, over
+        the given service positions, as [(seconds, route, trip)] in time order.
+        Only the boats of `route_id` if given, and of `pattern` if given.
+        """
+        stop = self.stop_positions.get(stop_id)
+        if stop is None:
+            return []
+        if route_id is not None:
+            route_filter = self.route_positions.get(route_id)
+            if route_filter is None:
+                return []  # a route the timetable doesn't know runs no boats here
+        merged = []
+        for group, route, service, group_pattern in self.groups_at(stop):
+            if service in services and (route_id is None or route == route_filter) and pattern in (None, group_pattern):
+                merged.extend((seconds, route, trip) for seconds, trip in self.departures_after(group, after, limit))
+        merged.sort()
+        return merged[:limit]
+
+
+def load_or_build(path, ferry_data):
+    "the timetable file if it is there, otherwise the same tables built from ferry_data in memory"
+    try:
+        return FerryTimetable.load(path)
+    except (FileNotFoundError, ValueError):
+        return FerryTimetable.from_ferry_data(ferry_data)
+
+
+if __name__ == "__main__":
+    with open('data/ferry_data.json', 'r') as f:
+        ferry_data = json.load(f)
+    save_timetable('data/ferry_timetable.bin', build_timetable(ferry_data))
+    print("Ferry timetable saved to data/ferry_timetable.bin")
@@ -0,0 +1,158 @@
+"""
+Precomputed walking transfers between subway complexes, ferry stops and Citi Bike docks.
+
+For every node the table holds all other nodes within FOOTPATH_CUTOFF_KM,
+closest first, with the distance in meters and the walking time in seconds,
+so the routers look transfers up instead of measuring geometry at startup or
+per query. Nodes are keyed "subway:<complex id>", "ferry:<stop id>" and
+"bike:<station id>".
+
+The file is a binary_tables.py section file with magic "FWP1"; row i of the
+adjacency is `targets[offsets[i]:offsets[i+1]]`, with `meters` and
+`walk_seconds` alongside.
+
+python -m footpaths rebuilds data/footpaths.bin from the stations CSV,
+data/ferry_data.json and Citi Bike's station_information (docks are left out
+when it can't be fetched). Docks come and go, so rebuild it now and then;
+callers fall back to measuring for anything the table doesn't cover.
+"""
+import array
+import asyncio
+import json
+import os
+
+from binary_tables import load_sections, pack_strings, save_sections, unpack_string
+from geo import WALK_MINS_PER_KM, GridIndex
+
+MAGIC = b"FWP1"
+FOOTPATHS_PATH = 'data/footpaths.bin'
+FOOTPATH_CUTOFF_KM = float(os.environ.get("FOOTPATH_CUTOFF_KM", "1.0"))
+
+SECTIONS = {
+    'keys': 'B', 'key_offsets': 'I', 'lats': 'd', 'lons': 'd', 'cutoff_meters': 'I',
+    'offsets': 'I', 'targets': 'I', 'meters': 'H', 'walk_seconds': 'H',
+}
+
+
+def node_key(kind, node_id):
+    return f"{kind}:{node_id}"
+
+
+def build_footpaths(points, cutoff_km=FOOTPATH_CUTOFF_KM):
+    "sections for the table, points: [(key, lat, lon)]"
+    keys = [key for key, _, _ in points]
+    arrays = {name: array.array(typecode) for name, typecode in SECTIONS.items()}
+    arrays['keys'], arrays['key_offsets'] = pack_strings(keys)
+    arrays['lats'].extend(float(lat) for _, lat, _ in points)
+    arrays['lons'].extend(float(lon) for _, _, lon in points)
+    arrays['cutoff_meters'].append(round(cutoff_km * 1000))
+
+    grid = GridIndex(arrays['lats'], arrays['lons'])
+    arrays['offsets'].append(0)
+    for i, (_, lat, lon) in enumerate(points):
+        for j, km in grid.within(lat, lon, cutoff_km):
+            if j != i:
+                arrays['targets'].append(j)
+                arrays['meters'].append(min(round(km * 1000), 0xFFFF))
+                arrays['walk_seconds'].append(min(round(km * WALK_MINS_PER_KM * 60), 0xFFFF))
+        arrays['offsets'].append(len(arrays['targets']))
+    return arrays
+
+
+def save_footpaths(path, arrays):
+    save_sections(path, MAGIC, [(name, arrays[name]) for name in SECTIONS])
+
+
+class FootpathTable:
+    "read-only view over a footpath file, or over freshly built arrays"
+
+    def __init__(self, sections, source=None):
+        self.source = source  # mmap kept alive for the memoryviews
+        for name in SECTIONS:
+            setattr(self, name, sections[name])
+        self.cutoff_km = self.cutoff_meters[0] / 1000
+        self.node_keys = [unpack_string(self.keys, self.key_offsets, i) for i in range(len(self.key_offsets) - 1)]
+        self.position = {key: i for i, key in enumerate(self.node_keys)}
+        self.kinds = {key.partition(':')[0] for key in self.node_keys}
+
+    @classmethod
+    def load(cls, path):
+        sections, source = load_sections(path, MAGIC)
+        return cls(sections, source)
+
+    def __len__(self):
+        return len(self.node_keys)
+
+    def covers(self, keys, max_km):
+        "whether every key is a node and walks up to max_km are all in the table"
+        return max_km <= self.cutoff_km and all(key in self.position for key in keys)
+
+    def neighbors(self, key, max_km=None, kind=None):
+        "[(key, km, walk minutes)] around a node, closest first, [] for unknown keys"
+        i = self.position.get(key)
+        if i is None:
+            return []
+        max_meters = self.cutoff_meters[0] if max_km is None else max_km * 1000
+        prefix = None if kind is None else f"{kind}:"
+        hits = []
+        for n in range(self.offsets[i], self.offsets[i + 1]):
+            meters = self.meters[n]
+            if meters > max_meters:
+                break
+            other = self.node_keys[self.targets[n]]
+            if prefix is None or other.startswith(prefix):
+                hits.append((other, meters / 1000, self.walk_seconds[n] / 60))
+        return hits
+
+
+def transfer_lists(table, keys, max_km):
+    """
+    position -> [(position, km, walk minutes)] between the caller's nodes (`keys`
+    in the caller's order), or None when there's no table or it doesn't cover them.
+    """
+    if table is None or not table.covers(keys, max_km):
+        return None
+    position = {key: i for i, key in enumerate(keys)}
+    return [
+        [(position[other], km, mins) for other, km, mins in table.neighbors(key, max_km) if other in position]
+        for key in keys
+    ]
+
+
+def load_footpaths(path=FOOTPATHS_PATH):
+    "the table, or None if the file hasn't been built (or is from an older layout)"
+    try:
+        return FootpathTable.load(path)
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+FOOTPATHS = load_footpaths()
+
+
+async def collect_points():
+    "[(key, lat, lon)] for every subway complex, ferry stop and Citi Bike dock"
+    import citibikes
+    import http_client
+    from subway_stations import load_stations
+
+    points = [(node_key('subway', station.complex_id), station.lat, station.lon) for station in load_stations()]
+    with open('data/ferry_data.json', 'r') as f:
+        ferry_data = json.load(f)
+    points += [(node_key('ferry', stop_id), float(stop['lat']), float(stop['lon'])) for stop_id, stop in ferry_data['stops'].items()]
+
+    try:
+        stations = await citibikes.get_station_info()
+    finally:
+        await http_client.aclose()
+    if citibikes.is_error(stations):
+        print(f"Citi Bike stations unavailable, leaving docks out: {stations['error']}")
+    else:
+        points += [(node_key('bike', s['station_id']), s['lat'], s['lon']) for s in stations['data']['stations']]
+    return points
+
+
+if __name__ == "__main__":
+    arrays = build_footpaths(asyncio.run(collect_points()))
+    save_footpaths(FOOTPATHS_PATH, arrays)
+    print(f"Footpaths for {len(arrays['key_offsets']) - 1} nodes ({len(arrays['targets'])} walks) saved to {FOOTPATHS_PATH}")
@@ -0,0 +1,253 @@
+import math
+import numpy as np
+
+# Radius of earth in kilometers
+EARTH_RADIUS_KM = 6371
+KM_PER_DEG_LAT = math.pi * EARTH_RADIUS_KM / 180
+# walking pace every tool and router times walks with, ~5 km/h
+WALK_MINS_PER_KM = 12
+# GridIndex.nearest measures every point once it would have to search more rings than this
+NEAREST_MAX_RINGS = 8
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Calculate the great circle distance between two points
+    on the earth (specified in decimal degrees)
+    Returns distance in kilometers
+    """
+    # Convert decimal degrees to radians
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+
+    # Haversine formula
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+    c = 2 * math.asin(math.sqrt(a))
+
+    return c * EARTH_RADIUS_KM
+
+
+def haversine_many(lat, lon, lats, lons):
+    """
+    Great circle distance in km from one point to arrays of points.
+    Vectorized version of `haversine`; lats/lons can be any array-like of decimal degrees.
+    """
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lons, dtype=np.float64))
+
+    a = np.sin((lat2 - lat1) / 2)**2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def equirectangular_many(lat, lon, lats, lons):
+    """
+    Flat-earth approximation of `haversine_many`, only one cos for the whole batch.
+    Within a few km (anything inside the city) it is off by well under 0.1%,
+    which makes it a good pre-filter before computing exact distances.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    x = (lons - lon) * math.cos(math.radians(lat))
+    y = lats - lat
+    return KM_PER_DEG_LAT * np.hypot(x, y)
+
+
+def points_within(lat, lon, lats, lons, radius_km):
+    """
+    (positions, distances_km) of the points within radius_km, closest first.
+    Uses the equirectangular fast path to discard far points before the exact haversine.
+    """
+    rough = equirectangular_many(lat, lon, lats, lons)
+    # the flat approximation slightly overestimates east-west distances, pad the cut
+    candidates = np.flatnonzero(rough <= radius_km * 1.01)
+    distances = haversine_many(lat, lon, np.asarray(lats)[candidates], np.asarray(lons)[candidates])
+
+    keep = distances <= radius_km
+    candidates, distances = candidates[keep], distances[keep]
+    order = np.argsort(distances, kind="stable")
+    return candidates[order], distances[order]
+
+
+
+def haversine_pairs(lats1, lons1, lats2, lons2):
+    "great circle distance in km between each pair of points, element by element"
+    lat1 = np.radians(np.asarray(lats1, dtype=np.float64))
+    lon1 = np.radians(np.asarray(lons1, dtype=np.float64))
+    lat2 = np.radians(np.asarray(lats2, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lons2, dtype=np.float64))
+
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def group_by_query(n_queries, queries, positions, distances, radius_km):
+    """
+    Split (query, position, distance) candidate triples into one
+    (positions, distances_km) pair per query, within radius_km, closest first.
+    """
+    keep = distances <= radius_km
+    queries, positions, distances = queries[keep], positions[keep], distances[keep]
+    order = np.lexsort((distances, queries))
+    queries, positions, distances = queries[order], positions[order], distances[order]
+    bounds = np.searchsorted(queries, np.arange(n_queries + 1)).tolist()
+    return [(positions[start:end], distances[start:end]) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def points_within_many(query_lats, query_lons, lats, lons, radius_km):
+    """
+    `points_within` for several query points at once, one (positions, distances_km)
+    pair per query. The equirectangular cut runs as one query x point matrix and
+    the exact haversine once over the pairs that pass it, instead of a round of
+    numpy calls per query. For a few hundred points; over more, GridIndex.within_many.
+    """
+    query_lats = np.asarray(query_lats, dtype=np.float64)
+    query_lons = np.asarray(query_lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    x = (lons[None, :] - query_lons[:, None]) * np.cos(np.radians(query_lats))[:, None]
+    y = lats[None, :] - query_lats[:, None]
+    # in degrees of latitude, padded like points_within
+    cut = radius_km * 1.01 / KM_PER_DEG_LAT
+    queries, positions = np.nonzero(x * x + y * y <= cut * cut)
+    distances = haversine_pairs(query_lats[queries], query_lons[queries], lats[positions], lons[positions])
+    return group_by_query(len(query_lats), queries, positions, distances, radius_km)
+
+
+class GridIndex:
+    """
+    Uniform lat/lon grid over a fixed set of points.
+
+    Points are bucketed into cells roughly `cell_km` on a side, so radius and
+    k-nearest queries only measure the points in the few cells around the query
+    instead of every point. Results are (position, distance_km) pairs where
+    position is the point's index in the lists the grid was built from.
+    """
+
+    def __init__(self, lats, lons, cell_km=0.5):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.cell_km = cell_km
+
+        mean_lat = float(self.lats.mean()) if len(self.lats) else 0.0
+        self.cell_lat = cell_km / KM_PER_DEG_LAT
+        self.cell_lon = cell_km / (KM_PER_DEG_LAT * math.cos(math.radians(mean_lat)))
+
+        self.cells = {}
+        rows = np.floor(self.lats / self.cell_lat).astype(np.int64)
+        cols = np.floor(self.lons / self.cell_lon).astype(np.int64)
+        for i, cell in enumerate(zip(rows.tolist(), cols.tolist())):
+            self.cells.setdefault(cell, []).append(i)
+
+        if self.cells:
+            rows = [row for row, _ in self.cells]
+            cols = [col for _, col in self.cells]
+            self.bounds = (min(rows), max(rows), min(cols), max(cols))
+        else:
+            self.bounds = (0, -1, 0, -1)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_lat), math.floor(lon / self.cell_lon))
+
+    def _measure(self, lat, lon, positions):
+        if not positions:
+            return []
+        distances = haversine_many(lat, lon, self.lats[positions], self.lons[positions])
+        return list(zip(positions, distances.tolist()))
+
+    def _candidates(self, lat, lon, radius_km):
+        "positions in the cells overlapping the box around the radius"
+        lat_margin = radius_km / KM_PER_DEG_LAT
+        lon_margin = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        min_row, min_col = self._cell(lat - lat_margin, lon - lon_margin)
+        max_row, max_col = self._cell(lat + lat_margin, lon + lon_margin)
+
+        candidates = []
+        for row in range(max(min_row, self.bounds[0]), min(max_row, self.bounds[1]) + 1):
+            for col in range(max(min_col, self.bounds[2]), min(max_col, self.bounds[3]) + 1):
+                candidates.extend(self.cells.get((row, col), ()))
+        return candidates
+
+    def within(self, lat, lon, radius_km):
+        "points within radius_km of (lat, lon), closest first"
+        hits = [hit for hit in self._measure(lat, lon, self._candidates(lat, lon, radius_km)) if hit[1] <= radius_km]
+        hits.sort(key=lambda hit: hit[1])
+        return hits
+
+    def within_many(self, query_lats, query_lons, radius_km):
+        """
+        `within` for several query points at once, one (positions, distances_km)
+        pair of arrays per query, closest first. The candidates of every query
+        are measured in a single haversine_pairs call.
+        """
+        queries, positions = [], []
+        for query, (lat, lon) in enumerate(zip(query_lats, query_lons)):
+            candidates = self._candidates(lat, lon, radius_km)
+            positions.extend(candidates)
+            queries.extend([query] * len(candidates))
+        queries = np.array(queries, dtype=np.int64)
+        positions = np.array(positions, dtype=np.int64)
+        distances = haversine_pairs(np.asarray(query_lats, dtype=np.float64)[queries],
+                                    np.asarray(query_lons, dtype=np.float64)[queries],
+                                    self.lats[positions], self.lons[positions])
+        return group_by_query(len(query_lats), queries, positions, distances, radius_km)
+
+    def nearest(self, lat, lon, k=1, max_km=None):
+        "the k closest points to (lat, lon), optionally capped at max_km"
+        if not self.cells or k <= 0:
+            return []
+
+        row, col = self._cell(lat, lon)
+        min_row, max_row, min_col, max_col = self.bounds
+        if not (min_row <= row <= max_row and min_col <= col <= max_col):
+            # far from every point (a point out of town, lat/lon swapped) the
+            # rings would be empty all the way out to the grid
+            return self._nearest_all(lat, lon, k, max_km)
+        # every point outside ring r is at least r whole cells away from the query
+        cell_span_km = min(self.cell_km, self.cell_lon * KM_PER_DEG_LAT * math.cos(math.radians(lat)))
+        max_ring = max(abs(row - min_row), abs(row - max_row), abs(col - min_col), abs(col - max_col))
+
+        hits = []
+        for ring in range(max_ring + 1):
+            if ring > NEAREST_MAX_RINGS:
+                return self._nearest_all(lat, lon, k, max_km)
+            ring_cells = []
+            for r in range(row - ring, row + ring + 1):
+                if ring == 0 or abs(r - row) == ring:
+                    ring_cells.extend((r, c) for c in range(col - ring, col + ring + 1))
+                else:
+                    ring_cells.extend([(r, col - ring), (r, col + ring)])
+
+            positions = []
+            for cell in ring_cells:
+                positions.extend(self.cells.get(cell, ()))
+            hits.extend(self._measure(lat, lon, positions))
+
+            reach_km = ring * cell_span_km
+            if max_km is not None and reach_km >= max_km:
+                break
+            if len(hits) >= k:
+                hits.sort(key=lambda hit: hit[1])
+                if hits[k - 1][1] <= reach_km:
+                    break
+
+        hits.sort(key=lambda hit: hit[1])
+        if max_km is not None:
+            hits = [hit for hit in hits if hit[1] <= max_km]
+        return hits[:k]
+
+    def _nearest_all(self, lat, lon, k, max_km):
+        "`nearest` by measuring every point, for queries the rings would take too long to reach"
+        distances = haversine_many(lat, lon, self.lats, self.lons)
+        k = min(k, len(distances))
+        closest = np.argpartition(distances, k - 1)[:k]
+        closest = closest[np.argsort(distances[closest], kind="stable")]
+        return [
+            (i, distance) for i, distance in zip(closest.tolist(), distances[closest].tolist())
+            if max_km is None or distance <= max_km
+        ]
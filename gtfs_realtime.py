@@ -0,0 +1,25 @@
+"""
+The compiled gtfs-realtime.proto module shared by everything in this process.
+
+nyct_gtfs ships its own compiled copy of gtfs-realtime.proto, and protobuf
+refuses to register the same .proto file twice, so the subway and ferry code
+can't import `google.transit.gtfs_realtime_pb2` next to nyct_gtfs in one
+process (as they do in the combined server, main.py). Both copies are the same
+GTFS-realtime schema, so whenever nyct_gtfs is installed its copy is the one
+used, and google.transit's only when it isn't.
+
+The import happens on first use: nyct_gtfs pulls in requests and friends,
+which a server that never parses a feed shouldn't pay for at startup.
+"""
+_pb2 = None
+
+
+def gtfs_realtime_pb2():
+    global _pb2
+    if _pb2 is None:
+        try:
+            from nyct_gtfs.compiled_gtfs import gtfs_realtime_pb2 as module
+        except ImportError:
+            from google.transit import gtfs_realtime_pb2 as module
+        _pb2 = module
+    return _pb2
@@ -0,0 +1,180 @@
+"""
+Read-on-demand views over a parsed GTFS-realtime FeedMessage.
+
+The views wrap the protobuf messages and only read a field when it is asked
+for, so filtering a feed by route or stop touches a handful of scalar fields
+per entity instead of building a dict tree for every entity up front.
+`to_dict()` produces the same dicts the ferry tools have always returned, for
+the entities that survive the filter.
+"""
+from gtfs_realtime import gtfs_realtime_pb2
+
+
+def optional(message, field):
+    "field value, or None when it isn't set on the wire"
+    return getattr(message, field) if message.HasField(field) else None
+
+
+def translated_text(text, language="en"):
+    "the `language` translation of a TranslatedString, falling back to the first one"
+    first = None
+    for translation in text.translation:
+        if translation.language == language:
+            return translation.text
+        if first is None:
+            first = translation.text
+    return first or ""
+
+
+def stop_time_event_dict(event):
+    return {
+        "delay": optional(event, 'delay'),
+        "time": optional(event, 'time'),
+        "uncertainty": optional(event, 'uncertainty'),
+    }
+
+
+class StopTimeUpdateView:
+    __slots__ = ('update',)
+
+    def __init__(self, update):
+        self.update = update
+
+    @property
+    def stop_id(self):
+        return optional(self.update, 'stop_id')
+
+    def event_time(self, kind):
+        "arrival/departure unix time, None if the feed doesn't give one"
+        if not self.update.HasField(kind):
+            return None
+        return getattr(self.update, kind).time or None
+
+    def event_delay(self, kind):
+        if not self.update.HasField(kind):
+            return None
+        return getattr(self.update, kind).delay or None
+
+    def to_dict(self):
+        update = self.update
+        info = {
+            "stop_id": optional(update, 'stop_id'),
+            "stop_sequence": optional(update, 'stop_sequence'),
+            "schedule_relationship": optional(update, 'schedule_relationship'),
+        }
+        if update.HasField('arrival'):
+            info["arrival"] = stop_time_event_dict(update.arrival)
+        if update.HasField('departure'):
+            info["departure"] = stop_time_event_dict(update.departure)
+        return info
+
+
+class TripUpdateView:
+    __slots__ = ('entity',)
+
+    def __init__(self, entity):
+        self.entity = entity
+
+    @property
+    def trip_id(self):
+        return optional(self.entity.trip_update.trip, 'trip_id')
+
+    @property
+    def route_id(self):
+        return optional(self.entity.trip_update.trip, 'route_id')
+
+    @property
+    def vehicle_id(self):
+        trip_update = self.entity.trip_update
+        return trip_update.vehicle.id if trip_update.HasField('vehicle') and trip_update.vehicle.HasField('id') else None
+
+    def stop_updates(self):
+        for update in self.entity.trip_update.stop_time_update:
+            yield StopTimeUpdateView(update)
+
+    def serves(self, stop_id):
+        return any(update.stop_id == stop_id for update in self.entity.trip_update.stop_time_update)
+
+    def to_dict(self, stop_id=None):
+        "the trip dict, optionally keeping only the stop time updates for `stop_id`"
+        trip_update = self.entity.trip_update
+        trip = trip_update.trip
+        return {
+            "id": self.entity.id,
+            "trip_id": optional(trip, 'trip_id'),
+            "route_id": optional(trip, 'route_id'),
+            "start_date": optional(trip, 'start_date'),
+            "schedule_relationship": optional(trip, 'schedule_relationship'),
+            "vehicle_id": self.vehicle_id,
+            "timestamp": optional(trip_update, 'timestamp'),
+            "stop_time_updates": [
+                StopTimeUpdateView(update).to_dict() for update in trip_update.stop_time_update
+                if stop_id is None or update.stop_id == stop_id
+            ],
+        }
+
+
+class AlertView:
+    __slots__ = ('entity',)
+
+    def __init__(self, entity):
+        self.entity = entity
+
+    @property
+    def route_ids(self):
+        return [informed.route_id for informed in self.entity.alert.informed_entity if informed.HasField('route_id')]
+
+    @property
+    def stop_ids(self):
+        return [informed.stop_id for informed in self.entity.alert.informed_entity if informed.HasField('stop_id')]
+
+    def affects(self, route_id=None, stop_id=None):
+        for informed in self.entity.alert.informed_entity:
+            if route_id is not None and informed.route_id == route_id:
+                return True
+            if stop_id is not None and informed.stop_id == stop_id:
+                return True
+        return route_id is None and stop_id is None
+
+    def to_dict(self):
+        alert = self.entity.alert
+        return {
+            "id": self.entity.id,
+            "cause": optional(alert, 'cause'),
+            "effect": optional(alert, 'effect'),
+            "header_text": translated_text(alert.header_text),
+            "description_text": translated_text(alert.description_text),
+            "affected_routes": self.route_ids,
+            "affected_stops": self.stop_ids,
+        }
+
+
+class FeedView:
+    "a parsed FeedMessage with filtered, lazily read trip update and alert entities"
+    __slots__ = ('message',)
+
+    def __init__(self, content):
+        self.message = gtfs_realtime_pb2().FeedMessage()
+        self.message.ParseFromString(content)
+
+    @property
+    def timestamp(self):
+        return optional(self.message.header, 'timestamp')
+
+    def trip_updates(self, route_id=None, stop_id=None):
+        for entity in self.message.entity:
+            if not entity.HasField('trip_update'):
+                continue
+            view = TripUpdateView(entity)
+            if route_id is not None and view.route_id != route_id:
+                continue
+            if stop_id is not None and not view.serves(stop_id):
+                continue
+            yield view
+
+    def alerts(self, route_id=None, stop_id=None):
+        for entity in self.message.entity:
+            if entity.HasField('alert'):
+                view = AlertView(entity)
+                if view.affects(route_id, stop_id):
+                    yield view
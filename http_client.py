@@ -0,0 +1,218 @@
+"""
+Shared HTTP clients for every upstream fetch (GBFS, MTA GTFS-RT, NYC Ferry).
+
+One pooled client per process instead of one per request, so repeated calls
+reuse keep-alive connections instead of paying TCP/TLS setup every time.
+HTTP/2 is used when the optional `h2` package is installed. On top of the pool:
+
+- at most MAX_PER_HOST requests in flight against any one host
+- conditional GETs: the ETag / Last-Modified of the last 200 for a url is sent
+  back, and a 304 hands back the body we already have
+- retries with backoff on connection errors, timeouts, 429 and 5xx
+
+Every knob can be set from the environment.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+try:
+    import h2  # noqa: F401  httpx only negotiates HTTP/2 when h2 is importable
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT_SECS", 10))
+CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT_SECS", 5))
+RETRIES = int(os.environ.get("UPSTREAM_RETRIES", 2))
+RETRY_BACKOFF = float(os.environ.get("UPSTREAM_RETRY_BACKOFF_SECS", 0.25))
+MAX_CONNECTIONS = int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", 32))
+MAX_PER_HOST = int(os.environ.get("UPSTREAM_MAX_PER_HOST", 6))
+KEEPALIVE_SECS = float(os.environ.get("UPSTREAM_KEEPALIVE_SECS", 60))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_EXCEPTIONS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+
+_validated = {}     # url -> UpstreamBody of the last 200 that carried a validator
+_async_state = None  # (loop, AsyncClient, host -> asyncio.Semaphore)
+_sync_client = None
+_sync_host_slots = {}
+_sync_lock = threading.Lock()
+
+
+class UpstreamBody:
+    "a response body and the validators it came with"
+    __slots__ = ('url', 'content', 'etag', 'last_modified', 'fetched_at', '_json')
+
+    def __init__(self, url, content, etag=None, last_modified=None):
+        self.url = url
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = time.time()
+        self._json = None
+
+    def json(self):
+        "parsed once and shared by every caller that gets this body, so don't mutate it"
+        if self._json is None:
+            self._json = json.loads(self.content)
+        return self._json
+
+
+def client_settings():
+    return dict(
+        http2=HTTP2,
+        timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_SECS,
+        ),
+        follow_redirects=True,
+    )
+
+
+def _async_client():
+    "the AsyncClient for the running loop; pools can't be shared between loops"
+    global _async_state
+    loop = asyncio.get_running_loop()
+    if _async_state is None or _async_state[0] is not loop:
+        _async_state = (loop, httpx.AsyncClient(**client_settings()), {})
+    return _async_state
+
+
+def _client():
+    global _sync_client
+    with _sync_lock:
+        if _sync_client is None:
+            _sync_client = httpx.Client(**client_settings())
+        return _sync_client
+
+
+def _sync_host_slot(host):
+    with _sync_lock:
+        slot = _sync_host_slots.get(host)
+        if slot is None:
+            slot = _sync_host_slots[host] = threading.BoundedSemaphore(MAX_PER_HOST)
+        return slot
+
+
+def _request_headers(url, headers, conditional):
+    request_headers = dict(headers or {})
+    cached = _validated.get(url) if conditional else None
+    if cached is not None:
+        if cached.etag:
+            request_headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            request_headers["If-Modified-Since"] = cached.last_modified
+    return request_headers
+
+
+def _accept(url, response, conditional):
+    "(body, changed) for a final response, raising for error statuses"
+    if response.status_code == 304 and url in _validated:
+        return _validated[url], False
+    response.raise_for_status()
+
+    body = UpstreamBody(
+        url, response.content, response.headers.get("ETag"), response.headers.get("Last-Modified")
+    )
+    if conditional and (body.etag or body.last_modified):
+        _validated[url] = body
+    else:
+        _validated.pop(url, None)
+    return body, True
+
+
+def _backoff(attempt, response=None):
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), 5.0)
+    return RETRY_BACKOFF * 2 ** attempt
+
+
+async def fetch(url, headers=None, timeout=None, retries=RETRIES, conditional=True):
+    """
+    GET a url through the shared async client.
+    Returns (UpstreamBody, changed), changed is False when the server answered
+    304 to our validators. Raises httpx errors once retries are used up.
+    """
+    _, client, host_slots = _async_client()
+    host = urlsplit(url).netloc
+    slot = host_slots.get(host)
+    if slot is None:
+        slot = host_slots[host] = asyncio.Semaphore(MAX_PER_HOST)
+
+    for attempt in range(retries + 1):
+        try:
+            async with slot:
+                response = await client.get(
+                    url, headers=_request_headers(url, headers, conditional), timeout=timeout or httpx.USE_CLIENT_DEFAULT
+                )
+        except RETRY_EXCEPTIONS:
+            if attempt == retries:
+                raise
+            await asyncio.sleep(_backoff(attempt))
+            continue
+        if response.status_code in RETRY_STATUSES and attempt < retries:
+            await asyncio.sleep(_backoff(attempt, response))
+            continue
+        return _accept(url, response, conditional)
+
+
+def fetch_sync(url, headers=None, timeout=None, retries=RETRIES, conditional=True):
+    "blocking version of `fetch` for worker threads, same pooling and validators"
+    client = _client()
+    slot = _sync_host_slot(urlsplit(url).netloc)
+
+    for attempt in range(retries + 1):
+        try:
+            with slot:
+                response = client.get(
+                    url, headers=_request_headers(url, headers, conditional), timeout=timeout or httpx.USE_CLIENT_DEFAULT
+                )
+        except RETRY_EXCEPTIONS:
+            if attempt == retries:
+                raise
+            time.sleep(_backoff(attempt))
+            continue
+        if response.status_code in RETRY_STATUSES and attempt < retries:
+            time.sleep(_backoff(attempt, response))
+            continue
+        return _accept(url, response, conditional)
+
+
+async def get_json(url, headers=None, **kwargs):
+    body, _ = await fetch(url, headers, **kwargs)
+    return body.json()
+
+
+async def get_bytes(url, headers=None, **kwargs):
+    body, _ = await fetch(url, headers, **kwargs)
+    return body.content
+
+
+def error_result(exc):
+    "the {'error': ...} dict the tools return when an upstream fetch fails"
+    if isinstance(exc, httpx.TimeoutException):
+        return {"error": "Request timed out"}
+    if isinstance(exc, httpx.HTTPStatusError):
+        return {"error": f"HTTP error: {exc.response.status_code}"}
+    if isinstance(exc, httpx.HTTPError):
+        # connection errors have no response to read a status from
+        return {"error": f"HTTP error: {type(exc).__name__}: {exc}"}
+    return {"error": str(exc)}
+
+
+async def aclose():
+    "close the async client of the running loop, e.g. at the end of a script"
+    global _async_state
+    if _async_state is not None and _async_state[0] is asyncio.get_running_loop():
+        await _async_state[1].aclose()
+        _async_state = None
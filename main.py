@@ -1,5 +1,54 @@
+"""
+Every Sally tool on one MCP server, in one process.
+
+citibikes.py, mta.py, ferry_data.py and planner.py still run on their own
+(python mta.py etc.). This imports them into a single interpreter and
+registers all of their tools on one FastMCP server instead, so they share one
+copy of the station and ferry data, the Citi Bike and feed caches, the pooled
+HTTP client in http_client.py and the background refreshers, rather than
+each server process loading its own.
+
+Heavy dependencies stay lazy inside the modules: nyct_gtfs loads with the
+first subway feed, the GTFS-realtime bindings with the first ferry feed.
+
+SALLY_SERVERS picks the servers to mount (comma separated, default all of them).
+Over a network transport one process serves any number of agents, see serving.py:
+
+python main.py                                      # stdio
+python main.py --transport streamable-http --port 8000
+"""
+import importlib
+import os
+
+from mcp.server.fastmcp import FastMCP
+
+from serving import serve
+
+SERVERS = ['citibikes', 'mta', 'ferry_data', 'planner']
+
+mcp = FastMCP("sally")
+
+
+def mount(module_name):
+    "import a server module and register its tools here, returns their names"
+    server = importlib.import_module(module_name).mcp
+    names = []
+    for tool in server._tool_manager.list_tools():
+        if mcp._tool_manager.get_tool(tool.name) is not None:
+            raise ValueError(f"{module_name} and an earlier server both define a {tool.name} tool")
+        mcp.add_tool(tool.fn, name=tool.name, title=tool.title, description=tool.description, annotations=tool.annotations)
+        names.append(tool.name)
+    return names
+
+
+def mount_servers(servers=None):
+    servers = servers or [name.strip() for name in os.environ.get("SALLY_SERVERS", ",".join(SERVERS)).split(",") if name.strip()]
+    return {module_name: mount(module_name) for module_name in servers}
+
+
 def main():
-    print("Hello from sally!")
+    mount_servers()
+    serve(mcp)
 
 
 if __name__ == "__main__":
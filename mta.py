@@ -1,190 +1,190 @@
-import math 
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any 
-import httpx
 from mcp.server.fastmcp import FastMCP
-from nyct_gtfs import NYCTFeed
-import pandas as pd 
+import http_client
+import numpy as np
 from datetime import datetime
+from background import BackgroundTask
+from footpaths import FOOTPATHS, node_key, transfer_lists
+from geo import WALK_MINS_PER_KM, points_within, points_within_many
+from query_cache import QueryCache, quantize
+from serving import read_points, serve
+from subway_patterns import load_patterns
+from subway_router import TRANSFER_WALK_KM, SubwayRouter
+from subway_stations import load_stations, subway_lines_dict
+
+# the MTA regenerates the GTFS-RT feeds about every 30 seconds
+FEED_REFRESH_INTERVAL = float(os.environ.get("MTA_FEED_REFRESH_SECS", 30))
+# feeds nobody has asked for in this long are left alone by the refresher
+FEED_IDLE_TIMEOUT = float(os.environ.get("MTA_FEED_IDLE_SECS", 10 * 60))
+# arrivals lookups run in this many worker threads, and a request waits at most
+# ARRIVALS_DEADLINE seconds for them before answering with what it has
+ARRIVALS_WORKERS = int(os.environ.get("MTA_ARRIVALS_WORKERS", 8))
+ARRIVALS_DEADLINE = float(os.environ.get("MTA_ARRIVALS_DEADLINE_SECS", 5))
+
+FEEDS_CACHE = {}          # feed_key -> FeedSnapshot
+FEED_LOADED_AT = {}       # feed_key -> wall clock time of the last successful load
+FEED_LAST_REQUESTED = {}  # feed_key -> monotonic time a caller last asked for it
+FEED_ERRORS = {}          # feed_key -> last refresh error, cleared on success
+_snapshot_counter = itertools.count(1)  # numbers every FeedSnapshot, to tell them apart
+_feed_load_locks = {}     # feed_key -> lock held while a first load is in flight
+arrivals_pool = ThreadPoolExecutor(max_workers=ARRIVALS_WORKERS, thread_name_prefix="mta-arrivals")
+
+def arrival_sort_key(arrival): 
+    return arrival['arrival_time'] if arrival['arrival_time'] else datetime.max
+
+def build_arrivals_index(feed): 
+    """
+    Walk every trip in the feed once and group its upcoming stops by directional
+    GTFS stop ID (e.g. "631N"), each list sorted by arrival time.
+    """
+    arrivals_by_stop = {}
+    for trip in feed.trips: 
+        route_id = trip.route_id
+        for stop_update in trip.stop_time_updates: 
+            stop_id = stop_update.stop_id
+            arrivals_by_stop.setdefault(stop_id, []).append({
+                'route': route_id,
+                'direction': "Uptown" if stop_id.endswith("N") else "Downtown",
+                'stop_name': stop_update.stop_name,
+                'arrival_time': stop_update.arrival,
+                'departure_time': stop_update.departure,
+                'delay': getattr(stop_update, 'delay', 0)
+            })
+
+    for arrivals in arrivals_by_stop.values(): 
+        arrivals.sort(key=arrival_sort_key)
+    return arrivals_by_stop
+
+class FeedSnapshot: 
+    "a loaded NYCTFeed and its arrivals index, swapped into FEEDS_CACHE as one unit"
+    __slots__ = ('feed', 'content', 'arrivals_by_stop', 'generation')
+
+    def __init__(self, feed, content=None): 
+        self.feed = feed
+        self.content = content  # raw feed bytes, to tell whether a refetch changed anything
+        self.arrivals_by_stop = build_arrivals_index(feed)
+        self.generation = next(_snapshot_counter)
+
+    @property
+    def last_generated(self): 
+        return self.feed.last_generated
+
+def load_feed(feed_key): 
+    "fetch a fresh NYCTFeed, index it and swap it into the cache in one assignment"
+    # nyct_gtfs (and requests under it) only loads once a subway feed is needed
+    from nyct_gtfs import NYCTFeed
+    body, _ = http_client.fetch_sync(NYCTFeed._train_to_url[feed_key])
+    snapshot = FEEDS_CACHE.get(feed_key)
+    # a 304 hands back the same bytes this feed was already parsed from
+    if snapshot is None or snapshot.content is not body.content: 
+        feed = NYCTFeed(feed_key, fetch_immediately=False)
+        feed.load_gtfs_bytes(body.content)
+        snapshot = FeedSnapshot(feed, body.content)
+        FEEDS_CACHE[feed_key] = snapshot
+    FEED_LOADED_AT[feed_key] = time.time()
+    FEED_ERRORS.pop(feed_key, None)
+    return snapshot
 
-FEEDS_CACHE = {} 
 def get_cached_feed(feed_key): 
-    if feed_key not in FEEDS_CACHE: 
-        # print(f"Creating NEW feed for {feed_key}")
-        FEEDS_CACHE[feed_key] = NYCTFeed(feed_key)
-    # else: 
-        # print(f"Using CACHED feed for {feed_key}")
-    return FEEDS_CACHE[feed_key]
-
-STATIONS_BY_ID = None
-def initialize_station_cache(): 
-    global STATIONS_BY_ID
-    if STATIONS_BY_ID is None: 
-        STATIONS_BY_ID = stations_df.set_index('Complex ID').to_dict('index')
+    "latest FeedSnapshot for a feed, loading it on first use"
+    FEED_LAST_REQUESTED[feed_key] = time.monotonic()
+    feed_refresher.ensure()
+    snapshot = FEEDS_CACHE.get(feed_key)
+    if snapshot is None: 
+        # several stations can need the same cold feed at once, only download it once
+        with _feed_load_locks.setdefault(feed_key, threading.Lock()): 
+            snapshot = FEEDS_CACHE.get(feed_key)
+            if snapshot is None: 
+                snapshot = load_feed(feed_key)
+    return snapshot
 
-#initialize FastMCP server
-mcp = FastMCP("mta_subway")
-data_path = "data/MTA_Subway_Stations_and_Complexes_20250916.csv"
-stations_df = pd.read_csv(data_path)
-
-initialize_station_cache()
-
-subway_lines_dict = { 
-    "A": ["A","C", "E"],
-    "G": ["G"],
-    "J": ["J","Z"], 
-    "N": ["N", 'Q', 'R', 'W'], 
-    "1": ['1','2','3','4','5','6','7','S'],
-    "L": ['L'],
-    "B": ['B','D','F','M'],
-    "SIR" :['SIR']
-}
-
-TRANSFER_STATIONS = {
-    611: {'lines': ['W', '3', 'Q', '1', 'E', 'S', '7', 'A', 'R', 'C', 'N', '2'], 'name': 'Times Sq-42 St/Port Authority Bus Terminal'},
-    617: {'lines': ['B', '4', '3', 'Q', 'R', 'D', 'N', '2', '5'], 'name': 'Atlantic Av-Barclays Ctr'},
-    602: {'lines': ['W', '4', '6', 'L', 'Q', 'R', 'N', '5'], 'name': '14 St-Union Sq'},
-    628: {'lines': ['4', 'Z', '3', 'A', 'C', '2', 'J', '5'], 'name': 'Fulton St'},
-    623: {'lines': ['W', 'Z', '6', 'Q', 'R', 'J', 'N'], 'name': 'Canal St'},
-    624: {'lines': ['W', '3', 'E', 'A', 'R', 'C', '2'], 'name': 'Chambers St/WTC/Park Place/Cortlandt St'},
-    601: {'lines': ['M', 'L', '3', '1', '2', 'F'], 'name': '14 St/6 Av'},
-    616: {'lines': ['M', 'E', '7', 'R', 'F'], 'name': 'Jackson Hts-Roosevelt Av/74 St-Broadway'},
-    606: {'lines': ['G', 'M', 'E', '7'], 'name': 'Court Sq-23 St'},
-    607: {'lines': ['B', 'M', 'W', 'Q', 'R', 'D', 'N', 'F'], 'name': '34 St-Herald Sq'},
-    613: {'lines': ['W', '4', '6', 'R', 'N', '5'], 'name': 'Lexington Av/59 St'},
-    614: {'lines': ['B', '1', 'A', 'C', 'D'], 'name': '59 St-Columbus Circle'},
-    609: {'lines': ['B', 'M', '7', 'D', 'F'], 'name': '42 St-Bryant Pk/5 Av'},
-    619: {'lines': ['B', 'M', '6', 'D', 'F'], 'name': 'Broadway-Lafayette St/Bleecker St'},
-    620: {'lines': ['4', '3', 'R', '2', '5'], 'name': 'Borough Hall/Court St'},
-    622: {'lines': ['4', 'Z', '6', 'J', '5'], 'name': 'Brooklyn Bridge-City Hall/Chambers St'},
-    167: {'lines': ['B', 'M', 'E', 'A', 'C', 'D', 'F'], 'name': 'W 4 St-Wash Sq'},
-    612: {'lines': ['6', 'M', 'E'], 'name': 'Lexington Av/51-53 Sts'},
-    621: {'lines': ['Z', 'L', 'A', 'J', 'C'], 'name': 'Broadway Junction'},
-    42: {'lines': ['B', 'Q', 'S'], 'name': 'Prospect Park'},
-    461: {'lines': ['N', 'W', '7'], 'name': 'Queensboro Plaza'},
-    604: {'lines': ['D', 'B', '4'], 'name': '161 St-Yankee Stadium'},
-    605: {'lines': ['A', '1', 'C'], 'name': '168 St-Washington Hts'},
-    635: {'lines': ['W', '1', 'R'], 'name': 'Whitehall St-South Ferry'},
-    636: {'lines': ['R', 'A', 'F', 'C'], 'name': 'Jay St-MetroTech'},
-    261: {'lines': ['M', 'R', 'E', 'F'], 'name': 'Forest Hills-71 Av'},
-    608: {'lines': ['R', 'F', 'G'], 'name': '4 Av-9 St'},
-    610: {'lines': ['4', '6', 'S', '7', '5'], 'name': 'Grand Central-42 St'},
-    618: {'lines': ['E', 'A', 'L', 'C'], 'name': '14 St/8 Av'},
-    625: {'lines': ['M', 'Z', 'F', 'J'], 'name': 'Delancey St-Essex St'},
-    626: {'lines': ['4', '3', 'S', '2', '5'], 'name': 'Franklin Av-Medgar Evers College/Botanic Garden'},
-    273: {'lines': ['M', 'E', 'R'], 'name': 'Queens Plaza'},
-    151: {'lines': ['D', 'B', 'A', 'C'], 'name': '145 St'},
-    153: {'lines': ['D', 'B', 'A', 'C'], 'name': '125 St'},
-    58: {'lines': ['D', 'N', 'Q', 'F'], 'name': 'Coney Island-Stillwell Av'},
-    277: {'lines': ['D', 'B', 'E'], 'name': '7 Av'},
-    278: {'lines': ['Z', 'E', 'J'], 'name': 'Jamaica Center-Parsons/Archer'},
-    279: {'lines': ['Z', 'E', 'J'], 'name': 'Sutphin Blvd-Archer Av-JFK Airport'},
-    337: {'lines': ['4', '3', '2', '5'], 'name': 'Nevins St'},
-    175: {'lines': ['G', 'A', 'C'], 'name': 'Hoyt-Schermerhorn Sts'},
-    225: {'lines': ['D', 'B', 'M', 'F'], 'name': '47-50 Sts-Rockefeller Ctr'},
-    9: {'lines': ['N', 'Q', 'W', 'R'], 'name': '57 St-7 Av'},
-    26: {'lines': ['B', 'Q', 'R'], 'name': 'DeKalb Av'},
-    32: {'lines': ['D', 'N', 'R'], 'name': '36 St'},
-    97: {'lines': ['M', 'Z', 'J'], 'name': 'Myrtle Av'},
-    101: {'lines': ['M', 'Z', 'J'], 'name': 'Marcy Av'},
-}
-
-def haversine(lat1, lon1, lat2, lon2):
+def feed_age(feed_key): 
+    "seconds since the feed was last loaded, None if it never was"
+    loaded_at = FEED_LOADED_AT.get(feed_key)
+    return None if loaded_at is None else time.time() - loaded_at
+
+async def refresh_feeds_forever(interval=FEED_REFRESH_INTERVAL, idle_timeout=FEED_IDLE_TIMEOUT): 
     """
-    Calculate the great circle distance between two points 
-    on the earth (specified in decimal degrees)
-    Returns distance in kilometers
+    Reload every recently requested feed each `interval` seconds.
+    Loads run in worker threads so the event loop keeps serving requests, and a
+    failed load keeps the previous feed in place.
     """
-    # Convert decimal degrees to radians
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    
-    # Radius of earth in kilometers
-    r = 6371
-    
-    return c * r
+    while True: 
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        due = [
+            feed_key for feed_key in subway_lines_dict
+            if now - FEED_LAST_REQUESTED.get(feed_key, float('-inf')) <= idle_timeout
+            and (feed_age(feed_key) is None or feed_age(feed_key) >= interval * 0.9)
+        ]
+        results = await asyncio.gather(
+            *(asyncio.to_thread(load_feed, feed_key) for feed_key in due), return_exceptions=True
+        )
+        for feed_key, result in zip(due, results): 
+            if isinstance(result, Exception): 
+                FEED_ERRORS[feed_key] = str(result)
 
-def get_train_times_by_complex_id(complex_ID): 
-    target_station = stations_df.loc[stations_df['Complex ID'] == complex_ID]
-
-    # Convert the 'col_obj' column to the dedicated Pandas StringDtype. and split the string 
-    gtfs_stopID_raw = target_station["GTFS Stop IDs"].iloc[0]
-    base_stopID = gtfs_stopID_raw.split('; ')
-    lines_raw = target_station["Daytime Routes"].iloc[0]
-    lines = lines_raw.split(' ')
-
-    #add direction suffixes
-    #trains api accepts stopID+N for northbound or S for southbound 
-    target_stopID = []
-    for stop_id in base_stopID:
-        target_stopID.extend([f"{stop_id}N", f"{stop_id}S"])
-    
+feed_refresher = BackgroundTask(refresh_feeds_forever)
 
-    feeds_needed = set()
-    # Loop through lines
-    for line in lines:
-        # Find which feed this line belongs to
-        for feed_key, feed_lines in subway_lines_dict.items():
-            if line in feed_lines:
-                feeds_needed.add(feed_key)  # set automatically handles duplicates
-                break
+#initialize FastMCP server
+mcp = FastMCP("mta_subway")
+STATIONS = load_stations()
+STATIONS_BY_ID = {station.complex_id: station for station in STATIONS}
 
-    all_arrivals = [] # collect all arrivals 
-    
-    # loop through set and initialize feeds, print results
-    for feed_key in feeds_needed: 
-        
-        feed = get_cached_feed(feed_key)
-        trains = feed.filter_trips(headed_for_stop_id=target_stopID)
-
-        # print(f"Found {len(trains)} trains")
-
-        # extract arrival times: 
-        
-        for trip in trains: 
-            for stop_update in trip.stop_time_updates: 
-                if stop_update.stop_id in target_stopID:
-                    direction = "Uptown" if stop_update.stop_id.endswith("N") else "Downtown"
-                    all_arrivals.append({
-                        'route': trip.route_id,
-                        'direction': direction,
-                        'stop_name': stop_update.stop_name,
-                        'arrival_time': stop_update.arrival,
-                        'departure_time': stop_update.departure,
-                        'delay': getattr(stop_update, 'delay', 0)
-                    })
-    
-    all_arrivals.sort(key=lambda x: x['arrival_time'] if x['arrival_time'] else datetime.max)
+# coordinate arrays for the vectorized distance kernel, same order as STATIONS
+STATION_COMPLEX_IDS = [station.complex_id for station in STATIONS]
+STATION_LATS = np.array([station.lat for station in STATIONS])
+STATION_LONS = np.array([station.lon for station in STATIONS])
+
+# get_nearby_subway_options answers, good until a feed they used is replaced
+nearby_options_cache = QueryCache()
 
-    return all_arrivals[:15]
+def feeds_version(stations): 
+    "which snapshot of each feed the stations of an answer are read from, checked after computing"
+    feed_keys = sorted({feed_key for station in stations for feed_key in STATIONS_BY_ID[station['complex_id']].feed_keys})
+    return tuple(
+        (feed_key, snapshot.generation if snapshot is not None else None)
+        for feed_key, snapshot in ((feed_key, FEEDS_CACHE.get(feed_key)) for feed_key in feed_keys)
+    )
+
+# without the stop patterns there is nothing to time a ride with, so no routing at all
+SUBWAY_PATTERNS = load_patterns()
+SUBWAY_ROUTER = SubwayRouter(STATIONS, SUBWAY_PATTERNS, transfer_lists(
+    FOOTPATHS, [node_key('subway', complex_id) for complex_id in STATION_COMPLEX_IDS], TRANSFER_WALK_KM
+)) if SUBWAY_PATTERNS else None
+
+def get_train_times_by_complex_id(complex_ID): 
+    station = STATIONS_BY_ID[complex_ID]
+
+    # each feed snapshot already has arrivals grouped and sorted per stop,
+    # so just merge the presorted lists for this station's stop IDs
+    sorted_lists = []
+    for feed_key in station.feed_keys: 
+        arrivals_by_stop = get_cached_feed(feed_key).arrivals_by_stop
+        for stop_id in station.directional_stop_ids: 
+            arrivals = arrivals_by_stop.get(stop_id)
+            if arrivals: 
+                sorted_lists.append(arrivals)
+
+    return list(itertools.islice(heapq.merge(*sorted_lists, key=arrival_sort_key), 15))
 
 
 def find_nearest_stations(latitude: float, longitude: float, radius_km: float=0.5):
     """
     Find nearby subway stations. 
     """
-    #pre filter by rough bounding box first
-    lat_margin = radius_km / 111.0 
-    lon_margin = radius_km / (111.0 * math.cos(math.radians(latitude)))
-
-    bounded_df = stations_df[
-        (stations_df['Latitude'] >= latitude - lat_margin) &
-        (stations_df['Latitude'] <= latitude + lat_margin) &
-        (stations_df['Longitude'] >= longitude - lon_margin) &
-        (stations_df['Longitude'] <= longitude + lon_margin)
-    ][['Complex ID', 'Latitude', 'Longitude']].copy()
-    
-    # Now apply haversine only to the subset
-    bounded_df['distance_to_user'] = bounded_df.apply(
-        lambda row: haversine(latitude, longitude, row['Latitude'], row['Longitude']), axis=1
-    )
-
-    nearby = bounded_df[bounded_df['distance_to_user']<= radius_km]
-    return nearby[['Complex ID', 'distance_to_user']].to_dict('records')
+    positions, distances = points_within(latitude, longitude, STATION_LATS, STATION_LONS, radius_km)
+    return [
+        {'Complex ID': STATION_COMPLEX_IDS[i], 'distance_to_user': distance}
+        for i, distance in zip(positions.tolist(), distances.tolist())
+    ]
      
 
 @mcp.tool()
@@ -203,37 +203,104 @@ async def get_nearby_subway_options(lat, lon, radius_km=0.5, max_stations=10):
     lon = float(str(lon).strip('"'))
     radius_km = float(str(radius_km).strip('"'))
     max_stations = int(str(max_stations).strip('"'))
-    
 
+    lat, lon, radius_km = key = quantize(lat, lon, radius_km)
+    return await nearby_options_cache.get(
+        key + (max_stations,), feeds_version,
+        lambda: nearby_subway_options(lat, lon, radius_km, max_stations),
+        # a station missing its trains is worth asking again for
+        keep=lambda stations: not any('arrivals_error' in station for station in stations)
+    )
+
+async def nearby_subway_options(lat, lon, radius_km, max_stations): 
     #get all nearby stations 
     nearby_stations = find_nearest_stations(lat, lon, radius_km)
     nearby_stations = sorted(nearby_stations, key=lambda x: x['distance_to_user'])[:max_stations]
-    nearby_stations_with_arrivals = []
-
-    for station in nearby_stations: 
-        #get station metadata 
-        # station_info = stations_df.loc[stations_df['Complex ID']== station['Complex ID']].iloc[0]
-        station_info = STATIONS_BY_ID[station['Complex ID']]
-
-        arrivals = get_train_times_by_complex_id(station['Complex ID'])
-        formatted_arrivals = []
-        for arrival in arrivals: 
-            if arrival['arrival_time']: 
-                formatted_arrivals.append({
-                    'route': arrival['route'], 
-                    'direction': arrival['direction'],
-                    'arrival_time': arrival['arrival_time'].strftime('%I:%M %p'),
-                    'minutes_away': int((arrival['arrival_time'] - datetime.now()).total_seconds() /60 )
-                })
-
-        nearby_stations_with_arrivals.append({
-            'complex_id': station['Complex ID'], 
-            'station_name': station_info['Stop Name'], 
-            'distance_km': round(station['distance_to_user'], 2 ), 
-            'walk_time_mins' : int(station['distance_to_user'] * 12), #~12 min per km  
-            'next_trains': formatted_arrivals[:10] #limit trains show
-        })
-    return nearby_stations_with_arrivals
+    arrivals = await lookup_arrivals([station['Complex ID'] for station in nearby_stations])
+    return [station_option(station, *arrivals[station['Complex ID']]) for station in nearby_stations]
+
+async def lookup_arrivals(complex_ids): 
+    """
+    complex id -> (arrivals, error or None) for each station.
+    Feed downloads and trip filtering block, so every station is looked up in
+    the worker pool at once and the wait stops at the deadline.
+    """
+    feed_refresher.ensure()
+    loop = asyncio.get_running_loop()
+    lookups = {
+        complex_id: loop.run_in_executor(arrivals_pool, get_train_times_by_complex_id, complex_id)
+        for complex_id in complex_ids
+    }
+    if lookups: 
+        await asyncio.wait(lookups.values(), timeout=ARRIVALS_DEADLINE)
+
+    results = {}
+    for complex_id, lookup in lookups.items(): 
+        if not lookup.done(): 
+            # still finishing in the background, it warms the feed cache for the next call
+            lookup.add_done_callback(lambda f: f.cancelled() or f.exception())
+            results[complex_id] = ([], "timed out waiting for real-time feed")
+        elif lookup.exception() is not None: 
+            results[complex_id] = ([], f"real-time feed unavailable: {lookup.exception()}")
+        else: 
+            results[complex_id] = (lookup.result(), None)
+    return results
+
+def station_option(station, arrivals, arrivals_error): 
+    "one station of get_nearby_subway_options' answer"
+    #get station metadata 
+    station_info = STATIONS_BY_ID[station['Complex ID']]
+
+    formatted_arrivals = []
+    for arrival in arrivals: 
+        if arrival['arrival_time']: 
+            formatted_arrivals.append({
+                'route': arrival['route'], 
+                'direction': arrival['direction'],
+                'arrival_time': arrival['arrival_time'].strftime('%I:%M %p'),
+                'minutes_away': int((arrival['arrival_time'] - datetime.now()).total_seconds() /60 )
+            })
+
+    station_result = {
+        'complex_id': station['Complex ID'], 
+        'station_name': station_info.name, 
+        'distance_km': round(station['distance_to_user'], 2 ), 
+        'walk_time_mins' : int(station['distance_to_user'] * WALK_MINS_PER_KM),  
+        'next_trains': formatted_arrivals[:10] #limit trains show
+    }
+    if arrivals_error: 
+        station_result['arrivals_error'] = arrivals_error
+    return station_result
+
+@mcp.tool()
+async def get_nearby_subway_options_many(points: list, radius_km=0.5, max_stations=10): 
+    """
+    Find nearby subway stations and their incoming trains for each of several
+    locations in one call. A station near more than one point is looked up once.
+
+    Args: 
+        points: list of [latitude, longitude] pairs, at most 50
+        radius_km: search radius in km, default is 0.5km 
+        max_stations: limit number of stations to return per point
+    """
+    points = read_points(points)
+    radius_km = float(str(radius_km).strip('"'))
+    max_stations = int(str(max_stations).strip('"'))
+
+    hits = points_within_many([lat for lat, _ in points], [lon for _, lon in points], STATION_LATS, STATION_LONS, radius_km)
+    nearby = [
+        [
+            {'Complex ID': STATION_COMPLEX_IDS[i], 'distance_to_user': distance}
+            for i, distance in zip(positions[:max_stations].tolist(), distances[:max_stations].tolist())
+        ]
+        for positions, distances in hits
+    ]
+    arrivals = await lookup_arrivals(dict.fromkeys(station['Complex ID'] for stations in nearby for station in stations))
+    return [
+        {'latitude': lat, 'longitude': lon,
+         'stations': [station_option(station, *arrivals[station['Complex ID']]) for station in stations]}
+        for (lat, lon), stations in zip(points, nearby)
+    ]
 
 @mcp.tool()
 async def get_subway_route_options(origin_lat: float, origin_lon: float, 
@@ -250,93 +317,95 @@ async def get_subway_route_options(origin_lat: float, origin_lon: float,
         max_options: Maximum number of route options to return
     """
     
+    if SUBWAY_ROUTER is None:
+        return "Subway routing isn't available: the line stop sequences (data/subway_patterns.bin) haven't been built."
+
     # Get nearby stations for both origin and destination
-    origin_stations = find_nearest_stations(origin_lat, origin_lon, 0.8)[:4]
-    dest_stations = find_nearest_stations(dest_lat, dest_lon, 0.8)[:4]
+    origin_stations = find_nearest_stations(origin_lat, origin_lon, 0.8)
+    dest_stations = find_nearest_stations(dest_lat, dest_lon, 0.8)
     
     if not origin_stations or not dest_stations:
         return "No nearby subway stations found for this route."
     
-    route_options = []
-    
-    # Check direct routes first (same line connects origin and destination)
-    for orig in origin_stations:
-        orig_data = STATIONS_BY_ID[orig['Complex ID']]
-        orig_lines = set(orig_data['Daytime Routes'].split())
-        
-        for dest in dest_stations:
-            dest_data = STATIONS_BY_ID[dest['Complex ID']]
-            dest_lines = set(dest_data['Daytime Routes'].split())
-            
-            # Find shared lines (direct connection)
-            shared_lines = orig_lines & dest_lines
-            if shared_lines:
-                route_options.append({
-                    'type': 'direct',
-                    'description': f"Take {'/'.join(sorted(shared_lines))} from {orig_data['Stop Name']} directly to {dest_data['Stop Name']}",
-                    'origin_station': orig_data['Stop Name'],
-                    'dest_station': dest_data['Stop Name'],
-                    'lines': sorted(list(shared_lines)),
-                    'walk_to_origin_mins': round(orig['distance_to_user'] * 12),
-                    'walk_from_dest_mins': round(dest['distance_to_user'] * 12),
-                    'total_walk_mins': round((orig['distance_to_user'] + dest['distance_to_user']) * 12)
-                })
-    
-    # Single transfer routes via major hubs
-    for orig in origin_stations:
-        orig_data = STATIONS_BY_ID[orig['Complex ID']]
-        orig_lines = set(orig_data['Daytime Routes'].split())
-        
-        for dest in dest_stations:
-            dest_data = STATIONS_BY_ID[dest['Complex ID']]
-            dest_lines = set(dest_data['Daytime Routes'].split())
-            
-            # Skip if we already found a direct route between these stations
-            if orig_lines & dest_lines:
-                continue
-                
-            # Check each transfer hub
-            for hub_id, hub_info in TRANSFER_STATIONS.items():
-                hub_lines = set(hub_info['lines'])
-                
-                # Can we get from origin to hub?
-                orig_to_hub = orig_lines & hub_lines
-                # Can we get from hub to destination?
-                hub_to_dest = hub_lines & dest_lines
-                
-                if orig_to_hub and hub_to_dest:
-                    route_options.append({
-                        'type': 'transfer',
-                        'description': f"Take {'/'.join(sorted(orig_to_hub))} from {orig_data['Stop Name']} to {hub_info['name']}, transfer to {'/'.join(sorted(hub_to_dest))} to {dest_data['Stop Name']}",
-                        'origin_station': orig_data['Stop Name'],
-                        'transfer_station': hub_info['name'],
-                        'dest_station': dest_data['Stop Name'],
-                        'first_leg_lines': sorted(list(orig_to_hub)),
-                        'second_leg_lines': sorted(list(hub_to_dest)),
-                        'walk_to_origin_mins': round(orig['distance_to_user'] * 12),
-                        'walk_from_dest_mins': round(dest['distance_to_user'] * 12),
-                        'total_walk_mins': round((orig['distance_to_user'] + dest['distance_to_user']) * 12)
-                    })
+    journeys = SUBWAY_ROUTER.route(
+        [(s['Complex ID'], s['distance_to_user'] * WALK_MINS_PER_KM) for s in origin_stations],
+        [(s['Complex ID'], s['distance_to_user'] * WALK_MINS_PER_KM) for s in dest_stations]
+    )
     
-    # Remove duplicates based on description
-    unique_routes = []
+    route_options = []
     seen_descriptions = set()
+    for journey in journeys:
+        option = describe_journey(journey)
+        if option['description'] not in seen_descriptions:
+            seen_descriptions.add(option['description'])
+            route_options.append(option)
     
-    for route in route_options:
-        if route['description'] not in seen_descriptions:
-            seen_descriptions.add(route['description'])
-            unique_routes.append(route)
-    
-    # Sort routes: direct first, then by total walking time
-    unique_routes.sort(key=lambda x: (
-        x['type'] != 'direct',  # Direct routes first
-        x['total_walk_mins']    # Then by walking time
-    ))
-    
-    return unique_routes[:max_options]
+    return route_options[:max_options]
+
+def describe_journey(journey):
+    "turn a router Journey into the dict returned to the agent"
+    stations = SUBWAY_ROUTER.stations
+    rides = journey.rides
+    legs = []
+    steps = []
+    transfer_walk_mins = 0
+    # a journey can end with a street walk to a nearby station, that's part of the egress
+    final_walk_mins = journey.legs[-1]['walk_mins'] if journey.legs[-1]['type'] == 'walk' else 0
+    for leg in journey.legs:
+        src, dst = stations[leg['from']].name, stations[leg['to']].name
+        if leg['type'] == 'ride':
+            lines = '/'.join(leg['lines'])
+            steps.append(f"take {lines} from {src} to {dst}" if not steps else f"transfer to {lines} to {dst}")
+            legs.append({'lines': leg['lines'], 'from': src, 'to': dst, 'ride_mins': round(leg['ride_mins'])})
+        else:
+            if leg is not journey.legs[-1]:
+                transfer_walk_mins += leg['walk_mins']
+            steps.append(f"walk to {dst}")
+            legs.append({'walk_from': src, 'walk_to': dst, 'walk_mins': round(leg['walk_mins'])})
+    description = ', '.join(steps)
+
+    return {
+        'type': 'direct' if journey.transfers == 0 else 'transfer',
+        'description': description[0].upper() + description[1:],
+        'origin_station': stations[rides[0]['from']].name,
+        'dest_station': stations[journey.legs[-1]['to']].name,
+        'transfers': journey.transfers,
+        'transfer_stations': [stations[leg['to']].name for leg in rides[:-1]],
+        'legs': legs,
+        'walk_to_origin_mins': round(journey.access_mins),
+        'walk_from_dest_mins': round(journey.egress_mins + final_walk_mins),
+        'total_walk_mins': round(journey.access_mins + journey.egress_mins + final_walk_mins + transfer_walk_mins),
+        'estimated_total_mins': round(journey.total_mins)
+    }
+
+@mcp.tool()
+async def get_subway_feed_status(): 
+    """
+    Report how fresh the cached real-time subway feeds are
+
+    Returns each feed's age in seconds, when the MTA generated it, how long ago
+    it was last requested and the last refresh error if any.
+    """
+    feed_refresher.ensure()
+    now = time.monotonic()
+    status = {}
+    for feed_key, lines in subway_lines_dict.items(): 
+        snapshot = FEEDS_CACHE.get(feed_key)
+        age = feed_age(feed_key)
+        last_requested = FEED_LAST_REQUESTED.get(feed_key)
+        status[feed_key] = {
+            'lines': lines,
+            'loaded': snapshot is not None,
+            'age_secs': None if age is None else round(age, 1),
+            'generated_at': snapshot.last_generated.strftime('%I:%M:%S %p') if snapshot is not None else None,
+            'last_requested_secs_ago': None if last_requested is None else round(now - last_requested, 1),
+            'refreshing': last_requested is not None and now - last_requested <= FEED_IDLE_TIMEOUT,
+            'error': FEED_ERRORS.get(feed_key)
+        }
+    return status
 
 if __name__ == "__main__" :
-    mcp.run(transport='stdio')
+    serve(mcp)
 
 
 # print(get_nearby_subway_options(40.7417,-73.9847))
\ No newline at end of file
@@ -0,0 +1,440 @@
+"""
+Multi-modal journey planner over subway, ferry and Citi Bike.
+
+One network holds every subway complex and ferry stop as a node. Subway lines
+come from SubwayRouter (scheduled ride minutes, frequency based waits), ferry
+lines from FerryGraph (one per stop pattern, boarding on real departures from
+the timetable), and walking transfers between nodes come from the
+precomputed footpath table (footpaths.py), or a spatial grid when it hasn't
+been built. Citi Bike is used for the first and last mile: walk to a dock
+with bikes, ride to a dock with free space near a node (or the destination),
+walk the rest. The search is the round based RAPTOR in raptor.py, shared
+with subway_router.py and ferry_router.py, over absolute times, so ferries wait for their departure. A subway without
+its stop patterns (python -m subway_patterns), or ferries whose direction
+isn't known, are left out rather than guessed at.
+
+run as its own MCP server: python planner.py
+"""
+import asyncio
+import json
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from mcp.server.fastmcp import FastMCP
+
+import citibikes
+from citibikes import BIKE_DETOUR, BIKE_DOCK_MINS, BIKE_MINS_PER_KM
+from ferry_index import FerryIndex
+from ferry_router import FerryGraph
+from ferry_timetable import format_seconds, load_or_build
+from footpaths import FOOTPATHS, node_key, transfer_lists
+from geo import WALK_MINS_PER_KM, GridIndex, haversine, haversine_many
+from raptor import relax_line, relax_stops, search, unwind
+from serving import serve
+from subway_patterns import load_patterns
+from subway_router import TRANSFER_MINS, WAIT_MINS, SubwayRouter
+from subway_router import TRANSFER_WALK_KM as SUBWAY_TRANSFER_WALK_KM
+from subway_stations import load_stations
+
+mcp = FastMCP("nyc_planner")
+NYC_TZ = ZoneInfo("America/New_York")
+
+MAX_TRANSFERS = 3
+MAX_WALK_KM = 1.0           # walking to the first / from the last stop
+TRANSFER_WALK_KM = 0.4      # walking between stops mid-journey
+DIRECT_WALK_KM = 3.0        # don't suggest walking the whole way past this
+BIKE_MAX_KM = 8.0
+BIKE_DOCK_WALK_KM = 0.5     # how far we walk to or from a dock
+BIKE_DOCKS_NEAR_ENDPOINT = 3
+# the Staten Island Ferry isn't in the NYC Ferry feed; it shuttles between these
+# two complexes (IDs from the stations CSV) every 15-30 minutes
+STATEN_ISLAND_FERRY = 'SIF'
+STATEN_ISLAND_FERRY_COMPLEXES = (501, 635)
+STATEN_ISLAND_FERRY_RIDE_MINS = 25.0
+STATEN_ISLAND_FERRY_WAIT_MINS = 10.0
+
+
+class BikeLayer:
+    """
+    Docks usable right now from one station_information + station_status snapshot,
+    and for every network node the closest dock within walking distance to pick
+    a bike up from or leave one at. With a footpath table that has the docks,
+    the per-node lookups come from it; docks newer than the table are then
+    only used at the trip endpoints.
+    """
+
+    def __init__(self, station_list, status_lookup, node_lats, node_lons, node_keys=None, footpaths=None):
+        self.names, pickup, dropoff = [], [], []
+        lats, lons, keys = [], [], []
+        for station in station_list:
+            status = status_lookup.get(station['station_id'], {})
+            position = len(self.names)
+            self.names.append(station['name'])
+            keys.append(node_key('bike', station['station_id']))
+            lats.append(station['lat'])
+            lons.append(station['lon'])
+            if status.get('num_bikes_available', 0) > 0 and status.get('is_renting', 1):
+                pickup.append(position)
+            if status.get('num_docks_available', 0) > 0 and status.get('is_returning', 1):
+                dropoff.append(position)
+        self.lats, self.lons = np.array(lats), np.array(lons)
+        self.pickup = np.array(pickup, dtype=np.int64)
+        self.dropoff = np.array(dropoff, dtype=np.int64)
+        self.pickup_grid = GridIndex(self.lats[self.pickup], self.lons[self.pickup])
+        self.dropoff_grid = GridIndex(self.lats[self.dropoff], self.lons[self.dropoff])
+
+        if footpaths is not None and 'bike' in footpaths.kinds and footpaths.covers(node_keys, BIKE_DOCK_WALK_KM):
+            self.node_pickup = self.nearest_in_table(footpaths, node_keys, keys, self.pickup)
+            self.node_dropoff = self.nearest_in_table(footpaths, node_keys, keys, self.dropoff)
+        else:
+            self.node_pickup = self.nearest_to_nodes(self.pickup_grid, self.pickup, node_lats, node_lons)
+            self.node_dropoff = self.nearest_to_nodes(self.dropoff_grid, self.dropoff, node_lats, node_lons)
+
+    def nearest_to_nodes(self, grid, docks, node_lats, node_lons):
+        "(dock, walk minutes) arrays per node, dock -1 / inf when none is close enough"
+        node_docks = np.full(len(node_lats), -1, dtype=np.int64)
+        walk_mins = np.full(len(node_lats), np.inf)
+        for node, (lat, lon) in enumerate(zip(node_lats.tolist(), node_lons.tolist())):
+            hits = grid.nearest(lat, lon, 1, max_km=BIKE_DOCK_WALK_KM)
+            if hits:
+                node_docks[node] = docks[hits[0][0]]
+                walk_mins[node] = hits[0][1] * WALK_MINS_PER_KM
+        return node_docks, walk_mins
+
+    def nearest_in_table(self, footpaths, node_keys, dock_keys, docks):
+        "same as nearest_to_nodes, reading each node's closest usable dock from the footpath table"
+        usable = {dock_keys[dock]: dock for dock in docks.tolist()}
+        node_docks = np.full(len(node_keys), -1, dtype=np.int64)
+        walk_mins = np.full(len(node_keys), np.inf)
+        for node, key in enumerate(node_keys):
+            for other, _, mins in footpaths.neighbors(key, BIKE_DOCK_WALK_KM, 'bike'):
+                if other in usable:
+                    node_docks[node], walk_mins[node] = usable[other], mins
+                    break
+        return node_docks, walk_mins
+
+    def near(self, grid, docks, lat, lon):
+        "[(dock, walk minutes)] for the closest usable docks around a point"
+        return [
+            (int(docks[i]), km * WALK_MINS_PER_KM)
+            for i, km in grid.nearest(lat, lon, BIKE_DOCKS_NEAR_ENDPOINT, max_km=BIKE_DOCK_WALK_KM)
+        ]
+
+    def ride_mins(self, dock, lats, lons):
+        "riding minutes from a dock to many points, inf past BIKE_MAX_KM"
+        km = haversine_many(self.lats[dock], self.lons[dock], lats, lons) * BIKE_DETOUR
+        return np.where(km <= BIKE_MAX_KM, BIKE_DOCK_MINS + km * BIKE_MINS_PER_KM, np.inf)
+
+
+class TransitNetwork:
+    "subway complexes followed by ferry stops as one node list, plus the lines serving them"
+
+    def __init__(self, stations, subway_patterns, ferry_index, timetable, footpaths=None):
+        subway_keys = [node_key('subway', station.complex_id) for station in stations]
+        self.subway = None
+        if subway_patterns:
+            self.subway = SubwayRouter(stations, subway_patterns, transfer_lists(footpaths, subway_keys, SUBWAY_TRANSFER_WALK_KM))
+        self.timetable = timetable
+        self.ferry = FerryGraph(ferry_index, timetable, footpaths)
+        self.footpath_table = footpaths
+        self.ferry_stop_ids = list(ferry_index.stops)
+        self.subway_count = len(stations)
+        self.node_keys = subway_keys + [node_key('ferry', stop_id) for stop_id in self.ferry_stop_ids]
+
+        ferry_stops = [ferry_index.stops[stop_id] for stop_id in self.ferry_stop_ids]
+        self.names = [station.name for station in stations] + [stop.name for stop in ferry_stops]
+        self.modes = ['subway'] * len(stations) + ['ferry'] * len(ferry_stops)
+        self.lats = np.array([station.lat for station in stations] + [stop.lat for stop in ferry_stops])
+        self.lons = np.array([station.lon for station in stations] + [stop.lon for stop in ferry_stops])
+        self.size = len(self.names)
+        self.grid = GridIndex(self.lats, self.lons)
+        self.node_of_stop = {stop_id: self.subway_count + i for i, stop_id in enumerate(self.ferry_stop_ids)}
+
+        # lines with a wait instead of a timetable: line id -> (positions, ride minute matrix, wait)
+        self.frequency_lines = {}
+        self.lines_at = [[] for _ in range(self.size)]
+        if self.subway is not None:
+            for line_id, (_, positions, ride_mins) in self.subway.lines.items():
+                self.frequency_lines[line_id] = (positions, ride_mins, WAIT_MINS)
+                for node in positions.tolist():
+                    self.lines_at[node].append(('frequency', line_id))
+
+        subway_position = {station.complex_id: i for i, station in enumerate(stations)}
+        terminals = [subway_position.get(complex_id) for complex_id in STATEN_ISLAND_FERRY_COMPLEXES]
+        if None not in terminals:
+            ride_mins = np.full((2, 2), np.inf)
+            ride_mins[0, 1] = ride_mins[1, 0] = STATEN_ISLAND_FERRY_RIDE_MINS
+            self.frequency_lines[STATEN_ISLAND_FERRY] = (np.array(terminals), ride_mins, STATEN_ISLAND_FERRY_WAIT_MINS)
+            for node in terminals:
+                self.lines_at[node].append(('frequency', STATEN_ISLAND_FERRY))
+
+        # ferry line (route_id, pattern) -> nodes it can be boarded at
+        self.ferry_reach = {}
+        for line, by_stop in self.ferry.reach.items():
+            for stop_id in by_stop:
+                node = self.node_of_stop[stop_id]
+                self.ferry_reach.setdefault(line, set()).add(node)
+                self.lines_at[node].append(('timetable', line))
+
+        walks = transfer_lists(footpaths, self.node_keys, TRANSFER_WALK_KM)
+        if walks is None:
+            walks = [
+                [(j, km, km * WALK_MINS_PER_KM) for j, km in self.grid.within(lat, lon, TRANSFER_WALK_KM) if j != i]
+                for i, (lat, lon) in enumerate(zip(self.lats.tolist(), self.lons.tolist()))
+            ]
+        self.footpaths = [[(j, mins + TRANSFER_MINS) for j, _, mins in row] for row in walks]
+
+    def service_days(self, date):
+        return self.ferry.service_days(date)
+
+    def next_ferry(self, node, line, ready, service_days):
+        "(departure minute, trip, minute offset of its service day) of the line's first boat at or after `ready`"
+        return self.ferry.next_boat(self.ferry_stop_ids[node - self.subway_count], line, ready, service_days)
+
+    def ferry_arrivals(self, node, line, departure, trip, offset):
+        "[(node, arrival minute)] downstream of a boarding on `trip`"
+        stop_id = self.ferry_stop_ids[node - self.subway_count]
+        return [
+            (self.node_of_stop[target], arrival)
+            for target, arrival in self.ferry.arrivals(stop_id, line, departure, trip, offset)
+        ]
+
+    def endpoint_times(self, lat, lon, bikes, egress):
+        """
+        Minutes between a point and every node, walking or by bike, with how each
+        was reached: node -> ('walk', None) or ('bike', (pickup dock, dropoff dock,
+        minutes walked to the pickup, minutes walked from the dropoff)).
+        """
+        mins = np.full(self.size, np.inf)
+        how = {}
+        for node, km in self.grid.within(lat, lon, MAX_WALK_KM):
+            mins[node] = km * WALK_MINS_PER_KM
+            how[node] = ('walk', None)
+
+        if bikes is not None:
+            if egress:
+                # ride from the dock next to each node to a dock near the destination
+                node_docks, node_walk = bikes.node_pickup
+                for dock, walk_mins in bikes.near(bikes.dropoff_grid, bikes.dropoff, lat, lon):
+                    ride = bikes.ride_mins(dock, bikes.lats[np.maximum(node_docks, 0)], bikes.lons[np.maximum(node_docks, 0)])
+                    total = node_walk + ride + walk_mins
+                    for node in np.flatnonzero(total < mins).tolist():
+                        mins[node] = total[node]
+                        how[node] = ('bike', (int(node_docks[node]), dock, float(node_walk[node]), walk_mins))
+            else:
+                node_docks, node_walk = bikes.node_dropoff
+                for dock, walk_mins in bikes.near(bikes.pickup_grid, bikes.pickup, lat, lon):
+                    ride = bikes.ride_mins(dock, bikes.lats[np.maximum(node_docks, 0)], bikes.lons[np.maximum(node_docks, 0)])
+                    total = walk_mins + ride + node_walk
+                    for node in np.flatnonzero(total < mins).tolist():
+                        mins[node] = total[node]
+                        how[node] = ('bike', (dock, int(node_docks[node]), walk_mins, float(node_walk[node])))
+        return mins, how
+
+    def search(self, access, depart, service_days, max_transfers):
+        "RAPTOR rounds from the access labels; returns tau per round and the parent pointers"
+
+        def scan(k, marked, previous, best, arrivals, parents):
+            transfer = TRANSFER_MINS if k > 1 else 0.0
+            for kind, line_id in {line for node in marked for line in self.lines_at[node]}:
+                if kind == 'frequency':
+                    positions, ride_mins, wait = self.frequency_lines[line_id]
+                    for target, boarded in relax_line(positions, previous[positions] + wait + transfer, ride_mins, arrivals, best):
+                        parents[target] = (boarded, ('frequency', line_id, None))
+                    continue
+                for node in self.ferry_reach[line_id]:
+                    if node not in marked:
+                        continue
+                    boat = self.next_ferry(node, line_id, previous[node] + transfer, service_days)
+                    if boat is None:
+                        continue
+                    departure, trip, offset = boat
+                    for target, arrival in relax_stops(self.ferry_arrivals(node, line_id, departure, trip, offset), arrivals, best):
+                        parents[target] = (node, ('timetable', line_id, (departure, arrival)))
+
+        return search(depart + access, max_transfers + 1, scan, self.footpaths)
+
+    def unwind(self, k, node, ride_parent, walk_parent):
+        "(node the first ride was boarded at, legs) for the label of a node in round k"
+        start, steps = unwind(k, node, ride_parent, walk_parent)
+        legs = []
+        for kind, src, dst, ride in steps:
+            if kind == 'ride':
+                mode, line_id, boat = ride
+                legs.append({'mode': mode, 'line': line_id, 'from': src, 'to': dst, 'boat': boat})
+            else:
+                legs.append({'mode': 'walk', 'from': src, 'to': dst,
+                             'mins': next(mins for j, mins in self.footpaths[src] if j == dst)})
+        return start, legs
+
+    def plan(self, origin, destination, when, bikes=None, max_transfers=MAX_TRANSFERS, max_options=3):
+        "journeys from origin to destination (lat, lon) leaving at `when`, best first"
+        depart = when.hour * 60 + when.minute + when.second / 60
+        access, access_how = self.endpoint_times(*origin, bikes, egress=False)
+        egress, egress_how = self.endpoint_times(*destination, bikes, egress=True)
+        tau, ride_parent, walk_parent = self.search(access, depart, self.service_days(when.date()), max_transfers)
+
+        options = []
+        fastest = np.inf
+        for k in range(1, max_transfers + 2):
+            totals = tau[k] + egress
+            node = int(np.argmin(totals))
+            if totals[node] < fastest - 0.5:
+                fastest = totals[node]
+                start, legs = self.unwind(k, node, ride_parent, walk_parent)
+                options.append(self.describe(legs, start, node, access_how[start], egress_how[node],
+                                             access[start], egress[node], depart, float(totals[node]), bikes))
+
+        options.extend(self.direct_options(origin, destination, depart, bikes))
+        options.sort(key=lambda option: option['total_mins'])
+        return options[:max_options]
+
+    def direct_options(self, origin, destination, depart, bikes):
+        options = []
+        km = haversine(*origin, *destination)
+        if km <= DIRECT_WALK_KM:
+            mins = km * WALK_MINS_PER_KM
+            options.append(self.summarize([{'mode': 'walk', 'from': 'origin', 'to': 'destination', 'mins': round(mins)}], depart, mins))
+        if bikes is not None:
+            pickups = bikes.near(bikes.pickup_grid, bikes.pickup, *origin)
+            dropoffs = bikes.near(bikes.dropoff_grid, bikes.dropoff, *destination)
+            rides = [
+                (walk_to + float(bikes.ride_mins(pickup, [bikes.lats[dropoff]], [bikes.lons[dropoff]])[0]) + walk_from, pickup, dropoff, walk_to, walk_from)
+                for pickup, walk_to in pickups for dropoff, walk_from in dropoffs if pickup != dropoff
+            ]
+            rides = [ride for ride in rides if np.isfinite(ride[0])]
+            if rides:
+                total, pickup, dropoff, walk_to, walk_from = min(rides)
+                legs = [
+                    {'mode': 'walk', 'from': 'origin', 'to': bikes.names[pickup], 'mins': round(walk_to)},
+                    {'mode': 'bike', 'from': bikes.names[pickup], 'to': bikes.names[dropoff], 'mins': round(total - walk_to - walk_from)},
+                    {'mode': 'walk', 'from': bikes.names[dropoff], 'to': 'destination', 'mins': round(walk_from)},
+                ]
+                options.append(self.summarize(legs, depart, total))
+        return options
+
+    def endpoint_legs(self, how, node, mins, bikes, egress):
+        "the walk or walk/bike/walk legs between a node and the origin or destination"
+        mode, docks = how
+        point = 'destination' if egress else 'origin'
+        if mode == 'walk':
+            src, dst = (self.names[node], point) if egress else (point, self.names[node])
+            return [{'mode': 'walk', 'from': src, 'to': dst, 'mins': round(mins)}]
+        pickup, dropoff, walk_to, walk_from = docks
+        start, end = (self.names[node], point) if egress else (point, self.names[node])
+        return [
+            {'mode': 'walk', 'from': start, 'to': bikes.names[pickup], 'mins': round(walk_to)},
+            {'mode': 'bike', 'from': bikes.names[pickup], 'to': bikes.names[dropoff], 'mins': round(mins - walk_to - walk_from)},
+            {'mode': 'walk', 'from': bikes.names[dropoff], 'to': end, 'mins': round(walk_from)},
+        ]
+
+    def describe(self, legs, start, end, access_how, egress_how, access_mins, egress_mins, depart, total, bikes):
+        described = self.endpoint_legs(access_how, start, access_mins, bikes, egress=False)
+        for leg in legs:
+            src, dst = self.names[leg['from']], self.names[leg['to']]
+            if leg['mode'] == 'walk':
+                described.append({'mode': 'walk', 'from': src, 'to': dst, 'mins': round(leg['mins'])})
+            elif leg['mode'] == 'frequency' and leg['line'] == STATEN_ISLAND_FERRY:
+                described.append({'mode': 'ferry', 'route_id': STATEN_ISLAND_FERRY, 'route_name': 'Staten Island',
+                                  'from': src, 'to': dst, 'departs': 'every 15-30 min',
+                                  'mins': round(STATEN_ISLAND_FERRY_RIDE_MINS)})
+            elif leg['mode'] == 'frequency':
+                described.append({'mode': 'subway', 'lines': self.subway.lines_between(leg['from'], leg['to']),
+                                  'from': src, 'to': dst,
+                                  'mins': round(self.subway.ride_minutes(leg['line'], leg['from'], leg['to']))})
+            else:
+                departure, arrival = leg['boat']
+                route_id = leg['line'][0]
+                route_name = self.timetable.route_name(self.timetable.route_positions[route_id])
+                described.append({'mode': 'ferry', 'route_id': route_id, 'route_name': route_name, 'from': src, 'to': dst,
+                                  'departs': format_seconds(int(departure * 60)), 'arrives': format_seconds(int(arrival * 60)),
+                                  'mins': round(arrival - departure)})
+        described.extend(self.endpoint_legs(egress_how, end, egress_mins, bikes, egress=True))
+        return self.summarize(described, depart, total - depart)
+
+    def summarize(self, legs, depart, total_mins):
+        rides = [leg for leg in legs if leg['mode'] in ('subway', 'ferry')]
+        steps = []
+        for leg in legs:
+            if leg['mode'] == 'subway':
+                steps.append(f"{'/'.join(leg['lines'])} train from {leg['from']} to {leg['to']}")
+            elif leg['mode'] == 'ferry':
+                when = f" ({leg['departs']})" if 'arrives' not in leg else f" at {leg['departs']}"
+                steps.append(f"{leg['route_name']} ferry{when} from {leg['from']} to {leg['to']}")
+            elif leg['mode'] == 'bike':
+                steps.append(f"Citi Bike from {leg['from']} to {leg['to']}")
+        return {
+            'summary': ', then '.join(steps) if steps else 'Walk',
+            'modes': sorted({leg['mode'] for leg in legs}),
+            'transfers': max(len(rides) - 1, 0),
+            'depart': format_seconds(int(depart * 60)),
+            'arrive': format_seconds(int((depart + total_mins) * 60)),
+            'total_mins': round(total_mins),
+            'legs': legs,
+        }
+
+
+with open('data/ferry_data.json', 'r') as f:
+    ferry_data = json.load(f)
+
+NETWORK = TransitNetwork(
+    load_stations(), load_patterns(), FerryIndex(ferry_data), load_or_build('data/ferry_timetable.bin', ferry_data), FOOTPATHS
+)
+_bike_layer = None  # (info version, status version, BikeLayer)
+
+
+async def current_bike_layer():
+    "BikeLayer for the latest Citi Bike snapshots, rebuilt only when either one changes"
+    global _bike_layer
+    stations, status = await asyncio.gather(citibikes.get_station_info(), citibikes.get_station_status())
+    if citibikes.is_error(stations) or citibikes.is_error(status):
+        return None
+    versions = (citibikes.station_info_cache.version, citibikes.station_status_cache.version)
+    if _bike_layer is None or _bike_layer[:2] != versions:
+        layer = BikeLayer(
+            stations['data']['stations'], citibikes.station_status_cache.index,
+            NETWORK.lats, NETWORK.lons, NETWORK.node_keys, NETWORK.footpath_table,
+        )
+        _bike_layer = versions + (layer,)
+    return _bike_layer[2]
+
+
+@mcp.tool()
+async def plan_trip(origin_lat: float, origin_lon: float, dest_lat: float, dest_lon: float,
+                    depart_at: str = "", use_citibike: bool = True, max_transfers: int = MAX_TRANSFERS):
+    """
+    Plan a trip across subway, NYC Ferry, Citi Bike and walking in one call
+
+    Args:
+        origin_lat: Starting latitude
+        origin_lon: Starting longitude
+        dest_lat: Destination latitude
+        dest_lon: Destination longitude
+        depart_at: departure time as HH:MM (24 hour, NYC time), default now
+        use_citibike: allow Citi Bike for the first and last mile, default True
+        max_transfers: most transfers between subway/ferry rides, default 3
+    """
+    # Convert string inputs to floats (handles quoted strings from LLMs)
+    origin = (float(str(origin_lat).strip('"')), float(str(origin_lon).strip('"')))
+    destination = (float(str(dest_lat).strip('"')), float(str(dest_lon).strip('"')))
+    max_transfers = max(0, min(int(str(max_transfers).strip('"')), MAX_TRANSFERS))
+
+    when = datetime.now(NYC_TZ)
+    if depart_at:
+        try:
+            clock = datetime.strptime(depart_at.strip(), "%H:%M")
+        except ValueError:
+            return f"Couldn't read departure time '{depart_at}'. Use HH:MM."
+        when = when.replace(hour=clock.hour, minute=clock.minute, second=0)
+
+    bikes = await current_bike_layer() if use_citibike else None
+    options = NETWORK.plan(origin, destination, when, bikes, max_transfers)
+    if not options:
+        return "No way found between these locations within walking distance of the subway or ferry."
+    return {'options': options, 'citibike_data': bikes is not None or not use_citibike,
+            'subway_data': NETWORK.subway is not None, 'ferry_data': bool(NETWORK.ferry.reach)}
+
+
+if __name__ == "__main__":
+    serve(mcp)
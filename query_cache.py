@@ -0,0 +1,86 @@
+"""
+Short lived results of the nearby-lookup tools, shared by every session in the process.
+
+Agents ask about the same spot over and over within seconds, a few meters
+apart, and retries often arrive while the first call is still running. A
+query is keyed on its point rounded to NEARBY_CACHE_DECIMALS places (4 is
+about 10 m here) and its radius rounded to 10 m, and it is answered for the
+rounded point, so every query in that cell gets the same answer.
+
+An entry is dropped once the feed snapshot it was built from is replaced,
+once it's NEARBY_CACHE_TTL_SECS old, or when it's the least recently used of
+more than NEARBY_CACHE_SIZE entries. An identical query that comes in while
+one is being computed waits on that computation instead of starting its own.
+"""
+import os
+import time
+from collections import OrderedDict
+
+from background import Inflight
+
+NEARBY_CACHE_SIZE = int(os.environ.get("NEARBY_CACHE_SIZE", 1024))
+NEARBY_CACHE_TTL = float(os.environ.get("NEARBY_CACHE_TTL_SECS", 15))
+NEARBY_CACHE_DECIMALS = int(os.environ.get("NEARBY_CACHE_DECIMALS", 4))
+
+
+def quantize(lat, lon, radius_km, decimals=NEARBY_CACHE_DECIMALS):
+    "the point and radius a query is keyed on and answered for"
+    return round(lat, decimals), round(lon, decimals), round(radius_km, 2)
+
+
+class QueryCache:
+    """
+    LRU of query results, each tagged with the snapshot version it was built from.
+    Lookups happen on the event loop, so no locking.
+    """
+
+    def __init__(self, max_entries=NEARBY_CACHE_SIZE, ttl=NEARBY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (version, expires_at, result), least recently used first
+        self._inflight = Inflight()  # keyed (key, version)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # calls that waited on someone else's computation
+
+    async def get(self, key, version, compute, keep=None):
+        """
+        The result stored for `key` if it was built from snapshot `version`,
+        otherwise the result of awaiting compute(). If `keep` is given and
+        keep(result) is false the result is returned but not stored, for
+        answers that are missing data and worth retrying.
+
+        `version` can also be a function of a result, giving the current version
+        of whatever that result was built from, for answers whose inputs are only
+        known once computed. It's called after computing to tag the new entry,
+        and on every lookup to check the stored one.
+        """
+        by_result = callable(version)
+        entry = self.entries.get(key)
+        if entry is not None:
+            current = version(entry[2]) if by_result else version
+            if entry[0] == current and time.monotonic() < entry[1]:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            del self.entries[key]
+
+        inflight_key = (key, None) if by_result else (key, version)
+        if self._inflight.running(inflight_key) is None:
+            self.misses += 1
+        else:
+            self.coalesced += 1
+        return await self._inflight.join(lambda: self._compute(key, version, compute, keep), inflight_key)
+
+    async def _compute(self, key, version, compute, keep):
+        result = await compute()
+        # a computation that started on an older snapshot doesn't replace a newer answer
+        if (keep is None or keep(result)) and key not in self.entries:
+            stored = version(result) if callable(version) else version
+            self.entries[key] = (stored, time.monotonic() + self.ttl, result)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return result
+
+    def stats(self):
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced}
@@ -0,0 +1,101 @@
+"""
+The round based RAPTOR search shared by subway_router.py, ferry_router.py and the planner.
+
+Round k holds the earliest arrival at every node using exactly k rides, then
+the walks from where those rides ended, so each round's best arrival at a
+destination is the fastest trip with k - 1 transfers. The searches only
+differ in what a ride is, so each one passes a `scan(k, marked, previous,
+best, arrivals, parents)` that rides its lines for one round: from the
+`marked` nodes (improved last round), boarding no earlier than `previous`,
+it writes every arrival that beats both `arrivals` and `best` into
+`arrivals` and (boarded node, whatever describes the ride) into `parents`.
+relax_line and relax_stops do that writing for the two kinds of line.
+"""
+import numpy as np
+
+
+def search(access, rounds, scan, footpaths):
+    """
+    Run `rounds` rounds from `access`, the arrival at every node before the
+    first ride (inf where not reached). footpaths: node -> [(node, walk minutes)].
+
+    Returns (tau, ride_parent, walk_parent): arrivals after each round's walks
+    shaped (rounds + 1, nodes), and per round {node: (boarded node, ride)} and
+    {node: node walked from}.
+    """
+    size = len(access)
+    tau = np.full((rounds + 1, size), np.inf)
+    tau[0] = access
+    best = tau[0].copy()
+    ride_parent = [dict() for _ in range(rounds + 1)]
+    walk_parent = [dict() for _ in range(rounds + 1)]
+    marked = set(np.flatnonzero(np.isfinite(best)).tolist())
+
+    for k in range(1, rounds + 1):
+        if not marked:
+            break
+        ride_tau = np.full(size, np.inf)
+        scan(k, marked, tau[k - 1], best, ride_tau, ride_parent[k])
+
+        tau[k] = ride_tau
+        for i in np.flatnonzero(np.isfinite(ride_tau)).tolist():
+            for j, walk_mins in footpaths[i]:
+                if ride_tau[i] + walk_mins < min(tau[k, j], best[j]):
+                    tau[k, j] = ride_tau[i] + walk_mins
+                    walk_parent[k][j] = i
+
+        marked = set(np.flatnonzero(tau[k] < best).tolist())
+        best = np.minimum(best, tau[k])
+    return tau, ride_parent, walk_parent
+
+
+def relax_line(positions, board, ride_mins, arrivals, best):
+    """
+    Ride a line that can be boarded anywhere along it with one NumPy min:
+    board[i] is the earliest start from positions[i] and ride_mins[i, j] the
+    minutes on to positions[j] (inf where it doesn't go). Returns
+    [(node, boarded node)] for the arrivals it improved.
+    """
+    if not np.isfinite(board).any():
+        return []
+    arrive = board[:, None] + ride_mins
+    boarded_at = arrive.argmin(axis=0)
+    arrive = arrive[boarded_at, np.arange(len(positions))]
+
+    improved = []
+    for j in np.flatnonzero(arrive < np.minimum(arrivals[positions], best[positions])).tolist():
+        target = int(positions[j])
+        arrivals[target] = arrive[j]
+        improved.append((target, int(positions[boarded_at[j]])))
+    return improved
+
+
+def relax_stops(stop_arrivals, arrivals, best):
+    "[(node, arrival)] of one boat that improved, out of [(node, arrival)] along its way"
+    improved = []
+    for target, arrival in stop_arrivals:
+        if arrival < min(arrivals[target], best[target]):
+            arrivals[target] = arrival
+            improved.append((target, arrival))
+    return improved
+
+
+def unwind(k, node, ride_parent, walk_parent):
+    """
+    (node the first ride was boarded at, legs) for the label of `node` in
+    round k, legs being ('walk', from, to, None) and ('ride', from, to, ride)
+    in travel order.
+    """
+    legs = []
+    while k > 0:
+        # a footpath only overwrites a label it beats, so its parent wins when present
+        if node in walk_parent[k]:
+            came_from = walk_parent[k][node]
+            legs.append(('walk', came_from, node, None))
+            node = came_from
+        boarded, ride = ride_parent[k][node]
+        legs.append(('ride', boarded, node, ride))
+        node = boarded
+        k -= 1
+    legs.reverse()
+    return node, legs
@@ -0,0 +1,142 @@
+"""
+How the MCP servers run: stdio, one agent per process, or a network transport
+(streamable HTTP or SSE) so one long-lived process serves many agent sessions
+off the same warm caches.
+
+    SALLY_TRANSPORT          stdio (default), streamable-http or sse
+    SALLY_HOST, SALLY_PORT   where the network transports listen, 127.0.0.1:8000
+    SALLY_MAX_CALLS          tool calls running at once over all sessions
+    SALLY_MAX_SESSION_CALLS  tool calls running at once for one session
+    SALLY_MAX_SESSION_QUEUE  calls a session can have waiting on top of those;
+                             past that its new calls fail fast instead of piling up
+    SALLY_MAX_BATCH_POINTS   most points one call to a *_many tool can ask about
+
+The first three can also be given on the command line, e.g.
+python main.py --transport streamable-http --port 8000
+"""
+import argparse
+import asyncio
+import functools
+import os
+import weakref
+
+from mcp.server.fastmcp.exceptions import ToolError
+
+TRANSPORTS = ('stdio', 'streamable-http', 'sse')
+TRANSPORT = os.environ.get("SALLY_TRANSPORT", "stdio")
+HOST = os.environ.get("SALLY_HOST", "127.0.0.1")
+PORT = int(os.environ.get("SALLY_PORT", 8000))
+MAX_CALLS = int(os.environ.get("SALLY_MAX_CALLS", 64))
+MAX_SESSION_CALLS = int(os.environ.get("SALLY_MAX_SESSION_CALLS", 4))
+MAX_SESSION_QUEUE = int(os.environ.get("SALLY_MAX_SESSION_QUEUE", 16))
+MAX_BATCH_POINTS = int(os.environ.get("SALLY_MAX_BATCH_POINTS", 50))
+
+
+class _Local:
+    "stands in for the session when a tool is called outside an MCP request"
+
+
+LOCAL = _Local()
+
+
+class SessionSlots:
+    __slots__ = ('slots', 'pending', '__weakref__')
+
+    def __init__(self, limit):
+        self.slots = asyncio.Semaphore(limit)
+        self.pending = 0  # running plus waiting
+
+
+class CallLimiter:
+    """
+    Caps on concurrent tool calls. A call first takes one of its session's
+    slots, then one of the shared ones, so a session flooding the server only
+    queues behind itself and the others keep their share.
+    """
+
+    def __init__(self, max_calls=MAX_CALLS, max_session_calls=MAX_SESSION_CALLS, max_session_queue=MAX_SESSION_QUEUE):
+        self.max_session_calls = max_session_calls
+        self.max_session_queue = max_session_queue
+        self.slots = asyncio.Semaphore(max_calls)
+        self.sessions = weakref.WeakKeyDictionary()  # session -> SessionSlots, gone with the session
+        self.running = 0
+        self.rejected = 0
+
+    async def run(self, session, call):
+        state = self.sessions.get(session)
+        if state is None:
+            state = self.sessions[session] = SessionSlots(self.max_session_calls)
+        if state.pending >= self.max_session_calls + self.max_session_queue:
+            self.rejected += 1
+            raise ToolError(
+                f"{state.pending} tool calls already in flight for this session, wait for some to finish and retry"
+            )
+        state.pending += 1
+        try:
+            async with state.slots, self.slots:
+                self.running += 1
+                try:
+                    return await call()
+                finally:
+                    self.running -= 1
+        finally:
+            state.pending -= 1
+
+
+def read_points(points, max_points=MAX_BATCH_POINTS):
+    """
+    [(lat, lon)] from the points argument of a *_many tool, [lat, lon] pairs or
+    {"lat"/"latitude", "lon"/"longitude"} objects, numbers or quoted strings
+    """
+    if len(points) > max_points:
+        raise ToolError(f"{len(points)} points asked for, at most {max_points} per call")
+    parsed = []
+    for point in points:
+        try:
+            if isinstance(point, dict):
+                lat = point.get('lat', point.get('latitude'))
+                lon = point.get('lon', point.get('longitude'))
+            else:
+                lat, lon = point
+            parsed.append((float(str(lat).strip('"')), float(str(lon).strip('"'))))
+        except (TypeError, ValueError):
+            raise ToolError(f"can't read {point!r} as a point, give [latitude, longitude]")
+    return parsed
+
+
+def current_session(server):
+    try:
+        return server._mcp_server.request_context.session
+    except LookupError:
+        return LOCAL
+
+
+def limited(server, limiter, fn, is_async):
+    "`fn` as a coroutine function that runs under the limiter, sync tools in a worker thread"
+    @functools.wraps(fn)
+    async def call_tool(**kwargs):
+        call = (lambda: fn(**kwargs)) if is_async else (lambda: asyncio.to_thread(fn, **kwargs))
+        return await limiter.run(current_session(server), call)
+    return call_tool
+
+
+def limit_tools(server, limiter):
+    "route every tool registered on a FastMCP server through the limiter"
+    for tool in server._tool_manager.list_tools():
+        tool.fn = limited(server, limiter, tool.fn, tool.is_async)
+        tool.is_async = True
+    return limiter
+
+
+def serve(server, argv=None):
+    "run a FastMCP server with the transport from the command line or SALLY_TRANSPORT"
+    parser = argparse.ArgumentParser(description=f"run the {server.name} MCP server")
+    parser.add_argument('--transport', choices=TRANSPORTS, default=TRANSPORT)
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args(argv)
+
+    server.settings.host = args.host
+    server.settings.port = args.port
+    limit_tools(server, CallLimiter())
+    server.run(transport=args.transport)
@@ -0,0 +1,76 @@
+"""
+Expected Citi Bike availability a few minutes ahead, per station.
+
+Each station's net flow of bikes and of docks, per minute, is an exponentially
+weighted moving average of its changes between StatusHistory slots, with a
+half-life of CITIBIKE_FORECAST_HALF_LIFE_MINS. Every station is updated at
+once with numpy each time the poller in citibikes.py records a new slot, so
+keeping it current costs a few array operations per poll.
+
+The forecast is the current count plus flow x minutes ahead, kept between
+zero and what the dock holds. Flows start at zero, so a station with little
+history is forecast at its current count.
+"""
+import os
+
+import numpy as np
+
+from station_history import FIELDS, MISSING
+
+FORECAST_HALF_LIFE = float(os.environ.get("CITIBIKE_FORECAST_HALF_LIFE_MINS", 15))
+FORECAST_MAX_MINS = 60  # past this the flow says little, don't extrapolate further
+
+# rows of StatusHistory.counts that are forecast
+BIKES, DOCKS = FIELDS.index('num_bikes_available'), FIELDS.index('num_docks_available')
+
+
+class AvailabilityForecast:
+    "per-station bike and dock flows, fed from a StatusHistory"
+
+    def __init__(self, history, half_life=FORECAST_HALF_LIFE):
+        self.history = history
+        self.half_life = half_life
+        self.slot = None  # history slot the flows are up to date with
+        self.counts = np.zeros((2, 0), dtype=np.int16)  # bikes and docks in that slot
+        self.flow = np.zeros((2, 0))  # bikes and docks gained per minute
+
+    def update(self):
+        "fold the newest history slot into the flows, a no-op until the history moves on a slot"
+        history = self.history
+        if history.latest is None or history.latest == self.slot:
+            return
+        latest = history.counts[[BIKES, DOCKS], history.latest % history.slots]
+        added = latest.shape[1] - self.flow.shape[1]
+        if added:
+            # stations that appeared since the last update, no flow known yet
+            self.flow = np.concatenate([self.flow, np.zeros((2, added))], axis=1)
+            self.counts = np.concatenate([self.counts, np.full((2, added), MISSING, dtype=np.int16)], axis=1)
+
+        if self.slot is not None:
+            minutes = (history.latest - self.slot) * history.resolution / 60
+            seen = (latest[0] != MISSING) & (self.counts[0] != MISSING)
+            observed = (latest[:, seen] - self.counts[:, seen]) / minutes
+            # weight for the time that passed, so a gap counts as several steps
+            alpha = 1 - 0.5 ** (minutes / self.half_life)
+            self.flow[:, seen] += alpha * (observed - self.flow[:, seen])
+        self.counts = latest.copy()
+        self.slot = history.latest
+
+    def predict(self, station_ids, bikes, docks, minutes):
+        """
+        Expected (bikes, docks) at each station `minutes` from now, as float
+        arrays, from its current counts. `bikes`, `docks` and `minutes` are one
+        value per station (or one `minutes` for all). Stations the history
+        doesn't know keep their current counts.
+        """
+        columns = np.array([self.history.columns.get(station_id, -1) for station_id in station_ids], dtype=np.int64)
+        known = (columns >= 0) & (columns < self.flow.shape[1])
+        flow = np.zeros((2, len(columns)))
+        flow[:, known] = self.flow[:, columns[known]]
+
+        bikes = np.asarray(bikes, dtype=np.float64)
+        docks = np.asarray(docks, dtype=np.float64)
+        minutes = np.minimum(np.asarray(minutes, dtype=np.float64), FORECAST_MAX_MINS)
+        capacity = bikes + docks
+        return (np.clip(bikes + flow[0] * minutes, 0, capacity),
+                np.clip(docks + flow[1] * minutes, 0, capacity))
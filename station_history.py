@@ -0,0 +1,109 @@
+"""
+Recent Citi Bike availability per station, held in memory.
+
+citibikes.py polls station_status and records every snapshot here, so trend
+questions ("is this dock emptying out?") are answered without going back to
+GBFS. Bikes, e-bikes and docks are kept in int16 arrays shaped
+(slot, station): one slot per CITIBIKE_HISTORY_RESOLUTION_SECS (a minute by
+default) for the last CITIBIKE_HISTORY_MINUTES (6 hours), used as a ring, so
+the memory stays fixed at a few MB for the whole system.
+
+Each new slot starts as a copy of the one before, and only the stations whose
+`last_reported` moved since are written over it.
+"""
+import os
+
+import numpy as np
+
+HISTORY_MINUTES = int(os.environ.get("CITIBIKE_HISTORY_MINUTES", 6 * 60))
+HISTORY_RESOLUTION = int(os.environ.get("CITIBIKE_HISTORY_RESOLUTION_SECS", 60))
+
+FIELDS = ('num_bikes_available', 'num_ebikes_available', 'num_docks_available')
+MISSING = -1  # no reading for that station in that slot
+
+
+class StatusHistory:
+    "ring buffer of per-station counts, one row per time slot"
+
+    def __init__(self, minutes=HISTORY_MINUTES, resolution=HISTORY_RESOLUTION):
+        self.resolution = resolution
+        self.slots = max(minutes * 60 // resolution, 1)
+        self.columns = {}  # station_id -> column
+        self.station_ids = []
+        self.counts = np.full((len(FIELDS), self.slots, 0), MISSING, dtype=np.int16)
+        self.last_reported = np.zeros(0, dtype=np.int64)
+        self.slot_of_row = np.full(self.slots, -1, dtype=np.int64)  # time slot each row holds, -1 if none
+        self.latest = None  # newest time slot recorded
+        self.writes = 0  # station readings written, all polls together
+
+    def _add_columns(self, station_ids):
+        for station_id in station_ids:
+            self.columns[station_id] = len(self.station_ids)
+            self.station_ids.append(station_id)
+        grown = np.full((len(FIELDS), self.slots, len(self.station_ids)), MISSING, dtype=np.int16)
+        grown[:, :, :self.counts.shape[2]] = self.counts
+        self.counts = grown
+        self.last_reported = np.concatenate([self.last_reported, np.zeros(len(station_ids), dtype=np.int64)])
+
+    def _advance(self, slot):
+        "make `slot` the newest row, carrying the previous readings forward as its base"
+        row = slot % self.slots
+        if self.latest is not None and slot > self.latest:
+            # a gap (the poller was held up) is left as missing rather than invented
+            for skipped in range(max(self.latest + 1, slot - self.slots + 1), slot):
+                self.counts[:, skipped % self.slots] = MISSING
+                self.slot_of_row[skipped % self.slots] = -1
+            self.counts[:, row] = self.counts[:, self.latest % self.slots]
+        self.slot_of_row[row] = slot
+        self.latest = slot
+        return row
+
+    def record(self, stations, now):
+        """
+        Store one station_status snapshot (its data.stations list) taken at unix
+        time `now`. Returns how many stations changed.
+        """
+        slot = int(now // self.resolution)
+        if self.latest is not None and slot < self.latest:
+            return 0
+        new_ids = [s['station_id'] for s in stations if s['station_id'] not in self.columns]
+        if new_ids:
+            self._add_columns(new_ids)
+        row = self._advance(slot)
+
+        changed, values = [], []
+        for station in stations:
+            column = self.columns[station['station_id']]
+            reported = station.get('last_reported') or 0
+            if reported and reported == self.last_reported[column] and self.counts[0, row, column] != MISSING:
+                continue
+            self.last_reported[column] = reported
+            changed.append(column)
+            values.append([station.get(field, 0) for field in FIELDS])
+        if changed:
+            self.counts[:, row, changed] = np.array(values, dtype=np.int16).T
+            self.writes += len(changed)
+        return len(changed)
+
+    def window(self, minutes):
+        "time slots of the last `minutes` that hold readings and their ring rows, oldest first"
+        if self.latest is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        count = min(max(minutes * 60 // self.resolution, 1), self.slots)
+        slots = np.arange(self.latest - count + 1, self.latest + 1)
+        rows = slots % self.slots
+        held = self.slot_of_row[rows] == slots
+        return slots[held], rows[held]
+
+    def series(self, station_id, minutes):
+        """
+        (unix times, counts) for one station over the last `minutes`, oldest
+        first, counts shaped (len(FIELDS), readings). None for an unknown station.
+        """
+        column = self.columns.get(station_id)
+        if column is None:
+            return None
+        slots, rows = self.window(minutes)
+        counts = self.counts[:, rows, column]
+        seen = counts[0] != MISSING
+        return slots[seen] * self.resolution, counts[:, seen]
@@ -0,0 +1,173 @@
+"""
+Ordered stop patterns of the subway lines, from the MTA static GTFS, for subway_router.py.
+
+A pattern is one route running one way through one sequence of station
+complexes, with the scheduled minutes from its first stop to each stop (the
+median over its daytime trips). Branches and directions are separate
+patterns: the A to Lefferts Blvd and the A to Far Rockaway share the trunk
+but not the ends, and the M leaves Middle Village the opposite way from
+Forest Hills.
+
+The servers load data/subway_patterns.bin, a binary_tables.py section file
+with magic "SSP1". String p is the route of pattern p and
+`pattern_offsets[p]:pattern_offsets[p+1]` are its complexes and minutes.
+Only the offline build downloads the feed and imports pandas:
+
+python -m subway_patterns [gtfs_subway.zip] rebuilds data/subway_patterns.bin.
+"""
+import array
+import asyncio
+import sys
+
+from binary_tables import load_sections, pack_strings, save_sections, unpack_string
+
+GTFS_URL = "https://rrgtfsfeeds.s3.amazonaws.com/gtfs_subway.zip"
+PATTERNS_PATH = "data/subway_patterns.bin"
+MAGIC = b"SSP1"
+SECTIONS = {
+    'strings': 'B', 'string_offsets': 'I',
+    'pattern_trips': 'I', 'pattern_offsets': 'I',
+    'stop_complexes': 'I', 'stop_mins': 'f',
+}
+
+# trips starting in this window (seconds after midnight) make the patterns,
+# so late night local runs don't show up as lines during the day
+DAYTIME = (6 * 3600, 21 * 3600)
+# fewer daytime trips than this is a one-off (a put-in, a reroute), not a line
+PATTERN_MIN_TRIPS = 5
+# GTFS route IDs named the way the stations CSV lists them under "Daytime Routes"
+ROUTE_LABELS = {'GS': 'S', 'FS': 'S', 'H': 'S', 'SI': 'SIR', '5X': '5', '6X': '6', '7X': '7', 'FX': 'F'}
+
+
+class Pattern:
+    "one stop pattern: the route label riders see, the complexes in order and scheduled minutes from the first"
+    __slots__ = ('route', 'complex_ids', 'mins', 'trips')
+
+    def __init__(self, route, complex_ids, mins, trips):
+        self.route = route
+        self.complex_ids = tuple(complex_ids)
+        self.mins = tuple(mins)
+        self.trips = trips
+
+
+def build_patterns(gtfs_data, stations):
+    """
+    Patterns from the GTFS tables (see download_ferry_data.read_gtfs_tables)
+    over the station complexes, by route and busiest first.
+    """
+    import numpy as np
+
+    from ferry_timetable import parse_gtfs_time
+
+    complex_of_stop = {stop_id: station.complex_id for station in stations for stop_id in station.stop_ids}
+    stops_df = gtfs_data['stops']
+    parents = {}
+    if 'parent_station' in stops_df:
+        parents = {
+            str(stop_id): str(parent)
+            for stop_id, parent in zip(stops_df['stop_id'], stops_df['parent_station']) if isinstance(parent, str)
+        }
+
+    stop_times = gtfs_data['stop_times'].merge(gtfs_data['trips'][['trip_id', 'route_id']], on='trip_id', how='inner')
+    stop_ids = stop_times['stop_id'].astype(str)
+    # platforms are the parent stop plus N or S, the stations CSV lists the parents
+    stop_times['complex_id'] = stop_ids.map(parents).fillna(stop_ids.str.rstrip('NS')).map(complex_of_stop)
+    stop_times = stop_times[stop_times['complex_id'].notna()]
+    times = stop_times['departure_time'].fillna(stop_times['arrival_time'])
+    stop_times = stop_times.assign(seconds=times.map(parse_gtfs_time), complex_id=stop_times['complex_id'].astype(int))
+    stop_times = stop_times.sort_values(['trip_id', 'stop_sequence'], kind='stable')
+    trips = stop_times.groupby('trip_id', sort=False).agg(
+        route_id=('route_id', 'first'), complexes=('complex_id', tuple), seconds=('seconds', tuple)
+    )
+
+    runs = {}  # (route, complexes) -> [seconds from the first stop, per trip]
+    for route_id, complexes, seconds in zip(trips['route_id'], trips['complexes'], trips['seconds']):
+        if not DAYTIME[0] <= seconds[0] < DAYTIME[1]:
+            continue
+        sequence, offsets = [], []
+        for complex_id, at in zip(complexes, seconds):
+            if sequence and complex_id == sequence[-1]:
+                continue  # two platforms of one complex in a row
+            if complex_id in sequence:
+                break  # a loop back through a complex, keep the run up to it
+            sequence.append(complex_id)
+            offsets.append(at - seconds[0])
+        if len(sequence) > 1:
+            route = ROUTE_LABELS.get(str(route_id), str(route_id))
+            runs.setdefault((route, tuple(sequence)), []).append(offsets)
+
+    patterns = [
+        Pattern(route, complexes, (np.median(np.array(offsets), axis=0) / 60).tolist(), len(offsets))
+        for (route, complexes), offsets in runs.items() if len(offsets) >= PATTERN_MIN_TRIPS
+    ]
+    patterns.sort(key=lambda pattern: (pattern.route, -pattern.trips, pattern.complex_ids))
+
+    # a short turn is a stretch of a longer pattern of the same route, it adds no line
+    return [
+        pattern for pattern in patterns
+        if not any(
+            other.route == pattern.route and len(other.complex_ids) > len(pattern.complex_ids)
+            and contains(other.complex_ids, pattern.complex_ids)
+            for other in patterns
+        )
+    ]
+
+
+def contains(sequence, part):
+    "whether `part` appears in `sequence` as one contiguous run"
+    n = len(part)
+    return any(sequence[i:i + n] == part for i in range(len(sequence) - n + 1))
+
+
+def save_patterns(path, patterns):
+    arrays = {name: array.array(typecode) for name, typecode in SECTIONS.items()}
+    arrays['strings'], arrays['string_offsets'] = pack_strings(pattern.route for pattern in patterns)
+    arrays['pattern_offsets'].append(0)
+    for pattern in patterns:
+        arrays['pattern_trips'].append(pattern.trips)
+        arrays['stop_complexes'].extend(pattern.complex_ids)
+        arrays['stop_mins'].extend(pattern.mins)
+        arrays['pattern_offsets'].append(len(arrays['stop_complexes']))
+    save_sections(path, MAGIC, [(name, arrays[name]) for name in SECTIONS])
+
+
+def load_patterns(path=PATTERNS_PATH):
+    "Patterns from the prebuilt file, or None if it hasn't been built"
+    try:
+        sections, _ = load_sections(path, MAGIC)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    offsets = sections['pattern_offsets']
+    return [
+        Pattern(
+            unpack_string(sections['strings'], sections['string_offsets'], p),
+            sections['stop_complexes'][offsets[p]:offsets[p + 1]].tolist(),
+            sections['stop_mins'][offsets[p]:offsets[p + 1]].tolist(),
+            sections['pattern_trips'][p],
+        )
+        for p in range(len(offsets) - 1)
+    ]
+
+
+async def download_gtfs():
+    import http_client
+    try:
+        return await http_client.get_bytes(GTFS_URL, timeout=60.0, conditional=False)
+    finally:
+        await http_client.aclose()
+
+
+if __name__ == "__main__":
+    from download_ferry_data import read_gtfs_tables
+    from subway_stations import load_stations
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'rb') as f:
+            content = f.read()
+    else:
+        print(f"Downloading {GTFS_URL}...")
+        content = asyncio.run(download_gtfs())
+    patterns = build_patterns(read_gtfs_tables(content), load_stations())
+    save_patterns(PATTERNS_PATH, patterns)
+    print(f"{len(patterns)} patterns over {len({pattern.route for pattern in patterns})} routes saved to {PATTERNS_PATH}")
@@ -0,0 +1,152 @@
+import numpy as np
+from geo import WALK_MINS_PER_KM, GridIndex
+from raptor import relax_line, search, unwind
+
+# ride minutes are scheduled ones from the stop patterns (subway_patterns.py),
+# waits and transfers are still estimates
+WAIT_MINS = 3.0                # half of a typical daytime headway
+TRANSFER_MINS = 2.0            # walking between platforms inside a complex
+TRANSFER_WALK_KM = 0.35        # street transfers between separate complexes
+MAX_TRANSFERS = 2
+
+
+class Journey:
+    "one itinerary found by the router, legs are ride or walk dicts keyed by station position"
+    __slots__ = ('legs', 'access_mins', 'egress_mins', 'total_mins')
+
+    def __init__(self, legs, access_mins, egress_mins, total_mins):
+        self.legs = legs
+        self.access_mins = access_mins
+        self.egress_mins = egress_mins
+        self.total_mins = total_mins
+
+    @property
+    def rides(self):
+        return [leg for leg in self.legs if leg['type'] == 'ride']
+
+    @property
+    def transfers(self):
+        return len(self.rides) - 1
+
+
+class SubwayRouter:
+    """
+    Line/station graph over the station complexes with a RAPTOR-style search.
+
+    Every stop pattern (subway_patterns.py) becomes a line: one route running
+    one way down one branch, with the scheduled minutes between its stops.
+    Round k of the search (raptor.py) finds the fastest arrival at every
+    station using exactly k rides, so the result is a Pareto set over
+    (transfers, time). Each line keeps a dense matrix of ride minutes between
+    its stations, inf against the direction of travel, which lets a round
+    relax a whole line with one NumPy min.
+    """
+
+    def __init__(self, stations, patterns, walks=None):
+        self.stations = stations
+        self.position = {station.complex_id: i for i, station in enumerate(stations)}
+        lats = np.array([station.lat for station in stations])
+        lons = np.array([station.lon for station in stations])
+
+        # line id -> (label shown to riders, station positions in stop order, ride minute matrix)
+        self.lines = {}
+        self.stop_index = {}  # line id -> {station position: index along the line}
+        counts = {}
+        for pattern in patterns:
+            stops = [(self.position[complex_id], mins) for complex_id, mins in zip(pattern.complex_ids, pattern.mins)
+                     if complex_id in self.position]
+            if len(stops) < 2:
+                continue
+            n = counts[pattern.route] = counts.get(pattern.route, -1) + 1
+            line_id = pattern.route if n == 0 else f"{pattern.route}#{n}"
+            positions = np.array([i for i, _ in stops])
+            mins = np.array([mins for _, mins in stops])
+            ride_mins = mins[None, :] - mins[:, None]
+            ride_mins[np.tril_indices(len(stops))] = np.inf
+            self.lines[line_id] = (pattern.route, positions, ride_mins)
+            self.stop_index[line_id] = {i: index for index, i in enumerate(positions.tolist())}
+
+        self.lines_at = [[] for _ in stations]
+        for line_id, (_, positions, _) in self.lines.items():
+            for i in positions.tolist():
+                self.lines_at[i].append(line_id)
+
+        self.footpaths = self.build_footpaths(lats, lons, walks)
+
+    def build_footpaths(self, lats, lons, walks=None):
+        """
+        walking transfers between separate complexes: position -> [(position, minutes)].
+        `walks` are the precomputed [(position, km, walk minutes)] per station from
+        the footpath table (see footpaths.transfer_lists), measured here without it.
+        """
+        if walks is None:
+            grid = GridIndex(lats, lons)
+            walks = [
+                [(j, km, km * WALK_MINS_PER_KM) for j, km in grid.within(lats[i], lons[i], TRANSFER_WALK_KM) if j != i]
+                for i in range(len(self.stations))
+            ]
+        return [[(j, mins + TRANSFER_MINS) for j, _, mins in row] for row in walks]
+
+    def route(self, origins, destinations, max_transfers=MAX_TRANSFERS):
+        """
+        Search from origin stations to destination stations.
+
+        origins / destinations are [(complex_id, walk_mins)] for the access and
+        egress walks. Returns Journeys that are not dominated on (transfers,
+        total minutes) for each destination station, fastest first.
+        """
+        rounds = max_transfers + 1
+        access = {}
+        for complex_id, walk_mins in origins:
+            i = self.position[complex_id]
+            access[i] = min(walk_mins, access.get(i, np.inf))
+        start = np.full(len(self.stations), np.inf)
+        start[list(access)] = list(access.values())
+
+        def scan(k, marked, previous, best, arrivals, parents):
+            penalty = WAIT_MINS + (TRANSFER_MINS if k > 1 else 0.0)
+            for line_id in {line_id for i in marked for line_id in self.lines_at[i]}:
+                _, positions, ride_mins = self.lines[line_id]
+                for target, boarded in relax_line(positions, previous[positions] + penalty, ride_mins, arrivals, best):
+                    parents[target] = (boarded, line_id)
+
+        tau, ride_parent, walk_parent = search(start, rounds, scan, self.footpaths)
+
+        journeys = []
+        for complex_id, egress_mins in destinations:
+            d = self.position[complex_id]
+            fastest = np.inf
+            for k in range(1, rounds + 1):
+                total = tau[k, d] + egress_mins
+                if total < fastest - 1e-9:
+                    fastest = total
+                    origin, legs = self.unwind(k, d, ride_parent, walk_parent)
+                    journeys.append(Journey(legs, access[origin], egress_mins, float(total)))
+
+        journeys.sort(key=lambda journey: (journey.total_mins, journey.transfers))
+        return journeys
+
+    def unwind(self, k, position, ride_parent, walk_parent):
+        "(origin station, legs) for a label in round k, legs as ride or walk dicts"
+        origin, steps = unwind(k, position, ride_parent, walk_parent)
+        legs = []
+        for kind, src, dst, line_id in steps:
+            if kind == 'ride':
+                legs.append({'type': 'ride', 'line': line_id, 'from': src, 'to': dst,
+                             'ride_mins': self.ride_minutes(line_id, src, dst), 'lines': self.lines_between(src, dst)})
+            else:
+                legs.append({'type': 'walk', 'from': src, 'to': dst,
+                             'walk_mins': float(next(mins for j, mins in self.footpaths[src] if j == dst))})
+        return origin, legs
+
+    def ride_minutes(self, line_id, src, dst):
+        "scheduled minutes riding `line_id` from station position src to dst"
+        index = self.stop_index[line_id]
+        return float(self.lines[line_id][2][index[src], index[dst]])
+
+    def lines_between(self, src, dst):
+        "routes of every line that runs from station position src on to dst, any of them works just as well"
+        return sorted({
+            self.lines[line_id][0] for line_id in self.lines_at[src]
+            if self.stop_index[line_id][src] < self.stop_index[line_id].get(dst, -1)
+        })
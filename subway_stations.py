@@ -0,0 +1,104 @@
+"""
+Subway station complexes from the MTA stations CSV, shared by mta.py and the planner.
+Kept apart from mta.py so loading stations doesn't pull in the realtime feed libraries.
+
+The servers load data/stations.bin, the CSV already parsed into a
+binary_tables.py section file, so startup doesn't import pandas. Only the
+offline build reads the CSV:
+
+python -m subway_stations rebuilds data/stations.bin from the CSV.
+"""
+import array
+
+from binary_tables import load_sections, pack_strings, save_sections, unpack_string
+
+data_path = "data/MTA_Subway_Stations_and_Complexes_20250916.csv"
+STATIONS_PATH = "data/stations.bin"
+MAGIC = b"SST1"
+# per station, in this order in the string table
+STRING_FIELDS = ('name', 'borough', 'stop_ids', 'routes')
+SECTIONS = {'complex_ids': 'I', 'lats': 'd', 'lons': 'd', 'strings': 'B', 'string_offsets': 'I'}
+
+subway_lines_dict = { 
+    "A": ["A","C", "E"],
+    "G": ["G"],
+    "J": ["J","Z"], 
+    "N": ["N", 'Q', 'R', 'W'], 
+    "1": ['1','2','3','4','5','6','7','S'],
+    "L": ['L'],
+    "B": ['B','D','F','M'],
+    "SIR" :['SIR']
+}
+# line -> the feed key that carries it
+LINE_TO_FEED = {line: feed_key for feed_key, lines in subway_lines_dict.items() for line in lines}
+
+class Station: 
+    """
+    One station complex from the stations CSV with everything the hot paths need
+    already parsed: stop IDs with direction suffixes, the set of routes and the
+    feeds those routes come from.
+    """
+    __slots__ = ('complex_id', 'name', 'borough', 'lat', 'lon', 'stop_ids',
+                 'directional_stop_ids', 'routes', 'feed_keys')
+
+    def __init__(self, complex_id, name, borough, lat, lon, stop_ids, routes): 
+        self.complex_id = complex_id
+        self.name = name
+        self.borough = borough
+        self.lat = lat
+        self.lon = lon
+        self.stop_ids = tuple(stop_ids)
+        #trains api accepts stopID+N for northbound or S for southbound 
+        self.directional_stop_ids = tuple(f"{stop_id}{d}" for stop_id in self.stop_ids for d in ("N", "S"))
+        self.routes = frozenset(routes)
+        self.feed_keys = tuple(sorted({LINE_TO_FEED[line] for line in self.routes if line in LINE_TO_FEED}))
+
+def read_stations_csv(path=data_path): 
+    "read the stations CSV into Station objects, in file order"
+    import pandas as pd
+    stations_df = pd.read_csv(path)
+    return [
+        Station(
+            complex_id=int(row['Complex ID']),
+            name=row['Stop Name'],
+            borough=row['Borough'],
+            lat=float(row['Latitude']),
+            lon=float(row['Longitude']),
+            stop_ids=row['GTFS Stop IDs'].split('; '),
+            routes=row['Daytime Routes'].split(' ')
+        )
+        for row in stations_df.to_dict('records')
+    ]
+
+def save_stations(path, stations): 
+    arrays = {name: array.array(typecode) for name, typecode in SECTIONS.items()}
+    arrays['complex_ids'].extend(station.complex_id for station in stations)
+    arrays['lats'].extend(station.lat for station in stations)
+    arrays['lons'].extend(station.lon for station in stations)
+    arrays['strings'], arrays['string_offsets'] = pack_strings(
+        value
+        for station in stations
+        for value in (station.name, station.borough, ";".join(station.stop_ids), " ".join(sorted(station.routes)))
+    )
+    save_sections(path, MAGIC, [(name, arrays[name]) for name in SECTIONS])
+
+def load_stations(path=STATIONS_PATH): 
+    "Station objects in CSV order, from the prebuilt file, or from the CSV if it hasn't been built"
+    try: 
+        sections, _ = load_sections(path, MAGIC)
+    except (FileNotFoundError, ValueError): 
+        return read_stations_csv()
+
+    strings, offsets = sections['strings'], sections['string_offsets']
+    stations = []
+    for i, (complex_id, lat, lon) in enumerate(zip(sections['complex_ids'], sections['lats'], sections['lons'])): 
+        name, borough, stop_ids, routes = (
+            unpack_string(strings, offsets, i * len(STRING_FIELDS) + field) for field in range(len(STRING_FIELDS))
+        )
+        stations.append(Station(complex_id, name, borough, lat, lon, stop_ids.split(';'), routes.split(' ')))
+    return stations
+
+if __name__ == "__main__": 
+    stations = read_stations_csv()
+    save_stations(STATIONS_PATH, stations)
+    print(f"{len(stations)} stations saved to {STATIONS_PATH}")